@@ -432,16 +432,21 @@ const AttendanceKiosk: FC = () => {
         }
       }
     } catch (err: any) {
+      // 422: the matcher rejected the scan itself (too dark, smudged, ...) before searching
+      const qualityRejected = err.response?.status === 422;
       setIdentificationStatus('error');
       setRecentScans(prev => [{
-        name: 'Error',
+        name: qualityRejected ? 'Poor scan' : 'Error',
         time: dayjs().format('hh:mm:ss A'),
         status: 'error'
       }, ...prev.slice(0, 9)]);
       
       console.error('Identification error: ', err);
       
-      if (err.response?.status === 404) {
+      if (qualityRejected) {
+        console.warn('Fingerprint rejected by quality check:', err.response.data?.reason, err.response.data?.quality);
+        toast.error(err.response.data?.message ?? 'Poor fingerprint scan. Please scan again.');
+      } else if (err.response?.status === 404) {
         toast.error('No students enrolled with fingerprints.');
       } else if (err.response?.status === 400) {
         toast.error('Invalid fingerprint data. Please try again.');
@@ -205,6 +205,20 @@ const FingerprintEnrollment: FC = () => {
 
     setIsEnrolling(true);
 
+    // Reject poor captures before they enter the gallery
+    try {
+      const form = new FormData();
+      form.append('fingerprint', fingerprintImage);
+      const { data } = await axios.post(`${constants.matchBaseUrl}/quality/fingerprint`, form);
+      if (!data.quality.acceptable) {
+        toast.error(data.quality.message);
+        setIsEnrolling(false);
+        return;
+      }
+    } catch (qualityError) {
+      console.warn('Failed to check fingerprint quality:', qualityError);
+    }
+
     try {
       // Add the new fingerprint
       await addFingerprintMutation.mutateAsync({
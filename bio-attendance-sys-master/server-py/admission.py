@@ -0,0 +1,198 @@
+"""
+Admission control for identification requests.
+
+A fixed number of identifications run at once; the rest wait in a bounded
+queue ordered by priority class and arrival. A request is shed instead of
+queued when the queue is full (unless it outranks the lowest-priority waiter,
+which is evicted in its place) and when its deadline passes while waiting.
+Shedding early keeps latency bounded under a burst, so kiosks get a fast 503
+with Retry-After instead of timing out and retrying into a growing backlog.
+
+The controller is usable from threads (`admit`) and from asyncio (`admit_async`).
+"""
+import asyncio
+import math
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+PRIORITY_STAFF = 0
+PRIORITY_STUDENT = 1
+
+PRIORITY_NAMES = {
+    PRIORITY_STAFF: 'staff',
+    PRIORITY_STUDENT: 'student'
+}
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is shed instead of admitted"""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Ticket:
+    __slots__ = ('priority', 'seq', 'deadline', 'granted', 'shed_reason', 'notify')
+
+    def __init__(self, priority, seq, deadline, notify):
+        self.priority = priority
+        self.seq = seq
+        self.deadline = deadline
+        self.granted = False
+        self.shed_reason = None
+        self.notify = notify
+
+
+class AdmissionController:
+    """Bounded, prioritized admission queue in front of the identification functions"""
+
+    def __init__(self, max_active, max_queue):
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._waiting = []
+        self._active = 0
+        self._seq = 0
+        # Exponentially weighted average service time, used for Retry-After
+        self._service_time = 1.0
+        self._counters = {
+            'admitted': 0,
+            'shed_queue_full': 0,
+            'shed_deadline': 0,
+            'shed_evicted': 0,
+            'cancelled': 0
+        }
+
+    def _retry_after(self):
+        backlog = len(self._waiting) + 1
+        return max(1, math.ceil(self._service_time * backlog / self.max_active))
+
+    def _enqueue(self, priority, deadline, notify):
+        with self._lock:
+            self._seq += 1
+            ticket = _Ticket(priority, self._seq, deadline, notify)
+
+            if self._active < self.max_active and not self._waiting:
+                ticket.granted = True
+                self._active += 1
+                self._counters['admitted'] += 1
+                return ticket
+
+            if len(self._waiting) >= self.max_queue:
+                lowest = max(self._waiting, key=lambda t: (t.priority, t.seq)) if self._waiting else None
+                if lowest is None or lowest.priority <= priority:
+                    self._counters['shed_queue_full'] += 1
+                    raise AdmissionRejected('queue_full', self._retry_after())
+
+                # Make room for a higher-priority request by shedding the lowest waiter
+                self._waiting.remove(lowest)
+                lowest.shed_reason = 'evicted'
+                self._counters['shed_evicted'] += 1
+                lowest.notify()
+
+            self._waiting.append(ticket)
+            return ticket
+
+    def _cancel(self, ticket, reason='deadline_exceeded'):
+        """Withdraw a waiting ticket; returns False if it was granted in the meantime"""
+        with self._lock:
+            if ticket.granted:
+                return False
+            if ticket in self._waiting:
+                self._waiting.remove(ticket)
+            if ticket.shed_reason is None:
+                ticket.shed_reason = reason
+                self._counters['shed_deadline' if reason == 'deadline_exceeded' else reason] += 1
+            return True
+
+    def _release(self, started=None):
+        """Free a slot and grant it to the next waiter; `started` is None if no work ran in it"""
+        with self._lock:
+            self._active -= 1
+            if started is not None:
+                self._service_time = 0.8 * self._service_time + 0.2 * (time.monotonic() - started)
+
+            now = time.monotonic()
+            while self._active < self.max_active and self._waiting:
+                ticket = min(self._waiting, key=lambda t: (t.priority, t.seq))
+                self._waiting.remove(ticket)
+                if ticket.deadline <= now:
+                    ticket.shed_reason = 'deadline_exceeded'
+                    self._counters['shed_deadline'] += 1
+                    ticket.notify()
+                    continue
+                ticket.granted = True
+                self._active += 1
+                self._counters['admitted'] += 1
+                ticket.notify()
+
+    def _rejection(self, ticket):
+        with self._lock:
+            return AdmissionRejected(ticket.shed_reason, self._retry_after())
+
+    @contextmanager
+    def admit(self, priority, timeout):
+        """Wait (from a thread) for an identification slot, for at most `timeout` seconds"""
+        event = threading.Event()
+        ticket = self._enqueue(priority, time.monotonic() + timeout, event.set)
+
+        if not ticket.granted:
+            event.wait(max(0.0, ticket.deadline - time.monotonic()))
+            if not ticket.granted and self._cancel(ticket):
+                raise self._rejection(ticket)
+
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(started)
+
+    @asynccontextmanager
+    async def admit_async(self, priority, timeout):
+        """Wait (from a coroutine) for an identification slot, for at most `timeout` seconds"""
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+
+        def notify():
+            loop.call_soon_threadsafe(lambda: waiter.done() or waiter.set_result(None))
+
+        ticket = self._enqueue(priority, time.monotonic() + timeout, notify)
+
+        if not ticket.granted:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter), max(0.0, ticket.deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                pass
+            except BaseException:
+                # Cancelled while queued (the client went away): withdraw the
+                # ticket, or hand back the slot if it was granted meanwhile
+                if not self._cancel(ticket, 'cancelled'):
+                    self._release()
+                raise
+            if not ticket.granted and self._cancel(ticket):
+                raise self._rejection(ticket)
+
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(started)
+
+    def stats(self):
+        """Queue depth, active count and shed counters for monitoring"""
+        with self._lock:
+            queued_by_class = {name: 0 for name in PRIORITY_NAMES.values()}
+            for ticket in self._waiting:
+                queued_by_class[PRIORITY_NAMES.get(ticket.priority, str(ticket.priority))] += 1
+            return {
+                'max_active': self.max_active,
+                'max_queue': self.max_queue,
+                'active': self._active,
+                'queued': len(self._waiting),
+                'queued_by_class': queued_by_class,
+                'avg_service_time_s': round(self._service_time, 3),
+                **self._counters
+            }
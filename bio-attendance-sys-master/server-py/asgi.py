@@ -0,0 +1,559 @@
+"""
+Asyncio (ASGI) serving mode for the matching server.
+Run with: uvicorn asgi:app --host 0.0.0.0 --port 5050
+
+Serves the same routes as the Flask app in server.py. Requests and backend
+roster fetches are handled on the event loop (the latter through a pooled
+httpx client), so a waiting kiosk costs a coroutine instead of an OS thread.
+Gallery parsing, decoding, SIFT extraction and matching are dispatched to a
+bounded thread pool sized to the CPU count; OpenCV releases the GIL inside
+those calls, so the pool runs them in parallel.
+"""
+import asyncio
+import functools
+import logging
+import os
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+import httpx
+import requests
+from starlette.applications import Starlette
+from starlette.datastructures import UploadFile
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import FileResponse, JSONResponse, Response
+from starlette.routing import Route
+
+import server
+from admission import AdmissionRejected, PRIORITY_STAFF, PRIORITY_STUDENT
+from feature_template import TEMPLATE_MIMETYPE
+from fingerprint_quality import ProbeQualityError
+from gallery_wire import GALLERY_MIMETYPE, GalleryFormatError
+
+CPU_WORKERS = int(os.environ.get('MATCH_CPU_WORKERS', os.cpu_count() or 1))
+CPU_EXECUTOR = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix='match-cpu')
+
+BACKEND_MAX_CONNECTIONS = int(os.environ.get('BACKEND_MAX_CONNECTIONS', 32))
+
+# Rosters are posted as a single form field, so allow parts well above Starlette's 1 MB default
+MAX_PART_SIZE = 64 * 1024 * 1024
+
+
+async def run_cpu(func, *args):
+    """Run CPU-bound work on the bounded executor without blocking the event loop"""
+    return await asyncio.get_running_loop().run_in_executor(CPU_EXECUTOR, func, *args)
+
+
+def start_probe(scanned, engine):
+    """
+    Start a probe's decode and extraction on the bounded executor too, so the
+    ASGI app never runs more CPU-bound threads than CPU_WORKERS. An identify
+    task that joins the probe was queued after it, and the executor runs its
+    queue in order, so the probe is already running when the join happens.
+    """
+    return server.start_probe_extraction(scanned, engine, CPU_EXECUTOR)
+
+
+def error(message, status_code):
+    return JSONResponse({"status": "error", "message": message}, status_code=status_code)
+
+
+def admitted(priority):
+    """Place a handler behind the shared admission queue in the given priority class"""
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(request):
+            # Match budgets count from here, so time spent queued is spent from the budget
+            request.state.started = time.monotonic()
+            try:
+                async with server.ADMISSION.admit_async(priority, server.request_timeout(request.headers)):
+                    return await handler(request)
+            except AdmissionRejected as e:
+                logging.warning(f"Shed {request.url.path}: {e.reason} (retry after {e.retry_after}s)")
+                return JSONResponse(
+                    server.admission_rejected_body(e),
+                    status_code=503,
+                    headers={'Retry-After': str(e.retry_after)}
+                )
+        return wrapper
+    return decorator
+
+
+async def read_upload(form, field_name='file'):
+    """Return (filename, bytes) of an uploaded file part, or None if it is missing"""
+    upload = form.get(field_name)
+    if not isinstance(upload, UploadFile):
+        return None
+    return upload.filename or '', await upload.read()
+
+
+async def read_gallery_field(form, field_name):
+    """Read gallery records posted as a JSON field or a binary gallery file part"""
+    value = form.get(field_name)
+    if isinstance(value, UploadFile):
+        value = await value.read()
+    if not value:
+        return None
+    return await run_cpu(server.parse_gallery_payload, value)
+
+
+async def home(request):
+    return JSONResponse({"status": "success"})
+
+
+def save_and_score(uploads):
+    for idx, (filename, data) in enumerate(uploads):
+        if filename and server.allowed_file(filename):
+            with open(os.path.join(server.UPLOAD_FOLDER, f"fingerprint_{idx + 1}.jpeg"), 'wb') as f:
+                f.write(data)
+
+    return server.get_fingerprint_match_score(
+        "fingerprints/fingerprint_1.jpeg",
+        "fingerprints/fingerprint_2.jpeg"
+    )
+
+
+async def verify_fingerprint(request):
+    if request.method != 'POST':
+        return JSONResponse({"status": "success"})
+
+    form = await request.form(max_part_size=MAX_PART_SIZE)
+    uploads = [
+        (upload.filename or '', await upload.read())
+        for upload in form.getlist('file') if isinstance(upload, UploadFile)
+    ]
+    if not uploads:
+        return error("No file part", 400)
+
+    match_score = await run_cpu(save_and_score, uploads)
+    logging.info(f"Match score calculated: {match_score}")
+    return JSONResponse({
+        "status": "success",
+        "message": "Verification completed successfully",
+        "match_score": match_score
+    })
+
+
+@admitted(PRIORITY_STUDENT)
+async def identify_fingerprint(request):
+    try:
+        form = await request.form(max_part_size=MAX_PART_SIZE)
+        upload = await read_upload(form)
+        if upload is None:
+            logging.error("No file part in request")
+            return error("No file part", 400)
+
+        staff_id = form.get('staff_id')
+        if not staff_id:
+            logging.error("Staff ID is required")
+            return error("Staff ID is required", 400)
+
+        filename, scanned = upload
+        if filename == '':
+            logging.error("No file selected")
+            return error("No file selected", 400)
+        if not server.allowed_file(filename):
+            logging.error("Invalid file type")
+            return error("Invalid file type", 400)
+        # Decode and extract the probe while the gallery is fetched
+        engine = server.request_engine(form.get('engine'))
+        probe = start_probe(scanned, engine)
+
+        try:
+            response = await request.app.state.backend.get(
+                f"/api/students/fingerprints/{staff_id}",
+                headers={"Accept": f"{GALLERY_MIMETYPE}, application/json"}
+            )
+            if response.status_code != 200:
+                logging.error(f"Failed to fetch students' fingerprints: {response.status_code}")
+                return error("Failed to fetch students' fingerprints", 500)
+
+            students_fingerprints = await run_cpu(
+                server.parse_student_gallery_response,
+                response.headers.get('Content-Type', ''), response.content
+            )
+        except httpx.HTTPError as e:
+            logging.error(f"Failed to connect to backend: {str(e)}")
+            return error(f"Failed to connect to backend: {str(e)}", 500)
+        except GalleryFormatError as e:
+            logging.error(f"Invalid binary gallery from backend: {str(e)}")
+            return error("Invalid fingerprints data format", 500)
+
+        if not students_fingerprints:
+            logging.warning("No students found with fingerprints")
+            return error("No students found with fingerprints", 200)
+
+        identification_result = await run_cpu(
+            server.identify_fingerprint, scanned, students_fingerprints, server.roster_scope(staff_id),
+            server.request_search_mode(form.get('search_mode')),
+            engine,
+            server.request_deadline(form.get('budget_ms'), request.headers, request.state.started),
+            probe
+        )
+
+        request_id = server.request_identifier(request.headers)
+        server.PROBE_STORE.capture(request_id, 'student', scanned, identification_result)
+
+        return JSONResponse({
+            "status": "success",
+            "message": "Identification completed successfully",
+            "request_id": request_id,
+            "student_id": identification_result['student_id'],
+            "confidence": identification_result['confidence'],
+            "templates_evaluated": identification_result['templates_evaluated'],
+            "early_accepted": identification_result['early_accepted'],
+            "repeated_probe": identification_result.get('repeated_probe', False),
+            "exhaustive": identification_result['exhaustive'],
+            "coverage": identification_result['coverage'],
+            "budget_exhausted": identification_result['budget_exhausted'],
+            "engine": identification_result['engine']
+        })
+    except ProbeQualityError as e:
+        return JSONResponse(server.probe_quality_body(e), status_code=422)
+    except Exception as e:
+        logging.error(f"Unexpected error in identify_fingerprint: {str(e)}")
+        logging.error(traceback.format_exc())
+        return error("Internal server error", 500)
+
+
+@admitted(PRIORITY_STUDENT)
+async def identify_fingerprint_multi(request):
+    try:
+        form = await request.form(max_part_size=MAX_PART_SIZE)
+        upload = await read_upload(form)
+        if upload is None:
+            logging.error("No file part in request")
+            return error("No file part", 400)
+
+        filename, scanned = upload
+        if filename == '':
+            logging.error("No file selected")
+            return error("No file selected", 400)
+        if not server.allowed_file(filename):
+            logging.error("Invalid file type")
+            return error("Invalid file type", 400)
+        # Decode and extract the probe while the gallery is parsed
+        engine = server.request_engine(form.get('engine'))
+        probe = start_probe(scanned, engine)
+
+        try:
+            all_fingerprints = await read_gallery_field(form, 'fingerprints_data')
+        except (ValueError, GalleryFormatError) as e:
+            logging.error(f"Failed to parse fingerprints data: {str(e)}")
+            return error("Invalid fingerprints data format", 400)
+
+        if all_fingerprints is None:
+            logging.error("No fingerprints data provided")
+            return error("No fingerprints data provided", 400)
+        if not all_fingerprints:
+            logging.warning("No fingerprints found for identification")
+            return error("No students found with fingerprints", 404)
+
+        identification_result = await run_cpu(
+            server.identify_fingerprint_multi, scanned, all_fingerprints,
+            server.request_search_mode(form.get('search_mode')),
+            engine,
+            server.request_finger_type(form.get('finger_type')),
+            server.request_deadline(form.get('budget_ms'), request.headers, request.state.started),
+            probe,
+            server.request_course_id(form.get('course_id'))
+        )
+
+        request_id = server.request_identifier(request.headers)
+        server.PROBE_STORE.capture(request_id, 'multi', scanned, identification_result)
+
+        return JSONResponse({
+            "status": "success",
+            "message": "Multi-fingerprint identification completed successfully",
+            "request_id": request_id,
+            "student_id": identification_result['student_id'],
+            "confidence": identification_result['confidence'],
+            "finger_type": identification_result.get('finger_type'),
+            "templates_evaluated": identification_result['templates_evaluated'],
+            "early_accepted": identification_result['early_accepted'],
+            "finger_fallback": identification_result['finger_fallback'],
+            "course_fallback": identification_result['course_fallback'],
+            "repeated_probe": identification_result.get('repeated_probe', False),
+            "exhaustive": identification_result['exhaustive'],
+            "coverage": identification_result['coverage'],
+            "budget_exhausted": identification_result['budget_exhausted'],
+            "engine": identification_result['engine']
+        })
+    except ProbeQualityError as e:
+        return JSONResponse(server.probe_quality_body(e), status_code=422)
+    except Exception as e:
+        logging.error(f"Unexpected error in identify_fingerprint_multi: {str(e)}")
+        logging.error(traceback.format_exc())
+        return error("Internal server error", 500)
+
+
+@admitted(PRIORITY_STAFF)
+async def identify_staff_fingerprint(request):
+    try:
+        form = await request.form(max_part_size=MAX_PART_SIZE)
+        upload = await read_upload(form)
+        if upload is None:
+            logging.error("No file part in request")
+            return error("No file part", 400)
+
+        filename, scanned = upload
+        if filename == '':
+            logging.error("No file selected")
+            return error("No file selected", 400)
+        if not server.allowed_file(filename):
+            logging.error("Invalid file type")
+            return error("Invalid file type", 400)
+        # Decode and extract the probe while the gallery is parsed
+        engine = server.request_engine(form.get('engine'))
+        probe = start_probe(scanned, engine)
+
+        try:
+            staff_fingerprints = await read_gallery_field(form, 'staff_fingerprints')
+        except (ValueError, GalleryFormatError) as e:
+            logging.error(f"Failed to parse staff fingerprints: {str(e)}")
+            return error("Invalid staff fingerprints format", 400)
+
+        if staff_fingerprints is None:
+            logging.error("No staff fingerprints provided in request")
+            return error("No staff fingerprints provided", 400)
+        if not staff_fingerprints:
+            logging.warning("No staff found with fingerprints")
+            return error("No staff found with fingerprints", 404)
+
+        identification_result = await run_cpu(
+            server.identify_staff_fingerprint_optimized, scanned, staff_fingerprints,
+            server.request_search_mode(form.get('search_mode')),
+            engine,
+            server.request_deadline(form.get('budget_ms'), request.headers, request.state.started),
+            probe
+        )
+
+        request_id = server.request_identifier(request.headers)
+        server.PROBE_STORE.capture(request_id, 'staff', scanned, identification_result)
+
+        return JSONResponse({
+            "status": "success",
+            "message": "Staff identification completed successfully",
+            "request_id": request_id,
+            "staff_id": identification_result['staff_id'],
+            "confidence": identification_result['confidence'],
+            "templates_evaluated": identification_result['templates_evaluated'],
+            "early_accepted": identification_result['early_accepted'],
+            "repeated_probe": identification_result.get('repeated_probe', False),
+            "exhaustive": identification_result['exhaustive'],
+            "coverage": identification_result['coverage'],
+            "budget_exhausted": identification_result['budget_exhausted'],
+            "engine": identification_result['engine']
+        })
+    except ProbeQualityError as e:
+        return JSONResponse(server.probe_quality_body(e), status_code=422)
+    except Exception as e:
+        logging.error(f"Unexpected error in identify_staff_fingerprint: {str(e)}")
+        logging.error(traceback.format_exc())
+        return error("Internal server error", 500)
+
+
+async def fingerprint_quality(request):
+    try:
+        form = await request.form(max_part_size=MAX_PART_SIZE)
+        upload = await read_upload(form)
+        if upload is not None:
+            image_data = upload[1]
+        elif form.get('fingerprint'):
+            image_data = server.decode_fingerprint_payload(form['fingerprint'])
+        else:
+            return error("No fingerprint provided", 400)
+
+        quality = await run_cpu(server.assess_fingerprint_bytes, image_data)
+        return JSONResponse({"status": "success", "quality": quality})
+    except Exception as e:
+        logging.error(f"Error assessing fingerprint quality: {str(e)}")
+        return error("Invalid fingerprint data", 400)
+
+
+async def diagnostics_probes(request):
+    return JSONResponse({
+        "status": "success",
+        "capture": server.PROBE_STORE.stats(),
+        "recent": server.PROBE_STORE.recent(int(request.query_params.get('limit', 50)))
+    })
+
+
+async def diagnostics_probe(request):
+    entry = server.PROBE_STORE.lookup(request.path_params['request_id'])
+    if entry is None:
+        return error("No capture for this request", 404)
+    return JSONResponse({"status": "success", "probe": entry})
+
+
+async def diagnostics_probe_image(request):
+    image = server.PROBE_STORE.image_file(request.path_params['request_id'])
+    if image is None:
+        return error("No capture for this request", 404)
+    path, mimetype = image
+    return FileResponse(path, media_type=mimetype)
+
+
+async def template_repairs(request):
+    return JSONResponse({"status": "success", "repairs": server.get_repair_report()})
+
+
+async def precompute_templates(request):
+    try:
+        if request.headers.get('content-type', '').startswith('application/json'):
+            body = await request.json()
+        else:
+            form = await request.form(max_part_size=MAX_PART_SIZE)
+            body = {key: value for key, value in form.items() if not isinstance(value, UploadFile)}
+            if isinstance(form.get('templates'), UploadFile):
+                body['templates'] = await read_gallery_field(form, 'templates')
+        records, namespace = await run_cpu(server.precompute_request_records, body)
+        report = await run_cpu(server.precompute_templates, records, namespace, server.request_engines(body.get('engine')))
+        return JSONResponse({"status": "success", "templates": len(records), **report})
+    except (ValueError, GalleryFormatError) as e:
+        return error(str(e), 400)
+    except requests.RequestException as e:
+        logging.error(f"Failed to fetch templates to precompute: {str(e)}")
+        return error("Failed to fetch templates from backend", 502)
+    except Exception as e:
+        logging.error(f"Error precomputing templates: {str(e)}")
+        return error("Internal server error", 500)
+
+
+async def extract_template(request):
+    try:
+        form = await request.form(max_part_size=MAX_PART_SIZE)
+        upload = await read_upload(form)
+        if upload is not None:
+            image_data = upload[1]
+        elif form.get('fingerprint'):
+            image_data = server.decode_fingerprint_payload(form['fingerprint'])
+        else:
+            return error("No fingerprint provided", 400)
+
+        engine = server.request_engine(form.get('engine'))
+        template, count = await run_cpu(server.extract_feature_template, image_data, engine)
+        if server.wants_binary_template(request.query_params, request.headers):
+            return Response(template, media_type=TEMPLATE_MIMETYPE, headers={
+                'X-Template-Engine': engine,
+                'X-Template-Extractor-Version': str(server.TEMPLATE_EXTRACTOR_VERSIONS[engine])
+            })
+        return JSONResponse(server.feature_template_body(template, count, engine))
+    except ProbeQualityError as e:
+        return JSONResponse(server.probe_quality_body(e), status_code=422)
+    except Exception as e:
+        logging.error(f"Error extracting feature template: {str(e)}")
+        return error("Invalid fingerprint data", 400)
+
+
+async def cache_stats(request):
+    return JSONResponse({"status": "success", "cache": server.get_cache_stats()})
+
+
+async def admission_stats(request):
+    return JSONResponse({"status": "success", "admission": server.ADMISSION.stats()})
+
+
+async def invalidate_cache(request):
+    student_id = request.path_params['student_id']
+    try:
+        server.invalidate_cache_entry(student_id, request.query_params.get('finger_type'))
+        return JSONResponse({
+            "status": "success",
+            "message": f"Cache invalidated for student {student_id}"
+        })
+    except Exception as e:
+        logging.error(f"Error invalidating cache for student {student_id}: {str(e)}")
+        return error("Failed to invalidate cache", 500)
+
+
+async def invalidate_staff_cache(request):
+    staff_id = request.path_params['staff_id']
+    try:
+        server.invalidate_staff_cache_entry(staff_id)
+        return JSONResponse({
+            "status": "success",
+            "message": f"Cache invalidated for staff {staff_id}"
+        })
+    except Exception as e:
+        logging.error(f"Error invalidating cache for staff {staff_id}: {str(e)}")
+        return error("Failed to invalidate cache", 500)
+
+
+async def invalidate_roster_cache(request):
+    staff_id = request.path_params['staff_id']
+    try:
+        server.invalidate_scope(server.roster_scope(staff_id))
+        return JSONResponse({
+            "status": "success",
+            "message": f"Cache invalidated for roster of staff {staff_id}"
+        })
+    except Exception as e:
+        logging.error(f"Error invalidating roster cache for staff {staff_id}: {str(e)}")
+        return error("Failed to invalidate cache", 500)
+
+
+async def invalidate_cache_bulk(request):
+    try:
+        try:
+            payload = await request.json()
+        except ValueError:
+            payload = None
+        summary = server.apply_cache_invalidation(payload)
+        return JSONResponse({
+            "status": "success",
+            "message": "Cache invalidated",
+            "invalidated": summary
+        })
+    except ValueError as e:
+        return error(str(e), 400)
+    except Exception as e:
+        logging.error(f"Error applying bulk cache invalidation: {str(e)}")
+        return error("Failed to invalidate cache", 500)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    app.state.backend = httpx.AsyncClient(
+        base_url=server.BACKEND_URL,
+        limits=httpx.Limits(
+            max_connections=BACKEND_MAX_CONNECTIONS,
+            max_keepalive_connections=BACKEND_MAX_CONNECTIONS
+        ),
+        timeout=30
+    )
+    logging.info(f"Async matching server ready with {CPU_WORKERS} CPU workers")
+    try:
+        yield
+    finally:
+        await app.state.backend.aclose()
+        CPU_EXECUTOR.shutdown(wait=False)
+
+
+app = Starlette(
+    routes=[
+        Route('/', home),
+        Route('/verify/fingerprint', verify_fingerprint, methods=['GET', 'POST']),
+        Route('/identify/fingerprint', identify_fingerprint, methods=['POST']),
+        Route('/identify/fingerprint/multi', identify_fingerprint_multi, methods=['POST']),
+        Route('/identify/staff-fingerprint', identify_staff_fingerprint, methods=['POST']),
+        Route('/quality/fingerprint', fingerprint_quality, methods=['POST']),
+        Route('/diagnostics/probes', diagnostics_probes, methods=['GET']),
+        Route('/diagnostics/probes/{request_id}', diagnostics_probe, methods=['GET']),
+        Route('/diagnostics/probes/{request_id}/image', diagnostics_probe_image, methods=['GET']),
+        Route('/templates/repairs', template_repairs, methods=['GET']),
+        Route('/templates/precompute', precompute_templates, methods=['POST']),
+        Route('/templates/extract', extract_template, methods=['POST']),
+        Route('/cache/stats', cache_stats, methods=['GET']),
+        Route('/admission/stats', admission_stats, methods=['GET']),
+        Route('/invalidate-cache', invalidate_cache_bulk, methods=['POST']),
+        Route('/invalidate-cache/staff/{staff_id}', invalidate_staff_cache, methods=['POST']),
+        Route('/invalidate-cache/roster/{staff_id}', invalidate_roster_cache, methods=['POST']),
+        Route('/invalidate-cache/{student_id}', invalidate_cache, methods=['POST']),
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])],
+    lifespan=lifespan
+)
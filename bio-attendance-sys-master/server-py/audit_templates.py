@@ -0,0 +1,218 @@
+"""
+Batch quality audit over enrolled fingerprint templates.
+
+Reads templates from the fingerprints folder and/or the backend (student
+rosters and the staff gallery), decodes and repairs each one the way the
+matcher does, extracts SIFT features once and writes a per-template report.
+Work is spread over a process pool, so a store of thousands of templates is
+audited in minutes.
+
+Run with:
+    python audit_templates.py --dir fingerprints --output audit.csv
+    python audit_templates.py --staff-id <staff id> --staff --format json --output audit.json
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+import requests
+
+# Must be set before importing the server module (and is inherited by the
+# pool's workers) so no process runs the backend warm-up
+os.environ.setdefault('WARMUP_ON_STARTUP', '0')
+logging.basicConfig(level=logging.ERROR, format='%(asctime)s - %(levelname)s - %(message)s')
+
+import server
+from fingerprint_quality import assess_image, assess_keypoints, grade, to_grayscale
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+REPORT_FIELDS = [
+    'source', 'id', 'finger_type', 'payload_bytes', 'decode_status',
+    'brightness', 'contrast', 'foreground', 'keypoints', 'descriptor_bytes',
+    'grade', 'reason', 'extract_ms'
+]
+
+
+def directory_templates(path):
+    """Audit jobs for every image file in a folder"""
+    for name in sorted(os.listdir(path)):
+        if name.lower().endswith(IMAGE_EXTENSIONS):
+            yield {'source': 'file', 'id': name, 'finger_type': None, 'path': os.path.join(path, name)}
+
+
+def backend_templates(source, records):
+    """Audit jobs for gallery records fetched from the backend"""
+    for record in records:
+        payload = record.get('fingerprint')
+        descriptors = record.get('descriptors')
+        yield {
+            'source': source,
+            'id': record.get('id'),
+            'finger_type': record.get('finger_type'),
+            # Binary gallery payloads are memoryviews of the response and can't be pickled
+            'payload': bytes(payload) if isinstance(payload, memoryview) else payload,
+            'descriptors': np.array(descriptors) if descriptors is not None else None,
+            'corrupted': bool(record.get('isCorrupted'))
+        }
+
+
+def fetch_staff_gallery():
+    """Fetch the staff fingerprint gallery from the backend"""
+    response = requests.get(f"{server.BACKEND_URL}/api/staff/fingerprints/all", timeout=30)
+    response.raise_for_status()
+    return response.json().get('data', {}).get('staff', [])
+
+
+def decode_template(data):
+    """Decode (and if needed repair) template bytes; returns (image, status)"""
+    if bytes(data[:8]) == PNG_SIGNATURE:
+        repaired = server.validate_fingerprint_data(data)
+        if repaired is None:
+            return None, 'failed'
+        status = 'ok' if repaired is data else 'repaired'
+        data = repaired
+    else:
+        status = 'ok'
+
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        return None, 'failed'
+    return image, status
+
+
+def audit_template(job):
+    """Audit one template; runs in a pool worker"""
+    row = {field: None for field in REPORT_FIELDS}
+    row.update(source=job['source'], id=job['id'], finger_type=job['finger_type'])
+
+    started = time.perf_counter()
+    try:
+        if job.get('descriptors') is not None:
+            # Precomputed descriptors: nothing to decode, only the matching cost to report
+            row.update(
+                decode_status='descriptors',
+                keypoints=len(job['descriptors']),
+                descriptor_bytes=job['descriptors'].nbytes
+            )
+            return row
+
+        if 'path' in job:
+            with open(job['path'], 'rb') as f:
+                data = f.read()
+        elif job.get('payload'):
+            data = server.decode_fingerprint_payload(job['payload'])
+        else:
+            row['decode_status'] = 'missing'
+            return row
+
+        row['payload_bytes'] = len(data)
+        image, row['decode_status'] = decode_template(data)
+        if job.get('corrupted'):
+            row['decode_status'] = f"flagged_{row['decode_status']}"
+        if image is None:
+            row.update(grade='poor', reason='unreadable')
+            return row
+
+        gray = to_grayscale(image)
+        reason, metrics = assess_image(gray)
+        keypoints, descriptors, mask_stats = server.compute_sift_features(gray, with_mask_stats=True)
+        metrics['keypoints'] = len(keypoints) if keypoints else 0
+        metrics['foreground'] = mask_stats['foreground'] if mask_stats else None
+
+        row.update(
+            metrics,
+            descriptor_bytes=descriptors.nbytes if descriptors is not None else 0,
+            grade=grade(metrics),
+            reason=reason or assess_keypoints(metrics['keypoints'])
+        )
+        return row
+
+    except Exception as e:
+        row.update(decode_status='error', reason=str(e))
+        return row
+
+    finally:
+        row['extract_ms'] = round((time.perf_counter() - started) * 1000, 1)
+
+
+def summarize(rows):
+    by_grade = {}
+    by_status = {}
+    for row in rows:
+        by_grade[row['grade'] or 'n/a'] = by_grade.get(row['grade'] or 'n/a', 0) + 1
+        by_status[row['decode_status']] = by_status.get(row['decode_status'], 0) + 1
+
+    return {
+        'templates': len(rows),
+        'by_grade': by_grade,
+        'by_decode_status': by_status,
+        'descriptor_bytes_total': sum(row['descriptor_bytes'] or 0 for row in rows),
+        'extract_ms_total': round(sum(row['extract_ms'] or 0 for row in rows), 1)
+    }
+
+
+def write_report(rows, output, report_format):
+    stream = open(output, 'w', newline='', encoding='utf-8') if output else sys.stdout
+    try:
+        if report_format == 'csv':
+            writer = csv.DictWriter(stream, fieldnames=REPORT_FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+        else:
+            json.dump({'summary': summarize(rows), 'templates': rows}, stream, indent=2)
+            stream.write('\n')
+    finally:
+        if output:
+            stream.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Audit the quality and matching cost of enrolled fingerprint templates")
+    parser.add_argument('--dir', help="Folder of template images to audit (e.g. fingerprints)")
+    parser.add_argument('--staff-id', action='append', default=[], help="Audit this staff member's student roster from the backend (repeatable)")
+    parser.add_argument('--staff', action='store_true', help="Audit the staff fingerprint gallery from the backend")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Worker processes (default: all cores)")
+    parser.add_argument('--format', choices=['csv', 'json'], default='csv')
+    parser.add_argument('--output', help="Report file (default: stdout)")
+    parser.add_argument('--sort', choices=['keypoints', 'descriptor_bytes', 'extract_ms'], default='descriptor_bytes',
+                        help="Order the report by this column, largest first")
+    args = parser.parse_args(argv)
+
+    if not (args.dir or args.staff_id or args.staff):
+        parser.error("nothing to audit: pass --dir, --staff-id and/or --staff")
+
+    jobs = []
+    if args.dir:
+        jobs.extend(directory_templates(args.dir))
+    try:
+        for staff_id in args.staff_id:
+            jobs.extend(backend_templates(server.roster_scope(staff_id), server.fetch_student_gallery(staff_id)))
+        if args.staff:
+            jobs.extend(backend_templates('staff', fetch_staff_gallery()))
+    except requests.RequestException as e:
+        parser.exit(1, f"Failed to fetch templates from backend: {str(e)}\n")
+
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        rows = list(executor.map(audit_template, jobs, chunksize=max(1, len(jobs) // (args.workers * 8))))
+    elapsed = time.perf_counter() - started
+
+    rows.sort(key=lambda row: row[args.sort] or 0, reverse=True)
+    write_report(rows, args.output, args.format)
+
+    summary = summarize(rows)
+    print(f"Audited {summary['templates']} templates in {elapsed:.1f}s with {args.workers} workers: "
+          f"{summary['by_grade']} {summary['by_decode_status']}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
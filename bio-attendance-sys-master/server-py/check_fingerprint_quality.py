@@ -2,9 +2,17 @@
 # Run with: python check_fingerprint_quality.py
 
 import cv2
-import numpy as np
 import os
 
+from fingerprint_quality import (
+    FAIR_KEYPOINTS,
+    MAX_BRIGHTNESS,
+    MIN_BRIGHTNESS,
+    MIN_CONTRAST,
+    MIN_KEYPOINTS,
+    assess_quality
+)
+
 def check_fingerprint_quality(image_path):
     """Check the quality of a fingerprint image"""
     if not os.path.exists(image_path):
@@ -20,54 +28,48 @@ def check_fingerprint_quality(image_path):
     print(f"   Resolution: {img.shape[1]}x{img.shape[0]}")
     print(f"   Channels: {img.shape[2] if len(img.shape) > 2 else 1}")
     
+    # Same checks the matcher applies to probes and enrollments
+    quality = assess_quality(img)
+
     # Check if image is too dark or too bright
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if len(img.shape) > 2 else img
-    mean_brightness = np.mean(gray)
-    print(f"   Brightness: {mean_brightness:.1f}/255 ", end="")
+    print(f"   Brightness: {quality['brightness']:.1f}/255 ", end="")
     
-    if mean_brightness < 50:
+    if quality['brightness'] < MIN_BRIGHTNESS:
         print("⚠️  Too dark!")
-    elif mean_brightness > 200:
+    elif quality['brightness'] > MAX_BRIGHTNESS:
         print("⚠️  Too bright!")
     else:
         print("✅ Good")
     
     # Check contrast
-    contrast = np.std(gray)
-    print(f"   Contrast: {contrast:.1f} ", end="")
+    print(f"   Contrast: {quality['contrast']:.1f} ", end="")
     
-    if contrast < 30:
+    if quality['contrast'] < MIN_CONTRAST:
         print("⚠️  Too low!")
     else:
         print("✅ Good")
     
     # Detect features
-    sift = cv2.SIFT_create()
-    keypoints, descriptors = sift.detectAndCompute(gray, None)
-    
-    print(f"   Keypoints detected: {len(keypoints)} ", end="")
+    print(f"   Keypoints detected: {quality['keypoints']} ", end="")
     
-    if len(keypoints) < 50:
+    if quality['keypoints'] < MIN_KEYPOINTS:
         print("⚠️  Too few features!")
-    elif len(keypoints) < 100:
+    elif quality['keypoints'] < FAIR_KEYPOINTS:
         print("⚠️  Low features")
     else:
         print("✅ Good")
     
-    if descriptors is not None:
-        print(f"   Descriptors: {len(descriptors)} ✅")
-    else:
-        print(f"   Descriptors: None ❌")
-    
     # Overall quality assessment
     print(f"\n   Overall Quality: ", end="")
-    if len(keypoints) < 50 or contrast < 30:
+    if quality['grade'] == 'poor':
         print("❌ POOR - Re-enrollment recommended")
-    elif len(keypoints) < 100 or contrast < 50:
+    elif quality['grade'] == 'fair':
         print("⚠️  FAIR - May have recognition issues")
     else:
         print("✅ GOOD - Should work well")
 
+    return quality
+
 # Check enrolled fingerprints
 print("=" * 60)
 print("FINGERPRINT QUALITY CHECK")
@@ -0,0 +1,220 @@
+"""
+Diagnostic capture of scanned probes.
+
+Request handlers hand the probe bytes and the identification result to
+ProbeStore.capture(), which only samples and enqueues; a background writer
+thread does all disk I/O. The capture directory is a ring buffer capped by
+total size and by age, and every probe has a JSON sidecar with its result,
+so a kiosk's request id can be traced back to the scan and its score.
+Probes are stored as uploaded; the extension and the mimetype served come
+from the image's magic bytes.
+
+Files are named '<capture time ms>_<request id>.<ext>', so name order is
+capture order, and several worker processes can share one directory. The
+writer lists the directory once when it starts and then keeps the ring and
+its byte total in memory, so eviction costs nothing per write; each writer
+caps the captures present at its start plus its own.
+"""
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+
+_REQUEST_ID_PATTERN = re.compile(r'[^A-Za-z0-9_-]')
+
+# (magic bytes, offset, extension, mimetype) of the formats readers upload
+_IMAGE_FORMATS = (
+    (b'\x89PNG\r\n\x1a\n', 0, 'png', 'image/png'),
+    (b'\xff\xd8\xff', 0, 'jpg', 'image/jpeg'),
+    (b'BM', 0, 'bmp', 'image/bmp'),
+    (b'II*\x00', 0, 'tif', 'image/tiff'),
+    (b'MM\x00*', 0, 'tif', 'image/tiff'),
+    (b'GIF8', 0, 'gif', 'image/gif'),
+    (b'WEBP', 8, 'webp', 'image/webp')
+)
+
+
+def sanitize_request_id(request_id):
+    """Make a client-supplied request id safe to use in a file name"""
+    return _REQUEST_ID_PATTERN.sub('', str(request_id))[:64]
+
+
+def image_format(image_data):
+    """(extension, mimetype) of encoded image bytes, from their magic bytes"""
+    for magic, offset, extension, mimetype in _IMAGE_FORMATS:
+        if image_data[offset:offset + len(magic)] == magic:
+            return extension, mimetype
+    return 'bin', 'application/octet-stream'
+
+
+class ProbeStore:
+    """Size- and age-capped store of sampled probes, written off the request path"""
+
+    def __init__(self, directory, enabled=True, sample_rate=1.0, max_bytes=200 * 1024 * 1024,
+                 max_age_s=72 * 3600, queue_size=64):
+        self.directory = directory
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        self.max_age_s = max_age_s
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._index = OrderedDict()
+        self._index_lock = threading.Lock()
+        self._writer_pid = None
+        # Writer thread only: (stem, file names, bytes) per capture, oldest first
+        self._captures = deque()
+        self._total_bytes = 0
+        self._start_lock = threading.Lock()
+        self._counters = {'captured': 0, 'sampled_out': 0, 'dropped': 0, 'evicted': 0, 'write_errors': 0}
+
+    def capture(self, request_id, kind, image_data, result):
+        """
+        Queue a probe for capture; never blocks the caller.
+        Returns True if the probe was queued.
+        """
+        if not self.enabled or not image_data:
+            return False
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            self._counters['sampled_out'] += 1
+            return False
+
+        self._ensure_writer()
+        entry = {
+            'request_id': sanitize_request_id(request_id),
+            'kind': kind,
+            'captured_at': time.time(),
+            **result
+        }
+        try:
+            self._queue.put_nowait((entry, bytes(image_data)))
+            return True
+        except queue.Full:
+            # The disk is behind; losing a diagnostic sample beats slowing a scan
+            self._counters['dropped'] += 1
+            return False
+
+    def lookup(self, request_id):
+        """Get the capture metadata for a request id, or None"""
+        request_id = sanitize_request_id(request_id)
+        with self._index_lock:
+            entry = self._index.get(request_id)
+        if entry is not None:
+            return entry
+
+        # Captured by another worker process sharing the directory
+        suffix = f"_{request_id}.json"
+        try:
+            for name in os.listdir(self.directory):
+                if name.endswith(suffix):
+                    with open(os.path.join(self.directory, name), encoding='utf-8') as f:
+                        return json.load(f)
+        except OSError:
+            pass
+        return None
+
+    def recent(self, limit=50):
+        """Metadata of the most recent captures made by this process"""
+        with self._index_lock:
+            entries = list(self._index.values())
+        return entries[-limit:][::-1]
+
+    def image_file(self, request_id):
+        """(path, mimetype) of the captured probe for a request id, or None"""
+        entry = self.lookup(request_id)
+        if entry is None:
+            return None
+        path = os.path.join(self.directory, entry['file'])
+        # Captures from before formats were detected are all PNG
+        return (path, entry.get('mimetype', 'image/png')) if os.path.exists(path) else None
+
+    def stats(self):
+        with self._index_lock:
+            indexed = len(self._index)
+        return {
+            'enabled': self.enabled,
+            'sample_rate': self.sample_rate,
+            'max_bytes': self.max_bytes,
+            'max_age_s': self.max_age_s,
+            'queued': self._queue.qsize(),
+            'indexed': indexed,
+            **self._counters
+        }
+
+    def _ensure_writer(self):
+        # Threads don't survive fork, so a pre-forked worker starts its own writer
+        if self._writer_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._writer_pid == os.getpid():
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            threading.Thread(target=self._run_writer, name='probe-store-writer', daemon=True).start()
+            self._writer_pid = os.getpid()
+
+    def _run_writer(self):
+        try:
+            self._scan()
+        except OSError as e:
+            logging.warning(f"Failed to list diagnostic probes in {self.directory}: {str(e)}")
+        while True:
+            entry, image_data = self._queue.get()
+            try:
+                self._write(entry, image_data)
+                self._evict()
+            except Exception as e:
+                self._counters['write_errors'] += 1
+                logging.warning(f"Failed to store diagnostic probe {entry.get('request_id')}: {str(e)}")
+
+    def _scan(self):
+        """Load the captures already in the directory into the ring, oldest first"""
+        captures = OrderedDict()
+        for item in sorted((item for item in os.scandir(self.directory) if item.is_file()), key=lambda item: item.name):
+            stem = item.name.split('.', 1)[0]
+            files, size = captures.get(stem, ((), 0))
+            captures[stem] = (files + (item.name,), size + item.stat().st_size)
+        self._captures = deque((stem, files, size) for stem, (files, size) in captures.items())
+        self._total_bytes = sum(size for _, _, size in self._captures)
+
+    def _write(self, entry, image_data):
+        stem = f"{int(entry['captured_at'] * 1000)}_{entry['request_id']}"
+        extension, entry['mimetype'] = image_format(image_data)
+        entry['file'] = f"{stem}.{extension}"
+        entry['bytes'] = len(image_data)
+        sidecar = json.dumps(entry).encode('utf-8')
+
+        with open(os.path.join(self.directory, entry['file']), 'wb') as f:
+            f.write(image_data)
+        with open(os.path.join(self.directory, f"{stem}.json"), 'wb') as f:
+            f.write(sidecar)
+
+        self._captures.append((stem, (entry['file'], f"{stem}.json"), len(image_data) + len(sidecar)))
+        self._total_bytes += len(image_data) + len(sidecar)
+        with self._index_lock:
+            self._index[entry['request_id']] = entry
+        self._counters['captured'] += 1
+
+    def _evict(self):
+        """Delete the oldest captures until the ring is within its size and age caps"""
+        cutoff_ms = (time.time() - self.max_age_s) * 1000
+        while self._captures:
+            stem, files, size = self._captures[0]
+            captured_ms = stem.split('_', 1)[0]
+            expired = captured_ms.isdigit() and int(captured_ms) < cutoff_ms
+            if self._total_bytes <= self.max_bytes and not expired:
+                break
+            self._captures.popleft()
+            self._total_bytes -= size
+            for name in files:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    # Another worker evicted it first
+                    pass
+            self._counters['evicted'] += 1
+            with self._index_lock:
+                self._index.pop(stem.split('_', 1)[-1], None)
@@ -0,0 +1,272 @@
+"""
+Speed-vs-accuracy evaluation of matcher configurations on labeled samples.
+
+Every change that makes matching faster can cost accuracy, so a faster mode
+should be accepted on data: this runs a labeled dataset (see
+fingerprint_dataset.py) through one or more matcher configurations and
+reports, side by side:
+
+- verification accuracy from genuine pairs (an impression against its own
+  finger's enrolled template) and impostor pairs: FAR and FRR at the
+  service's student and staff thresholds, and the EER;
+- rank-1 identification rate: every probe is identified against the whole
+  enrolled gallery through the service's own identification path;
+- per-scan identification latency (mean, p50, p95) and per-template
+  enrollment (extraction) time;
+- memory: cached template bytes per enrolled finger and the peak traced
+  allocation of one identification.
+
+A configuration is a comma-separated list of settings: engine (sift,
+minutiae), search_mode (exhaustive, ordered), segmentation (0/1), trees,
+checks, ratio, params (a matcher_params.json file) and budget_ms. The first
+configuration is the baseline; every other one is accepted if its rank-1
+rate and EER are within --tolerance of the baseline's.
+
+Run with:
+    python evaluate_matcher.py --dataset samples
+    python evaluate_matcher.py --dataset samples --config engine=sift --config search_mode=ordered \\
+        --config trees=2,checks=32 --config engine=minutiae --output evaluation.json
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+# No backend warm-up, and nothing remembered across configurations except
+# what each configuration extracts itself
+os.environ.setdefault('WARMUP_ON_STARTUP', '0')
+os.environ.setdefault('FEATURE_STORE', '0')
+os.environ.setdefault('PROBE_DEDUP', '0')
+os.environ.setdefault('PROBE_CAPTURE', '0')
+logging.basicConfig(level=logging.ERROR, format='%(asctime)s - %(levelname)s - %(message)s')
+
+import minutiae
+import server
+from fingerprint_dataset import ensure_impressions, load_labeled_samples, split_probes
+from fingerprint_quality import ProbeQualityError
+from tune_matcher import equal_error_rate
+
+EVALUATION_SCOPE = 'evaluation'
+CONFIG_KEYS = {
+    'engine': str, 'search_mode': str, 'segmentation': lambda value: value not in ('0', 'false', 'off'),
+    'trees': int, 'checks': int, 'ratio': float, 'params': str, 'budget_ms': float
+}
+
+
+def parse_config(spec):
+    """{'name': spec, setting: value} for a 'key=value,key=value' configuration"""
+    config = {'name': spec or 'default'}
+    for part in filter(None, (part.strip() for part in spec.split(','))):
+        key, _, value = part.partition('=')
+        if key not in CONFIG_KEYS or not value:
+            raise argparse.ArgumentTypeError(f"invalid setting '{part}' (known: {', '.join(CONFIG_KEYS)})")
+        config[key] = CONFIG_KEYS[key](value)
+    if config.get('engine', server.DEFAULT_MATCH_ENGINE) not in (server.ENGINE_SIFT, server.ENGINE_MINUTIAE):
+        raise argparse.ArgumentTypeError(f"unknown engine '{config['engine']}'")
+    return config
+
+
+def apply_config(config):
+    """Point the server module at a configuration and drop everything cached under the previous one"""
+    server.SIFT_SEGMENTATION = config.get('segmentation', True)
+    bands = server.load_matcher_params(config['params']) if 'params' in config else server.load_matcher_params()
+    overrides = {key: config[key] for key in server.DEFAULT_MATCHER_PARAMS if key in config}
+    server.MATCHER_PARAMS = [{**band, **overrides} for band in bands]
+    server.invalidate_all_cache()
+    with server.MATCH_PRIOR_LOCK:
+        server.MATCH_PRIOR.clear()
+
+
+def encode_png(image):
+    return cv2.imencode('.png', image)[1].tobytes()
+
+
+def percentile(values, q):
+    return round(float(np.percentile(values, q)), 2) if values else None
+
+
+def pair_score(engine, probe, enrolled, params):
+    """Score a probe against one enrolled template the way search_gallery does"""
+    if engine == server.ENGINE_MINUTIAE:
+        return minutiae.match_templates(probe[1], enrolled[1])
+    return server.get_fingerprint_match_score_optimized(probe[1], enrolled[1], probe[0], enrolled[0], params)
+
+
+def rates(genuine, impostor, threshold):
+    return {
+        'threshold': threshold,
+        'far': round(float(np.mean(impostor >= threshold)), 4) if len(impostor) else None,
+        'frr': round(float(np.mean(genuine < threshold)), 4) if len(genuine) else None
+    }
+
+
+def evaluate_config(config, gallery, probes, impostor_pairs, include_staff=True):
+    engine = config.get('engine', server.DEFAULT_MATCH_ENGINE)
+    apply_config(config)
+    records = [{'id': label, 'finger_type': 'thumb', 'fingerprint': encode_png(image)} for label, image in gallery]
+    params = server.matcher_params(len(records))
+
+    # Enrollment: extract (and cache) every gallery template
+    started = time.perf_counter()
+    enrolled = [server.get_record_features(record, scope=EVALUATION_SCOPE, engine=engine) for record in records]
+    enroll_ms = (time.perf_counter() - started) * 1000 / len(records)
+    template_bytes = [template.nbytes for _, template in enrolled if template is not None]
+
+    # Probe features, with the service's quality gate
+    probe_features, rejected = [], 0
+    for _, image in probes:
+        try:
+            features = server.compute_probe_features(image, engine)
+        except ProbeQualityError:
+            features, rejected = (0, None), rejected + 1
+        probe_features.append(features)
+
+    # Verification: every genuine pair and the sampled impostor pairs
+    genuine, impostor = [], []
+    for probe_index, (label, _) in enumerate(probes):
+        probe = probe_features[probe_index]
+        for gallery_index, (enrolled_label, _) in enumerate(gallery):
+            if enrolled_label != label and (probe_index, gallery_index) not in impostor_pairs:
+                continue
+            if probe[1] is None or enrolled[gallery_index][1] is None:
+                score = 0.0
+            else:
+                score = pair_score(engine, probe, enrolled[gallery_index], params)
+            (genuine if enrolled_label == label else impostor).append(score)
+    genuine, impostor = np.array(genuine), np.array(impostor)
+
+    # Identification through the service path, against the warm gallery
+    latencies, correct, wrong = [], 0, 0
+    budget_ms = config.get('budget_ms')
+    for label, image in probes:
+        scan = encode_png(image)
+        started = time.perf_counter()
+        deadline = time.monotonic() + budget_ms / 1000.0 if budget_ms else None
+        try:
+            result = server.identify_fingerprint(scan, records, scope=EVALUATION_SCOPE,
+                                                 search_mode=config.get('search_mode'), engine=engine, deadline=deadline)
+        except ProbeQualityError:
+            result = {'student_id': None}
+        latencies.append((time.perf_counter() - started) * 1000)
+        if result['student_id'] == label:
+            correct += 1
+        elif result['student_id'] is not None:
+            wrong += 1
+
+    # Peak traced allocation of one identification (numpy buffers included, OpenCV internals not)
+    tracemalloc.start()
+    try:
+        server.identify_fingerprint(encode_png(probes[0][1]), records, scope=EVALUATION_SCOPE,
+                                    search_mode=config.get('search_mode'), engine=engine)
+    except ProbeQualityError:
+        pass
+    _, scan_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    student_threshold = server.match_threshold(engine)
+    staff_threshold = server.match_threshold(engine, staff=True)
+    return {
+        'name': config['name'],
+        'settings': {key: value for key, value in config.items() if key != 'name'},
+        'engine': engine,
+        'params': {key: params[key] for key in server.DEFAULT_MATCHER_PARAMS},
+        'genuine_pairs': len(genuine),
+        'impostor_pairs': len(impostor),
+        'probes_rejected': rejected,
+        'student': rates(genuine, impostor, student_threshold),
+        'staff': rates(genuine, impostor, staff_threshold) if include_staff else None,
+        'eer': round(equal_error_rate(genuine, impostor), 4) if len(genuine) and len(impostor) else None,
+        'rank1': round(correct / len(probes), 4),
+        'misidentified': round(wrong / len(probes), 4),
+        'scan_ms': {
+            'mean': round(float(np.mean(latencies)), 2),
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95)
+        },
+        'enroll_ms': round(enroll_ms, 2),
+        'template_kb': round(float(np.mean(template_bytes)) / 1024, 1) if template_bytes else None,
+        'scan_peak_kb': round(scan_peak / 1024, 1)
+    }
+
+
+def verdict(result, baseline, tolerance):
+    if result is baseline:
+        return 'baseline'
+    if result['rank1'] < baseline['rank1'] - tolerance:
+        return 'reject: rank-1'
+    if result['eer'] is not None and baseline['eer'] is not None and result['eer'] > baseline['eer'] + tolerance:
+        return 'reject: eer'
+    return 'accept'
+
+
+def print_report(results):
+    print(f"{'config':<28} {'rank1':>6} {'eer':>6} {'far@s':>6} {'frr@s':>6} {'far@st':>6} {'frr@st':>6} "
+          f"{'scan ms':>8} {'p95':>8} {'enroll':>7} {'tmpl kb':>7} {'peak kb':>8}  verdict")
+    for result in results:
+        staff = result['staff'] or {}
+        print(f"{result['name'][:28]:<28} {result['rank1']:>6.3f} {result['eer'] if result['eer'] is not None else '-':>6} "
+              f"{result['student']['far']:>6} {result['student']['frr']:>6} {staff.get('far', '-'):>6} {staff.get('frr', '-'):>6} "
+              f"{result['scan_ms']['mean']:>8.1f} {result['scan_ms']['p95']:>8.1f} {result['enroll_ms']:>7.1f} "
+              f"{result['template_kb'] if result['template_kb'] is not None else '-':>7} {result['scan_peak_kb']:>8.1f}  "
+              f"{result['verdict']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report FAR/FRR/EER, rank-1 rate, latency and memory for matcher configurations")
+    parser.add_argument('--dataset', required=True, help="Folder of labeled fingerprint images (see fingerprint_dataset.py)")
+    parser.add_argument('--config', action='append', type=parse_config, default=[],
+                        help="Configuration to evaluate, e.g. engine=sift,search_mode=ordered (repeatable; the first is the baseline)")
+    parser.add_argument('--min-impressions', type=int, default=2, help="Synthesize impressions for fingers with fewer than this")
+    parser.add_argument('--max-impostors', type=int, default=400, help="Impostor pairs to score per configuration")
+    parser.add_argument('--no-staff', action='store_true', help="Skip FAR/FRR at the staff threshold")
+    parser.add_argument('--tolerance', type=float, default=0.005, help="Rank-1/EER loss allowed against the baseline")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Write every configuration's results here (JSON)")
+    args = parser.parse_args(argv)
+
+    samples = load_labeled_samples(args.dataset)
+    if len(samples) < 2:
+        parser.error(f"need at least two labeled fingers in {args.dataset}")
+    samples, synthesized = ensure_impressions(samples, args.min_impressions, args.seed)
+    gallery, probes = split_probes(samples)
+
+    # The same impostor pairs for every configuration
+    impostor_pairs = [(p, g) for p, (label, _) in enumerate(probes)
+                      for g, (enrolled, _) in enumerate(gallery) if enrolled != label]
+    random.Random(args.seed).shuffle(impostor_pairs)
+    impostor_pairs = set(impostor_pairs[:args.max_impostors])
+    print(f"{len(gallery)} fingers, {len(probes)} probes ({synthesized} synthesized), "
+          f"{len(impostor_pairs)} impostor pairs", file=sys.stderr)
+
+    results = []
+    for config in args.config or [parse_config('')]:
+        started = time.perf_counter()
+        results.append(evaluate_config(config, gallery, probes, impostor_pairs, not args.no_staff))
+        print(f"{config['name']}: evaluated in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+    for result in results:
+        result['verdict'] = verdict(result, results[0], args.tolerance)
+        result['speedup'] = round(results[0]['scan_ms']['mean'] / result['scan_ms']['mean'], 2) if result['scan_ms']['mean'] else None
+    print_report(results)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'dataset': args.dataset,
+                'evaluated_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'fingers': len(gallery),
+                'probes': len(probes),
+                'synthesized': synthesized,
+                'results': results
+            }, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
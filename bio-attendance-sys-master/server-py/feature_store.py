@@ -0,0 +1,73 @@
+"""
+Content-addressed on-disk store of extracted template features.
+
+Features are stored under the digest of the (validated) template bytes and
+the kind of extraction that produced them (engine, options and extractor
+version, e.g. 'sift-segmented-v1'), so a template is extracted once however
+many rosters, scopes or worker processes see it, a re-enrolled template
+simply has a new digest, and a new extractor version misses the old entries. Bulk precompute jobs fill the store; the feature cache
+falls back to it on a miss before extracting.
+
+Layout: <directory>/<digest[:2]>/<digest>.<kind>.npy
+"""
+import logging
+import os
+import tempfile
+
+import numpy as np
+
+
+class FeatureStore:
+    """Feature arrays (SIFT descriptors or minutiae templates) keyed by payload digest and extraction kind"""
+
+    def __init__(self, directory, enabled=True):
+        self.directory = directory
+        self.enabled = enabled
+        self._counters = {'hits': 0, 'misses': 0, 'writes': 0, 'errors': 0}
+
+    def path(self, digest, kind):
+        return os.path.join(self.directory, digest[:2], f"{digest}.{kind}.npy")
+
+    def contains(self, digest, kind):
+        return self.enabled and os.path.exists(self.path(digest, kind))
+
+    def load(self, digest, kind):
+        """The stored feature array, or None"""
+        if not self.enabled:
+            return None
+        try:
+            features = np.load(self.path(digest, kind), allow_pickle=False)
+            self._counters['hits'] += 1
+            return features
+        except FileNotFoundError:
+            self._counters['misses'] += 1
+            return None
+        except (OSError, ValueError) as e:
+            # A truncated or foreign file; extraction will replace it
+            self._counters['errors'] += 1
+            logging.warning(f"Unreadable stored features {digest}.{kind}: {str(e)}")
+            return None
+
+    def save(self, digest, kind, features):
+        """Write a feature array; the rename makes it visible to readers only once complete"""
+        if not self.enabled:
+            return False
+        path = self.path(digest, kind)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, features, allow_pickle=False)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        self._counters['writes'] += 1
+        return True
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'directory': self.directory,
+            **self._counters
+        }
@@ -0,0 +1,136 @@
+"""
+Serialized feature templates for enrolled fingerprints.
+
+An enrollment image is decoded and run through SIFT (or minutiae
+extraction) every time its features drop out of a matcher's cache. A feature
+template holds the extracted features instead: the backend stores it next
+to the image, posts it in the gallery under 'template', and the matcher
+loads it with np.frombuffer, skipping decode and extraction altogether.
+
+Layout (integers are little-endian):
+
+    magic b'FPFT' | format version u8 | engine u8 | extractor version u16
+    flags u8 | reserved u8 | feature count u32
+    SIFT:     count keypoint records (x, y, size u16 in 1/8 px; angle u8 in
+              1/256 turns; reserved u8), then count x 128 uint8 descriptors
+    minutiae: a serialized minutiae template (see minutiae.py)
+
+SIFT descriptor components are integers from 0 to 255, so storing them as
+bytes is lossless at a quarter of the float32 size. Keypoint coordinates are
+in the full image, whatever region the extractor segmented.
+
+The extractor version says which extraction produced the features; the
+matcher only uses templates from the version it runs, so a change to
+extraction (say, segmentation) makes the backend's stored templates fall
+back to their images until they are re-extracted.
+"""
+import struct
+
+import numpy as np
+
+TEMPLATE_MIMETYPE = 'application/x-fingerprint-template'
+
+MAGIC = b'FPFT'
+FORMAT_VERSION = 1
+
+ENGINE_CODES = {'sift': 1, 'minutiae': 2}
+ENGINE_NAMES = {code: name for name, code in ENGINE_CODES.items()}
+
+FLAG_SEGMENTED = 0x01
+
+DESCRIPTOR_SIZE = 128
+COORDINATE_SCALE = 8.0
+
+_HEADER = struct.Struct('<4sBBHBBI')
+_KEYPOINT = np.dtype([('x', '<u2'), ('y', '<u2'), ('size', '<u2'), ('angle', 'u1'), ('reserved', 'u1')])
+
+
+class TemplateFormatError(ValueError):
+    """Raised when a feature template is truncated, malformed or of an unknown version"""
+
+
+def is_feature_template(data):
+    """Check whether a buffer starts with the feature template magic"""
+    return len(data) >= len(MAGIC) and bytes(data[:len(MAGIC)]) == MAGIC
+
+
+def _pack(engine, extractor_version, flags, count, payload):
+    return _HEADER.pack(MAGIC, FORMAT_VERSION, ENGINE_CODES[engine], extractor_version, flags, 0, count) + payload
+
+
+def serialize_sift(keypoints, descriptors, extractor_version, origin=(0, 0), segmented=False):
+    """
+    Pack SIFT keypoints and descriptors into a template. `origin` is the
+    top-left corner of the region the keypoints were detected in.
+    """
+    records = np.zeros(len(keypoints), dtype=_KEYPOINT)
+    if len(keypoints):
+        geometry = np.array([(point.pt[0] + origin[0], point.pt[1] + origin[1], point.size, point.angle)
+                             for point in keypoints], dtype=np.float64)
+        records['x'] = np.clip(np.round(geometry[:, 0] * COORDINATE_SCALE), 0, 65535)
+        records['y'] = np.clip(np.round(geometry[:, 1] * COORDINATE_SCALE), 0, 65535)
+        records['size'] = np.clip(np.round(geometry[:, 2] * COORDINATE_SCALE), 0, 65535)
+        records['angle'] = np.round(np.mod(geometry[:, 3], 360) / 360 * 256).astype(int) % 256
+
+    packed = np.clip(np.round(descriptors), 0, 255).astype(np.uint8) if descriptors is not None \
+        else np.zeros((0, DESCRIPTOR_SIZE), np.uint8)
+    if len(packed) != len(records):
+        raise TemplateFormatError("Every keypoint needs exactly one descriptor")
+    return _pack('sift', extractor_version, FLAG_SEGMENTED if segmented else 0, len(records),
+                 records.tobytes() + packed.tobytes())
+
+
+def serialize_minutiae(serialized_minutiae, count, extractor_version):
+    """Wrap a serialized minutiae template"""
+    return _pack('minutiae', extractor_version, 0, count, bytes(serialized_minutiae))
+
+
+def parse_template(data):
+    """
+    Parse a feature template. Returns a dict with 'engine',
+    'extractor_version', 'segmented' and 'count'; SIFT templates add
+    'keypoints' (a structured array of the packed geometry) and
+    'descriptors' (an N x 128 float32 array), minutiae templates add
+    'minutiae' (the serialized minutiae template, a memoryview of `data`).
+    """
+    view = memoryview(data)
+    if len(view) < _HEADER.size:
+        raise TemplateFormatError("Template too short for its header")
+    magic, version, engine_code, extractor_version, flags, _, count = _HEADER.unpack_from(view, 0)
+    if magic != MAGIC:
+        raise TemplateFormatError("Invalid feature template magic")
+    if version != FORMAT_VERSION:
+        raise TemplateFormatError(f"Unsupported feature template version: {version}")
+    if engine_code not in ENGINE_NAMES:
+        raise TemplateFormatError(f"Unknown feature template engine: {engine_code}")
+
+    template = {
+        'engine': ENGINE_NAMES[engine_code],
+        'extractor_version': extractor_version,
+        'segmented': bool(flags & FLAG_SEGMENTED),
+        'count': count
+    }
+
+    if template['engine'] == 'minutiae':
+        template['minutiae'] = view[_HEADER.size:]
+        return template
+
+    descriptors_offset = _HEADER.size + count * _KEYPOINT.itemsize
+    if len(view) != descriptors_offset + count * DESCRIPTOR_SIZE:
+        raise TemplateFormatError("Template length does not match its feature count")
+    template['keypoints'] = np.frombuffer(view, dtype=_KEYPOINT, count=count, offset=_HEADER.size)
+    # FLANN's KD-tree index wants float32; the widening copy is the only one made
+    template['descriptors'] = np.frombuffer(view, dtype=np.uint8, count=count * DESCRIPTOR_SIZE,
+                                            offset=descriptors_offset).reshape(count, DESCRIPTOR_SIZE).astype(np.float32)
+    return template
+
+
+def keypoint_geometry(template):
+    """(N, 4) float32 x, y, size, angle (degrees) of a parsed SIFT template's keypoints"""
+    keypoints = template['keypoints']
+    return np.column_stack([
+        keypoints['x'] / COORDINATE_SCALE,
+        keypoints['y'] / COORDINATE_SCALE,
+        keypoints['size'] / COORDINATE_SCALE,
+        keypoints['angle'] * (360 / 256)
+    ]).astype(np.float32)
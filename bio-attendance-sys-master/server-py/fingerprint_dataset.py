@@ -0,0 +1,89 @@
+"""
+Labeled fingerprint samples for offline matcher tuning and evaluation.
+
+A dataset is a folder of images labeled by finger, laid out either as one
+subfolder per finger (<finger>/<any name>.png) or flat, with the finger
+label before the last underscore (<finger>_<n>.png). Every image of a
+finger is an impression of the same finger; different labels are
+different fingers. Flat files without a numeric suffix are a finger each.
+
+Enrollment stores often hold a single impression per finger. For those,
+extra impressions can be synthesized by a small random rotation, shift,
+pressure (contrast) change and sensor noise, which is enough to exercise
+the matcher's genuine-score distribution; results from real repeat scans
+should be preferred when they exist.
+"""
+import os
+import random
+
+import cv2
+import numpy as np
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+
+def load_labeled_samples(path):
+    """{finger label: [grayscale image, ...]} for a dataset folder"""
+    samples = {}
+    for name in sorted(os.listdir(path)):
+        full_path = os.path.join(path, name)
+        if os.path.isdir(full_path):
+            label = name
+            files = [os.path.join(full_path, child) for child in sorted(os.listdir(full_path))]
+        elif name.lower().endswith(IMAGE_EXTENSIONS):
+            stem = os.path.splitext(name)[0]
+            label, _, sample = stem.rpartition('_')
+            if not (label and sample.isdigit()):
+                label = stem
+            files = [full_path]
+        else:
+            continue
+
+        for file_path in files:
+            if not file_path.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            image = cv2.imread(file_path, cv2.IMREAD_GRAYSCALE)
+            if image is not None:
+                samples.setdefault(label, []).append(image)
+    return samples
+
+
+def synthesize_impression(image, rng):
+    """Another plausible impression of the same finger: rotated, shifted, pressed harder or softer, noisy"""
+    height, width = image.shape[:2]
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), rng.uniform(-12, 12), 1.0)
+    matrix[:, 2] += (rng.uniform(-0.05, 0.05) * width, rng.uniform(-0.05, 0.05) * height)
+    moved = cv2.warpAffine(image, matrix, (width, height), borderMode=cv2.BORDER_REPLICATE)
+
+    contrast = rng.uniform(0.85, 1.15)
+    noise = np.random.default_rng(rng.getrandbits(32)).normal(0, 6, moved.shape)
+    pressed = (moved.astype(np.float32) - 128) * contrast + 128 + rng.uniform(-10, 10) + noise
+    return np.clip(pressed, 0, 255).astype(np.uint8)
+
+
+def ensure_impressions(samples, minimum=2, seed=0):
+    """
+    Pad every finger to at least `minimum` impressions with synthesized ones.
+    Returns (samples, synthesized_count); the input is not modified.
+    """
+    rng = random.Random(seed)
+    padded = {}
+    synthesized = 0
+    for label, images in samples.items():
+        images = list(images)
+        while len(images) < minimum:
+            images.append(synthesize_impression(images[0], rng))
+            synthesized += 1
+        padded[label] = images
+    return padded, synthesized
+
+
+def split_probes(samples):
+    """
+    Split each finger's impressions into the enrolled template (the first)
+    and probes (the rest). Returns (gallery, probes) as lists of
+    (label, image).
+    """
+    gallery = [(label, images[0]) for label, images in samples.items()]
+    probes = [(label, image) for label, images in samples.items() for image in images[1:]]
+    return gallery, probes
@@ -0,0 +1,121 @@
+"""
+Fingerprint image quality checks shared by the matcher and the audit script.
+
+assess_image() is the cheap part (brightness and contrast of the decoded
+image, a single pass) and runs before SIFT, so a blank or smudged probe is
+rejected without touching the gallery. assess_keypoints() runs on the SIFT
+keypoint count the matcher computes anyway.
+"""
+import cv2
+
+from segmentation import segment_fingerprint
+
+MIN_BRIGHTNESS = 50
+# Scans are mostly white background, so good prints sit around 195-215;
+# MAX_BRIGHTNESS is advisory and only near-blank frames are rejected
+MAX_BRIGHTNESS = 200
+BLANK_BRIGHTNESS = 240
+MIN_CONTRAST = 30
+FAIR_CONTRAST = 50
+MIN_KEYPOINTS = 50
+FAIR_KEYPOINTS = 100
+
+# Reason codes the kiosk and enrollment UIs can map to user guidance
+REASON_UNREADABLE = 'unreadable'
+REASON_TOO_DARK = 'too_dark'
+REASON_TOO_BRIGHT = 'too_bright'
+REASON_LOW_CONTRAST = 'low_contrast'
+REASON_TOO_FEW_FEATURES = 'too_few_features'
+
+REASON_MESSAGES = {
+    REASON_UNREADABLE: "Fingerprint image could not be read, please scan again",
+    REASON_TOO_DARK: "Fingerprint image is too dark, press more lightly or clean the scanner",
+    REASON_TOO_BRIGHT: "Fingerprint image is too faint, press the finger firmly on the scanner",
+    REASON_LOW_CONTRAST: "Fingerprint is smudged or blank, clean and dry the finger and scan again",
+    REASON_TOO_FEW_FEATURES: "Too little of the fingerprint was captured, place the finger flat and scan again"
+}
+
+
+class ProbeQualityError(ValueError):
+    """Raised when a fingerprint image is too poor to be worth matching"""
+
+    def __init__(self, reason, metrics):
+        super().__init__(REASON_MESSAGES[reason])
+        self.reason = reason
+        self.metrics = metrics
+
+
+def to_grayscale(image):
+    """Return a single-channel view of a decoded image"""
+    if image.ndim == 3:
+        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return image
+
+
+def assess_image(gray):
+    """
+    Check brightness and contrast of a grayscale fingerprint image.
+    Returns (reason, metrics); reason is None when the image is acceptable.
+    """
+    mean, stddev = cv2.meanStdDev(gray)
+    metrics = {
+        'brightness': round(float(mean[0][0]), 1),
+        'contrast': round(float(stddev[0][0]), 1)
+    }
+
+    if metrics['brightness'] < MIN_BRIGHTNESS:
+        return REASON_TOO_DARK, metrics
+    if metrics['brightness'] > BLANK_BRIGHTNESS:
+        return REASON_TOO_BRIGHT, metrics
+    if metrics['contrast'] < MIN_CONTRAST:
+        return REASON_LOW_CONTRAST, metrics
+    return None, metrics
+
+
+def assess_keypoints(keypoints_count):
+    """Check the SIFT keypoint count; returns a reason or None"""
+    if keypoints_count < MIN_KEYPOINTS:
+        return REASON_TOO_FEW_FEATURES
+    return None
+
+
+def grade(metrics):
+    """Overall grade ('good', 'fair' or 'poor') for brightness/contrast/keypoint metrics"""
+    if metrics['keypoints'] < MIN_KEYPOINTS or metrics['contrast'] < MIN_CONTRAST:
+        return 'poor'
+    if metrics['keypoints'] < FAIR_KEYPOINTS or metrics['contrast'] < FAIR_CONTRAST:
+        return 'fair'
+    return 'good'
+
+
+def assess_quality(image):
+    """
+    Full quality report for a decoded fingerprint image, as used at enrollment.
+    Returns a dict with 'acceptable', 'reason', 'message', 'grade' and the metrics.
+    """
+    if image is None or image.size == 0:
+        return {
+            'acceptable': False,
+            'reason': REASON_UNREADABLE,
+            'message': REASON_MESSAGES[REASON_UNREADABLE],
+            'grade': 'poor'
+        }
+
+    gray = to_grayscale(image)
+    reason, metrics = assess_image(gray)
+
+    # Count keypoints the way the matcher extracts them: inside the ridge region only
+    crop, mask, mask_stats = segment_fingerprint(gray)
+    keypoints = cv2.SIFT_create().detect(crop, mask)
+    metrics['keypoints'] = len(keypoints)
+    metrics['foreground'] = mask_stats['foreground']
+    metrics['resolution'] = f"{gray.shape[1]}x{gray.shape[0]}"
+    reason = reason or assess_keypoints(metrics['keypoints'])
+
+    return {
+        'acceptable': reason is None,
+        'reason': reason,
+        'message': REASON_MESSAGES[reason] if reason else "Fingerprint quality is acceptable",
+        'grade': grade(metrics),
+        **metrics
+    }
@@ -0,0 +1,163 @@
+"""
+Immutable, versioned snapshots of cached gallery features.
+
+The feature cache used to be one dict behind one lock: every template lookup
+of every request took the lock, and a TTL expiry could clear() the dict while
+other threads were midway through a scan. Here each scope (a roster, the
+staff gallery, the all-students gallery) has a GallerySnapshot, a read-only
+mapping that is never modified once published. A search takes its scope's
+snapshot once and reads it without locking; it sees one consistent gallery
+however many writers publish meanwhile.
+
+Writers serialize on a lock and swap in a new snapshot with a single
+reference assignment. A snapshot is a compacted base mapping plus a small
+delta of the entries published since: publishing copies only the delta, and
+once the delta outgrows the square root of the base (at least MIN_DELTA
+entries) it is folded into a new base, dropping invalidated entries. Filling
+a cold scope of N templates one miss at a time thus copies O(N sqrt N) entries
+rather than O(N^2), and the invalidation pass runs once per compaction
+rather than once per miss.
+
+An index over every scope lets a template already extracted for one roster
+be reused by another. It is a plain dict updated under the write lock and
+read without it (a single dict lookup is atomic); an entry leaves it when
+the scope that published it drops the entry, expires or is cleared.
+
+Each snapshot expires TTL seconds after its scope was first published;
+readers treat an expired snapshot as empty and the next publish starts over.
+"""
+import math
+import threading
+import time
+from types import MappingProxyType
+
+MIN_DELTA = 32
+
+_EMPTY = MappingProxyType({})
+
+
+class GallerySnapshot:
+    """A read-only {entry key: cached entry} mapping for one scope"""
+
+    __slots__ = ('scope', 'version', 'base', 'delta', 'size', 'created_at', 'expires_at')
+
+    def __init__(self, scope, version, base, delta, size, created_at, ttl):
+        self.scope = scope
+        self.version = version
+        self.base = base
+        self.delta = delta
+        self.size = size
+        self.created_at = created_at
+        self.expires_at = created_at + ttl
+
+    def get(self, key):
+        entry = self.delta.get(key)
+        return entry if entry is not None else self.base.get(key)
+
+    @property
+    def entries(self):
+        """The whole mapping (merged into a copy, for reporting)"""
+        return MappingProxyType({**self.base, **self.delta})
+
+    def expired(self, now=None):
+        return (now if now is not None else time.time()) >= self.expires_at
+
+    def __len__(self):
+        return self.size
+
+
+class SnapshotStore:
+    """The current snapshot of every scope, swapped atomically by publish()"""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._snapshots = MappingProxyType({})
+        self._index = {}
+        self._write_lock = threading.Lock()
+
+    def current(self, scope):
+        """The scope's snapshot (empty if none or expired); no locking"""
+        snapshot = self._snapshots.get(scope)
+        if snapshot is None or snapshot.expired():
+            return GallerySnapshot(scope, snapshot.version if snapshot else 0, _EMPTY, _EMPTY, 0, time.time(), self.ttl)
+        return snapshot
+
+    def lookup_any(self, key):
+        """An entry cached under any scope, or None; no locking"""
+        return self._index.get(key)
+
+    def _unindex(self, entries):
+        # Another scope may have published its own entry under the key since
+        for key, entry in entries:
+            if self._index.get(key) is entry:
+                del self._index[key]
+
+    def _next(self, previous, scope, updates, keep, now):
+        if previous is None or previous.expired(now):
+            if previous is not None:
+                self._unindex(previous.entries.items())
+            base, delta, size, created_at = _EMPTY, {}, 0, now
+        else:
+            base, delta, size, created_at = previous.base, dict(previous.delta), previous.size, previous.created_at
+
+        size += sum(1 for key in updates if key not in delta and key not in base)
+        delta.update(updates)
+        if len(delta) > max(MIN_DELTA, math.isqrt(len(base))):
+            entries = {**base, **delta}
+            if keep is not None:
+                dropped = [(key, entry) for key, entry in entries.items() if not keep(entry)]
+                for key, _ in dropped:
+                    del entries[key]
+                self._unindex(dropped)
+            base, delta, size = MappingProxyType(entries), {}, len(entries)
+
+        version = (previous.version if previous else 0) + 1
+        return GallerySnapshot(scope, version, base, MappingProxyType(delta), size, created_at, self.ttl)
+
+    def publish(self, scope, updates, keep=None):
+        """
+        Swap in a new snapshot of `scope` with `updates` added to the latest
+        one. When the snapshot is compacted, the scope's entries for which
+        keep(entry) is false are dropped. Returns the new snapshot.
+        """
+        now = time.time()
+        with self._write_lock:
+            snapshots = dict(self._snapshots)
+            for name, snapshot in list(snapshots.items()):
+                if name != scope and snapshot.expired(now):
+                    del snapshots[name]
+                    self._unindex(snapshot.entries.items())
+            snapshot = self._next(snapshots.get(scope), scope, updates, keep, now)
+            snapshots[scope] = snapshot
+            self._index.update(updates)
+            self._snapshots = MappingProxyType(snapshots)
+        return snapshot
+
+    def clear(self, scope=None):
+        """Drop one scope's snapshot, or every snapshot; searches holding one keep reading it"""
+        with self._write_lock:
+            if scope is None:
+                self._snapshots = MappingProxyType({})
+                self._index = {}
+            else:
+                snapshots = dict(self._snapshots)
+                snapshot = snapshots.pop(scope, None)
+                if snapshot is not None:
+                    self._unindex(snapshot.entries.items())
+                self._snapshots = MappingProxyType(snapshots)
+
+    def index(self):
+        """Copy of every cached entry across scopes, for reporting"""
+        with self._write_lock:
+            return MappingProxyType(dict(self._index))
+
+    def stats(self):
+        now = time.time()
+        scopes = [snapshot for snapshot in self._snapshots.values() if not snapshot.expired(now)]
+        return {
+            'scopes': len(scopes),
+            'entries': len(self._index),
+            'largest_scope': max((len(snapshot) for snapshot in scopes), default=0),
+            'oldest_created_at': min((snapshot.created_at for snapshot in scopes), default=None),
+            'versions': {snapshot.scope: snapshot.version for snapshot in sorted(scopes, key=len, reverse=True)[:10]}
+        }
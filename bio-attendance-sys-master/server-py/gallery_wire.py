@@ -0,0 +1,176 @@
+"""
+Binary wire format for gallery templates.
+
+Base64-in-JSON costs a third more bytes on the wire plus regex cleaning and a
+second decode for every template. This framing carries raw image bytes (or
+precomputed SIFT descriptors) with a small per-record header, and parsing
+hands the payloads back as memoryview slices of the received buffer so nothing
+is copied until OpenCV reads it.
+
+Stream layout (integers are big-endian):
+
+    magic b'FPGW' | format version u8 | record count u32
+    per record:
+        kind u8 | flags u8 | template version u16
+        id len u8 | id utf-8
+        finger_type len u8 | finger_type utf-8
+        fingerprint_id len u8 | fingerprint_id utf-8
+        payload len u32 | payload bytes
+
+KIND_IMAGE payloads are encoded images (PNG as enrolled). KIND_DESCRIPTORS
+payloads are little-endian float32 SIFT descriptors, DESCRIPTOR_SIZE per row.
+KIND_MINUTIAE payloads are serialized minutiae templates (see minutiae.py).
+For those two the template version is the version of the extractor that
+produced them; the matcher ignores features from any version but its own.
+KIND_TEMPLATE payloads are feature templates (see feature_template.py).
+"""
+import struct
+
+import numpy as np
+
+GALLERY_MIMETYPE = 'application/x-fingerprint-gallery'
+
+MAGIC = b'FPGW'
+FORMAT_VERSION = 1
+
+KIND_IMAGE = 1
+KIND_DESCRIPTORS = 2
+KIND_MINUTIAE = 3
+KIND_TEMPLATE = 4
+
+FLAG_CORRUPTED = 0x01
+
+DESCRIPTOR_SIZE = 128
+
+_STREAM_HEADER = struct.Struct('>4sBI')
+_RECORD_HEADER = struct.Struct('>BBH')
+_PAYLOAD_LENGTH = struct.Struct('>I')
+
+
+class GalleryFormatError(ValueError):
+    """Raised when a binary gallery stream is truncated or malformed"""
+
+
+def is_gallery_stream(data):
+    """Check whether a buffer starts with the binary gallery magic"""
+    return len(data) >= len(MAGIC) and bytes(data[:len(MAGIC)]) == MAGIC
+
+
+def _read_string(view, offset):
+    if offset + 1 > len(view):
+        raise GalleryFormatError("Truncated record header")
+    length = view[offset]
+    offset += 1
+    if offset + length > len(view):
+        raise GalleryFormatError("Truncated record header")
+    return bytes(view[offset:offset + length]).decode('utf-8'), offset + length
+
+
+def _write_string(value):
+    encoded = str(value if value is not None else '').encode('utf-8')
+    if len(encoded) > 255:
+        raise GalleryFormatError(f"Header field too long: {value!r}")
+    return bytes([len(encoded)]) + encoded
+
+
+def parse_gallery(data):
+    """
+    Parse a binary gallery stream into gallery records.
+
+    Records use the same keys as the JSON payloads ('id', 'finger_type',
+    'fingerprint_id', 'isCorrupted') so the identification loops handle both.
+    Image payloads are returned under 'fingerprint' as memoryview slices of
+    `data`; descriptor payloads are returned under 'descriptors' as read-only
+    float32 arrays backed by the same buffer, minutiae templates under
+    'minutiae' and feature templates under 'template' as memoryview slices.
+    """
+    view = memoryview(data)
+    if len(view) < _STREAM_HEADER.size:
+        raise GalleryFormatError("Stream too short for gallery header")
+
+    magic, version, count = _STREAM_HEADER.unpack_from(view, 0)
+    if magic != MAGIC:
+        raise GalleryFormatError("Invalid gallery magic")
+    if version != FORMAT_VERSION:
+        raise GalleryFormatError(f"Unsupported gallery format version: {version}")
+
+    offset = _STREAM_HEADER.size
+    records = []
+    for _ in range(count):
+        if offset + _RECORD_HEADER.size > len(view):
+            raise GalleryFormatError("Truncated record header")
+        kind, flags, template_version = _RECORD_HEADER.unpack_from(view, offset)
+        offset += _RECORD_HEADER.size
+
+        record_id, offset = _read_string(view, offset)
+        finger_type, offset = _read_string(view, offset)
+        fingerprint_id, offset = _read_string(view, offset)
+
+        if offset + _PAYLOAD_LENGTH.size > len(view):
+            raise GalleryFormatError("Truncated payload length")
+        (payload_length,) = _PAYLOAD_LENGTH.unpack_from(view, offset)
+        offset += _PAYLOAD_LENGTH.size
+        if offset + payload_length > len(view):
+            raise GalleryFormatError("Truncated payload")
+        payload = view[offset:offset + payload_length]
+        offset += payload_length
+
+        record = {
+            'id': record_id,
+            'finger_type': finger_type or None,
+            'fingerprint_id': fingerprint_id or None,
+            'template_version': template_version,
+            'isCorrupted': bool(flags & FLAG_CORRUPTED)
+        }
+
+        if kind == KIND_IMAGE:
+            record['fingerprint'] = payload
+        elif kind == KIND_DESCRIPTORS:
+            if payload_length % (DESCRIPTOR_SIZE * 4):
+                raise GalleryFormatError(f"Descriptor payload for {record_id} is not a whole number of rows")
+            record['descriptors'] = np.frombuffer(payload, dtype='<f4').reshape(-1, DESCRIPTOR_SIZE)
+        elif kind == KIND_MINUTIAE:
+            record['minutiae'] = payload
+        elif kind == KIND_TEMPLATE:
+            record['template'] = payload
+        else:
+            raise GalleryFormatError(f"Unknown payload kind {kind} for {record_id}")
+
+        records.append(record)
+
+    return records
+
+
+def encode_gallery(records):
+    """
+    Encode gallery records into a binary gallery stream.
+
+    Each record needs an 'id' and either 'fingerprint' (raw image bytes),
+    'descriptors' (an N x 128 float32 array), 'minutiae' (a serialized
+    minutiae template) or 'template' (a feature template).
+    """
+    chunks = [_STREAM_HEADER.pack(MAGIC, FORMAT_VERSION, len(records))]
+    for record in records:
+        descriptors = record.get('descriptors')
+        if descriptors is not None:
+            kind = KIND_DESCRIPTORS
+            payload = np.ascontiguousarray(descriptors, dtype='<f4').tobytes()
+        elif record.get('minutiae') is not None:
+            kind = KIND_MINUTIAE
+            payload = bytes(record['minutiae'])
+        elif record.get('template') is not None:
+            kind = KIND_TEMPLATE
+            payload = bytes(record['template'])
+        else:
+            kind = KIND_IMAGE
+            payload = bytes(record['fingerprint'])
+
+        flags = FLAG_CORRUPTED if record.get('isCorrupted') else 0
+        chunks.append(_RECORD_HEADER.pack(kind, flags, int(record.get('template_version') or 0)))
+        chunks.append(_write_string(record['id']))
+        chunks.append(_write_string(record.get('finger_type')))
+        chunks.append(_write_string(record.get('fingerprint_id')))
+        chunks.append(_PAYLOAD_LENGTH.pack(len(payload)))
+        chunks.append(payload)
+
+    return b''.join(chunks)
@@ -0,0 +1,35 @@
+# Production launch configuration for the matching server.
+# Run with: gunicorn -c gunicorn.conf.py server:APP
+#
+# The app is imported once in the master (preload_app), which warms the
+# feature cache before any worker is forked, so every worker starts with the
+# same descriptors shared copy-on-write. Cache invalidations are coordinated
+# through the shared generation counters in server.py.
+
+import gc
+import multiprocessing
+import os
+
+bind = os.environ.get('MATCH_SERVER_BIND', '0.0.0.0:5050')
+workers = int(os.environ.get('MATCH_SERVER_WORKERS', multiprocessing.cpu_count()))
+timeout = int(os.environ.get('MATCH_SERVER_TIMEOUT', 120))
+
+# Admission control (see admission.py) is per process, so split the machine's
+# limits across the workers before server.py reads them. Each worker then
+# needs a thread for every request it runs or queues, plus some to answer the
+# overflow with a 503 rather than leaving it in gunicorn's accept backlog.
+os.environ.setdefault('ADMISSION_MAX_ACTIVE', str(max(1, multiprocessing.cpu_count() // workers)))
+os.environ.setdefault('ADMISSION_MAX_QUEUE', str(max(1, 32 // workers)))
+admission_slots = int(os.environ['ADMISSION_MAX_ACTIVE']) + int(os.environ['ADMISSION_MAX_QUEUE'])
+
+worker_class = 'gthread'
+threads = int(os.environ.get('MATCH_SERVER_THREADS', admission_slots + int(os.environ['ADMISSION_MAX_ACTIVE'])))
+
+preload_app = True
+
+
+def when_ready(arbiter):
+    # Move everything loaded during warm-up into the permanent generation so
+    # the workers' garbage collector never writes to (and un-shares) those pages
+    gc.freeze()
+    arbiter.log.info("Feature cache warmed in master; forking %s workers", arbiter.num_workers)
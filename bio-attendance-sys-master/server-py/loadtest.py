@@ -0,0 +1,516 @@
+"""
+Load test for the matching server.
+
+Starts a stub of the Node backend that serves synthetic rosters (built from
+the sample prints in fingerprints/) or a recorded roster, launches the
+matching server against it (or targets one that is already running) and
+drives it with virtual kiosks. Scans arrive as a Poisson process whose rate
+follows a constant, ramp or morning-rush curve, and are spread over the
+student, multi-finger and staff identification endpoints.
+
+The report gives throughput, p50/p95/p99 latency, error/shed/reject rates
+and the server's CPU and RSS usage.
+
+Run with:
+    python loadtest.py --students 500 --kiosks 16 --rate 10 --duration 60 --curve rush
+    python loadtest.py --server gunicorn --output loadtest.json
+"""
+import argparse
+import base64
+import glob
+import json
+import math
+import os
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from gallery_wire import GALLERY_MIMETYPE, encode_gallery
+
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+SAMPLE_GLOB = os.path.join('fingerprints', 'temp_*.png')
+STAFF_ID = 'loadtest-staff'
+
+SERVER_COMMANDS = {
+    'flask': [sys.executable, '-c',
+              "import os, server; server.APP.run(host='127.0.0.1', port=int(os.environ['LOADTEST_PORT']), threaded=True)"],
+    'gunicorn': ['gunicorn', '-c', 'gunicorn.conf.py', 'server:APP'],
+    'uvicorn': ['uvicorn', 'asgi:app', '--host', '127.0.0.1', '--port', '{port}']
+}
+
+
+# ---------------------------------------------------------------------------
+# Stub backend
+# ---------------------------------------------------------------------------
+
+def synthetic_gallery(prefix, size, samples):
+    """Gallery records cycling through the sample prints"""
+    return [
+        {
+            'id': f"{prefix}-{i}",
+            'finger_type': 'thumb',
+            'fingerprint': samples[i % len(samples)],
+            'isCorrupted': False
+        }
+        for i in range(size)
+    ]
+
+
+def load_recorded_roster(path):
+    """Records from a saved backend response ({'data': {'students': [...]}}) or a plain list"""
+    with open(path, encoding='utf-8') as f:
+        body = json.load(f)
+    records = body if isinstance(body, list) else body.get('data', {}).get('students', [])
+    for record in records:
+        record['fingerprint'] = base64.b64decode(re.sub(r'^data:image/[^;]+;base64,', '', record['fingerprint']))
+    return records
+
+
+def json_gallery(records):
+    return [{**record, 'fingerprint': base64.b64encode(record['fingerprint']).decode()} for record in records]
+
+
+class StubBackend:
+    """Serves /api/students/fingerprints/<staff_id> and /api/staff/fingerprints/all"""
+
+    def __init__(self, students, staff, binary=False):
+        self.students = students
+        self.staff = staff
+        self.binary = binary
+        self.requests = 0
+        self._students_json = json.dumps({'data': {'students': json_gallery(students)}}).encode()
+        self._students_binary = encode_gallery(students)
+        self._staff_json = json.dumps({'data': {'staff': json_gallery(staff)}}).encode()
+
+        backend = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                backend.requests += 1
+                if self.path.startswith('/api/students/fingerprints/'):
+                    if backend.binary and GALLERY_MIMETYPE in self.headers.get('Accept', ''):
+                        self._send(backend._students_binary, GALLERY_MIMETYPE)
+                    else:
+                        self._send(backend._students_json, 'application/json')
+                elif self.path == '/api/staff/fingerprints/all':
+                    self._send(backend._staff_json, 'application/json')
+                else:
+                    self.send_error(404)
+
+            def _send(self, body, content_type):
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self._server.shutdown()
+
+
+# ---------------------------------------------------------------------------
+# Server under test
+# ---------------------------------------------------------------------------
+
+def launch_server(kind, port, backend_url, env_overrides):
+    env = {
+        **os.environ,
+        'BACKEND_URL': backend_url,
+        'LOADTEST_PORT': str(port),
+        'MATCH_SERVER_BIND': f"127.0.0.1:{port}",
+        **env_overrides
+    }
+    command = [part.format(port=port) for part in SERVER_COMMANDS[kind]]
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    target = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{kind} server exited with code {process.returncode}")
+        try:
+            if requests.get(target, timeout=1).ok:
+                return process, target
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{kind} server did not come up on port {port}")
+
+
+def _proc_tree(pid):
+    """pid and its descendants, from /proc"""
+    pids = [pid]
+    for current in pids:
+        for task in glob.glob(f"/proc/{current}/task/*/children"):
+            try:
+                with open(task) as f:
+                    pids.extend(int(child) for child in f.read().split())
+            except OSError:
+                pass
+    return pids
+
+
+def _proc_usage(pid):
+    """(cpu seconds, rss bytes) of a process tree, from /proc"""
+    ticks = os.sysconf('SC_CLK_TCK')
+    page = os.sysconf('SC_PAGE_SIZE')
+    cpu = rss = 0
+    for current in _proc_tree(pid):
+        try:
+            with open(f"/proc/{current}/stat") as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            cpu += (int(fields[11]) + int(fields[12])) / ticks
+            rss += int(fields[21]) * page
+        except (OSError, IndexError, ValueError):
+            continue
+    return cpu, rss
+
+
+class ResourceSampler:
+    """Samples CPU and RSS of the server's process tree while the test runs"""
+
+    def __init__(self, pid, interval=0.5):
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+
+    def usage(self):
+        if PSUTIL_AVAILABLE:
+            root = psutil.Process(self.pid)
+            cpu = rss = 0
+            for process in [root] + root.children(recursive=True):
+                try:
+                    times = process.cpu_times()
+                    cpu += times.user + times.system
+                    rss += process.memory_info().rss
+                except psutil.Error:
+                    continue
+            return cpu, rss
+        if os.path.exists('/proc'):
+            return _proc_usage(self.pid)
+        return None
+
+    def run(self):
+        previous = self.usage()
+        previous_time = time.time()
+        while not self._stop.wait(self.interval):
+            current = self.usage()
+            now = time.time()
+            if current is None or previous is None:
+                return
+            self.samples.append({
+                'cpu_percent': 100.0 * (current[0] - previous[0]) / (now - previous_time),
+                'rss_mb': current[1] / (1024 * 1024)
+            })
+            previous, previous_time = current, now
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def summary(self):
+        if not self.samples:
+            return {'available': False}
+        cpu = [sample['cpu_percent'] for sample in self.samples]
+        rss = [sample['rss_mb'] for sample in self.samples]
+        return {
+            'available': True,
+            'cpu_percent_avg': round(sum(cpu) / len(cpu), 1),
+            'cpu_percent_peak': round(max(cpu), 1),
+            'rss_mb_avg': round(sum(rss) / len(rss), 1),
+            'rss_mb_peak': round(max(rss), 1)
+        }
+
+
+# ---------------------------------------------------------------------------
+# Load generation
+# ---------------------------------------------------------------------------
+
+def arrival_rate(curve, peak, elapsed, duration):
+    """Scans per second at `elapsed` seconds into the test"""
+    if curve == 'ramp':
+        return peak * min(1.0, elapsed / duration)
+    if curve == 'rush':
+        # Quiet start, a peak 40% of the way in (the bell), then a tail of latecomers
+        return peak * (0.1 + 0.9 * math.exp(-((elapsed - 0.4 * duration) / (0.15 * duration)) ** 2))
+    return peak
+
+
+def arrival_times(curve, peak, duration, rng):
+    """Arrival times of a Poisson process following the curve (by thinning at the peak rate)"""
+    times = []
+    elapsed = 0.0
+    while True:
+        elapsed += rng.expovariate(peak)
+        if elapsed >= duration:
+            return times
+        if rng.random() < arrival_rate(curve, peak, elapsed, duration) / peak:
+            times.append(elapsed)
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, weight = part.split('=')
+        mix[name.strip()] = float(weight)
+    unknown = set(mix) - {'student', 'multi', 'staff'}
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown endpoints in mix: {', '.join(sorted(unknown))}")
+    return mix
+
+
+class Kiosks:
+    """Builds and sends identification requests, recording one result per scan"""
+
+    def __init__(self, target, students, staff, multi_gallery, form_extras):
+        self.target = target
+        self.students = students
+        self.staff = staff
+        self.multi_blob = encode_gallery(multi_gallery)
+        self.multi_gallery = multi_gallery
+        self.staff_blob = encode_gallery(staff)
+        self.form_extras = form_extras
+        # Synthetic rosters repeat prints, so a match is correct if it has the probe's print
+        self.prints = {record['id']: record['fingerprint'] for record in students + staff}
+        self.results = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _session(self):
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def scan(self, endpoint, scheduled_at, started_at, rng):
+        if endpoint == 'student':
+            probe = rng.choice(self.students)
+            url = f"{self.target}/identify/fingerprint"
+            files = {'file': ('scan.png', probe['fingerprint'])}
+            data = {'staff_id': STAFF_ID, **self.form_extras}
+        elif endpoint == 'multi':
+            probe = rng.choice(self.multi_gallery)
+            url = f"{self.target}/identify/fingerprint/multi"
+            files = {'file': ('scan.png', probe['fingerprint']), 'fingerprints_data': ('gallery.bin', self.multi_blob)}
+            data = dict(self.form_extras)
+        else:
+            probe = rng.choice(self.staff)
+            url = f"{self.target}/identify/staff-fingerprint"
+            files = {'file': ('scan.png', probe['fingerprint']), 'staff_fingerprints': ('gallery.bin', self.staff_blob)}
+            data = dict(self.form_extras)
+
+        try:
+            response = self._session().post(url, files=files, data=data, timeout=120)
+            status = response.status_code
+            body = response.json() if response.headers.get('Content-Type', '').startswith('application/json') else {}
+        except requests.RequestException:
+            status, body = None, {}
+
+        finished = time.perf_counter()
+        if status == 200 and body.get('status') == 'success':
+            outcome = 'ok'
+        elif status == 503:
+            outcome = 'shed'
+        elif status == 422:
+            outcome = 'rejected'
+        else:
+            outcome = 'error'
+
+        matched_id = body.get('student_id') or body.get('staff_id')
+        with self._lock:
+            self.results.append({
+                'endpoint': endpoint,
+                'outcome': outcome,
+                'matched': matched_id is not None,
+                'correct': self.prints.get(matched_id) == probe['fingerprint'],
+                'latency_ms': (finished - scheduled_at) * 1000,
+                'service_ms': (finished - started_at) * 1000
+            })
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(math.ceil(fraction * len(ordered))) - 1)], 1)
+
+
+def summarize(results, elapsed):
+    summary = {}
+    for endpoint in ['all', 'student', 'multi', 'staff']:
+        rows = [row for row in results if endpoint == 'all' or row['endpoint'] == endpoint]
+        if not rows:
+            continue
+        ok = [row for row in rows if row['outcome'] == 'ok']
+        latencies = [row['latency_ms'] for row in ok]
+        summary[endpoint] = {
+            'requests': len(rows),
+            'throughput_rps': round(len(ok) / elapsed, 2),
+            'p50_ms': percentile(latencies, 0.50),
+            'p95_ms': percentile(latencies, 0.95),
+            'p99_ms': percentile(latencies, 0.99),
+            'error_rate': round(sum(row['outcome'] == 'error' for row in rows) / len(rows), 4),
+            'shed_rate': round(sum(row['outcome'] == 'shed' for row in rows) / len(rows), 4),
+            'reject_rate': round(sum(row['outcome'] == 'rejected' for row in rows) / len(rows), 4),
+            'match_rate': round(sum(row['correct'] for row in ok) / len(ok), 4) if ok else None
+        }
+    return summary
+
+
+def run_load(kiosks, args, rng):
+    endpoints = list(args.mix)
+    weights = [args.mix[name] for name in endpoints]
+    schedule = arrival_times(args.curve, args.rate, args.duration, rng)
+    print(f"Sending {len(schedule)} scans over {args.duration}s ({args.curve} curve, peak {args.rate}/s) "
+          f"from {args.kiosks} kiosks", file=sys.stderr)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.kiosks) as pool:
+        for offset in schedule:
+            scheduled_at = started + offset
+            delay = scheduled_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            endpoint = rng.choices(endpoints, weights)[0]
+            # Latency is measured from the scheduled arrival, so time spent
+            # waiting for a free kiosk counts (no coordinated omission)
+            pool.submit(
+                lambda endpoint=endpoint, scheduled_at=scheduled_at, seed=rng.random():
+                kiosks.scan(endpoint, scheduled_at, time.perf_counter(), random.Random(seed))
+            )
+    return time.perf_counter() - started
+
+
+def print_report(report):
+    print(f"\n{'endpoint':<10}{'reqs':>7}{'rps':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'err%':>7}{'shed%':>7}{'rej%':>7}{'match%':>8}")
+    for endpoint, row in report['endpoints'].items():
+        def ms(value):
+            return f"{value:.0f}" if value is not None else '-'
+        match = f"{100 * row['match_rate']:.1f}" if row['match_rate'] is not None else '-'
+        print(f"{endpoint:<10}{row['requests']:>7}{row['throughput_rps']:>8.2f}{ms(row['p50_ms']):>9}{ms(row['p95_ms']):>9}"
+              f"{ms(row['p99_ms']):>9}{100 * row['error_rate']:>7.1f}{100 * row['shed_rate']:>7.1f}"
+              f"{100 * row['reject_rate']:>7.1f}{match:>8}")
+    resources = report['server_resources']
+    if resources.get('available'):
+        print(f"\nserver CPU avg {resources['cpu_percent_avg']}% peak {resources['cpu_percent_peak']}%, "
+              f"RSS avg {resources['rss_mb_avg']}MB peak {resources['rss_mb_peak']}MB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the matching server with virtual kiosks and a stub backend")
+    parser.add_argument('--server', choices=sorted(SERVER_COMMANDS), default='flask', help="Server to launch against the stub backend")
+    parser.add_argument('--target', help="Test an already running server at this URL instead (start it with BACKEND_URL=<stub url>)")
+    parser.add_argument('--port', type=int, default=5090, help="Port for the launched server")
+    parser.add_argument('--stub-only', action='store_true', help="Only run the stub backend and print its URL")
+    parser.add_argument('--students', type=int, default=200, help="Synthetic roster size")
+    parser.add_argument('--roster-file', help="Recorded roster (saved backend response) to serve instead of a synthetic one")
+    parser.add_argument('--staff', type=int, default=20, help="Staff gallery size")
+    parser.add_argument('--multi-size', type=int, default=50, help="Gallery size posted to the multi-finger endpoint")
+    parser.add_argument('--binary-gallery', action='store_true', help="Serve rosters in the binary gallery format")
+    parser.add_argument('--kiosks', type=int, default=8, help="Concurrent virtual kiosks")
+    parser.add_argument('--rate', type=float, default=4.0, help="Peak scans per second")
+    parser.add_argument('--duration', type=float, default=60.0, help="Test length in seconds")
+    parser.add_argument('--curve', choices=['constant', 'ramp', 'rush'], default='rush')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('student=6,multi=3,staff=1'),
+                        help="Endpoint weights, e.g. student=6,multi=3,staff=1")
+    parser.add_argument('--engine', choices=['sift', 'minutiae'], help="Matching engine to request")
+    parser.add_argument('--search-mode', choices=['exhaustive', 'ordered'], help="Search mode to request")
+    parser.add_argument('--budget-ms', type=float, help="Identification latency budget to request")
+    parser.add_argument('--probe-dedup', action='store_true', help="Leave the server's recent-probe cache on")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="Write the JSON report here")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    samples = []
+    for path in sorted(glob.glob(SAMPLE_GLOB)):
+        with open(path, 'rb') as f:
+            samples.append(f.read())
+    if not samples and not args.roster_file:
+        parser.error(f"no sample prints found at {SAMPLE_GLOB}")
+
+    students = load_recorded_roster(args.roster_file) if args.roster_file else synthetic_gallery('student', args.students, samples)
+    staff = synthetic_gallery('staff', args.staff, samples or [students[0]['fingerprint']])
+    backend = StubBackend(students, staff, binary=args.binary_gallery)
+    backend.start()
+    print(f"Stub backend serving {len(students)} students and {len(staff)} staff at {backend.url}", file=sys.stderr)
+
+    if args.stub_only:
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            return
+
+    process = None
+    try:
+        if args.target:
+            target = args.target.rstrip('/')
+        else:
+            process, target = launch_server(args.server, args.port, backend.url, {
+                'PROBE_CAPTURE': '0',
+                # Synthetic kiosks resend identical prints, which the recent-probe cache would absorb
+                'PROBE_DEDUP': '1' if args.probe_dedup else '0'
+            })
+
+        sampler = ResourceSampler(process.pid) if process else None
+        if sampler:
+            sampler.start()
+
+        form_extras = {}
+        if args.engine:
+            form_extras['engine'] = args.engine
+        if args.search_mode:
+            form_extras['search_mode'] = args.search_mode
+        if args.budget_ms:
+            form_extras['budget_ms'] = str(args.budget_ms)
+        kiosks = Kiosks(target, students, staff, students[:args.multi_size], form_extras)
+
+        elapsed = run_load(kiosks, args, rng)
+        if sampler:
+            sampler.stop()
+
+        report = {
+            'config': {key: value for key, value in vars(args).items() if key != 'mix'},
+            'mix': args.mix,
+            'elapsed_s': round(elapsed, 1),
+            'backend_requests': backend.requests,
+            'endpoints': summarize(kiosks.results, elapsed),
+            'server_resources': sampler.summary() if sampler else {'available': False}
+        }
+        print_report(report)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+    finally:
+        if process:
+            process.terminate()
+            process.wait(timeout=10)
+        backend.stop()
+
+
+if __name__ == '__main__':
+    main()
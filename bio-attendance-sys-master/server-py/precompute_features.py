@@ -0,0 +1,91 @@
+"""
+Bulk feature precompute for newly enrolled templates.
+
+After a bulk student import, none of the new templates have features until
+their first live scan, so the first class session pays extraction for the
+whole roster. This fills the feature store (see feature_store.py) ahead of
+time: templates from backend rosters, the staff gallery or a saved gallery
+file are decoded, validated and extracted across a process pool, and every
+matcher worker sharing FEATURE_STORE_DIR picks the results up on its next
+cache miss. Failed templates are listed so they can be re-enrolled.
+
+Run with:
+    python precompute_features.py --staff-id <staff id> --staff-id <staff id>
+    python precompute_features.py --file roster.json --engine sift --engine minutiae --output failures.json
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+import requests
+
+# Must be set before importing the server module (and is inherited by the
+# pool's workers) so no process runs the backend warm-up
+os.environ.setdefault('WARMUP_ON_STARTUP', '0')
+logging.basicConfig(level=logging.ERROR, format='%(asctime)s - %(levelname)s - %(message)s')
+
+import server
+
+
+def load_gallery_file(path):
+    """Records from a saved backend response ({'data': {'students': [...]}}), a JSON list or a binary gallery"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    records = server.parse_gallery_payload(data)
+    if isinstance(records, dict):
+        records = records.get('data', {}).get('students', [])
+    return records
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extract features for enrolled templates into the feature store")
+    parser.add_argument('--staff-id', action='append', default=[], help="Precompute this staff member's student roster from the backend (repeatable)")
+    parser.add_argument('--staff', action='store_true', help="Precompute the staff fingerprint gallery from the backend")
+    parser.add_argument('--file', action='append', default=[], help="Precompute student templates from a saved roster or gallery file (repeatable)")
+    parser.add_argument('--engine', action='append', choices=[server.ENGINE_SIFT, server.ENGINE_MINUTIAE],
+                        help="Engine to extract features for (repeatable; default: MATCH_ENGINE)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Worker processes (default: all cores)")
+    parser.add_argument('--output', help="Write the JSON report (summary and failures) here")
+    args = parser.parse_args(argv)
+
+    if not (args.staff_id or args.staff or args.file):
+        parser.error("nothing to precompute: pass --staff-id, --staff and/or --file")
+    if not server.FEATURE_STORE.enabled:
+        parser.error("the feature store is disabled (FEATURE_STORE=0)")
+
+    batches = []
+    try:
+        for staff_id in args.staff_id:
+            batches.append((f"roster {staff_id}", server.fetch_student_gallery(staff_id), 'student'))
+        if args.staff:
+            batches.append(('staff', *server.precompute_request_records({'staff': True})))
+    except requests.RequestException as e:
+        parser.exit(1, f"Failed to fetch templates from backend: {str(e)}\n")
+    for path in args.file:
+        batches.append((path, load_gallery_file(path), 'student'))
+
+    engines = tuple(args.engine or [server.DEFAULT_MATCH_ENGINE])
+    report = {'summary': {}, 'failures': []}
+    started = time.perf_counter()
+    for source, records, namespace in batches:
+        result = server.precompute_templates(records, namespace, engines, args.workers)
+        print(f"{source}: {len(records)} templates {result['summary']}", file=sys.stderr)
+        for status, count in result['summary'].items():
+            report['summary'][status] = report['summary'].get(status, 0) + count
+        report['failures'].extend({'source': source, **row} for row in result['failures'])
+
+    print(f"Precomputed {engines} features in {time.perf_counter() - started:.1f}s into {server.FEATURE_STORE.directory}: "
+          f"{report['summary']}, {len(report['failures'])} failures", file=sys.stderr)
+    for row in report['failures']:
+        print(f"  failed {row['source']} {row['id']} ({row['finger_type']}, {row['engine']}): {row['reason']}", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
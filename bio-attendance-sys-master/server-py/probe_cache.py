@@ -0,0 +1,139 @@
+"""
+Short-lived cache of recent identification results, for repeated probes.
+
+Students tap the reader twice and kiosks retry on timeouts, so the same
+finger is often identified against the same gallery a few seconds apart.
+Each probe gets a signature: a 64-bit difference hash (dHash) of the image
+plus a small normalized thumbnail. Those only see the print's overall shape,
+and different prints can come within the thresholds, so a probe that passes
+them is also checked against the recent probe's ORB descriptors: a repeat of
+the same scan (or a slightly shifted rescan) shares a good part of them,
+different prints share almost none. Only then does the probe get that
+probe's result back instead of a new gallery search. The descriptors are
+computed when a result is stored and, for a new probe, only once it passes
+the cheap checks.
+
+Entries are kept per scope and keyed by the caller (gallery version and
+search options), expire after a short window and are bounded per scope.
+"""
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+THUMBNAIL_SIZE = 32
+ORB_FEATURES = 64
+# Bits (of 256) by which two ORB descriptors may differ and still agree
+DESCRIPTOR_MAX_DISTANCE = 48
+
+
+def probe_signature(gray):
+    """(dhash, thumbnail, image) of a grayscale probe image"""
+    # dHash: is each pixel brighter than its right neighbour, on a 9x8 grid
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA).astype(np.int16)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    dhash = int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+    # Zero-mean, unit-norm thumbnail, so a dot product is the correlation
+    thumbnail = cv2.resize(gray, (THUMBNAIL_SIZE, THUMBNAIL_SIZE), interpolation=cv2.INTER_AREA).astype(np.float32).flatten()
+    thumbnail -= thumbnail.mean()
+    norm = np.linalg.norm(thumbnail)
+    if norm > 0:
+        thumbnail /= norm
+    return dhash, thumbnail, gray
+
+
+def probe_descriptors(gray):
+    """ORB descriptors of a grayscale probe image, or None if it has no keypoints"""
+    _, descriptors = cv2.ORB_create(nfeatures=ORB_FEATURES).detectAndCompute(gray, None)
+    return descriptors
+
+
+def descriptor_agreement(first, second):
+    """Fraction of the smaller descriptor set with a cross-checked match within DESCRIPTOR_MAX_DISTANCE"""
+    if first is None or second is None or not len(first) or not len(second):
+        return 0.0
+    matches = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True).match(first, second)
+    return sum(1 for match in matches if match.distance <= DESCRIPTOR_MAX_DISTANCE) / min(len(first), len(second))
+
+
+class RecentProbeCache:
+    """Time-windowed, per-scope cache of identification results for near-identical probes"""
+
+    def __init__(self, enabled=True, window_s=5.0, max_distance=6, min_correlation=0.95, min_descriptor_match=0.2,
+                 max_entries=32):
+        self.enabled = enabled
+        self.window_s = window_s
+        self.max_distance = max_distance
+        self.min_correlation = min_correlation
+        self.min_descriptor_match = min_descriptor_match
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'stored': 0}
+
+    def lookup(self, scope, key, signature):
+        """The result of a recent near-identical probe under the same scope and key, or None"""
+        if not self.enabled or signature is None:
+            return None
+
+        dhash, thumbnail, gray = signature
+        cutoff = time.time() - self.window_s
+        with self._lock:
+            candidates = []
+            # Newest first: a retry most likely repeats the last scan
+            for stored_at, entry_key, entry_hash, entry_thumbnail, entry_descriptors, result in reversed(self._entries.get(scope, ())):
+                if stored_at < cutoff:
+                    break
+                if (entry_key == key and bin(dhash ^ entry_hash).count('1') <= self.max_distance
+                        and float(np.dot(thumbnail, entry_thumbnail)) >= self.min_correlation):
+                    candidates.append((entry_descriptors, result))
+
+        # Outside the lock: ORB costs a few milliseconds per probe
+        descriptors = probe_descriptors(gray) if candidates else None
+        for entry_descriptors, result in candidates:
+            if descriptor_agreement(descriptors, entry_descriptors) >= self.min_descriptor_match:
+                with self._lock:
+                    self._counters['hits'] += 1
+                return result
+        with self._lock:
+            self._counters['misses'] += 1
+        return None
+
+    def store(self, scope, key, signature, result):
+        if not self.enabled or signature is None:
+            return
+
+        dhash, thumbnail, gray = signature
+        descriptors = probe_descriptors(gray)
+        now = time.time()
+        with self._lock:
+            entries = self._entries.setdefault(scope, deque(maxlen=self.max_entries))
+            entries.append((now, key, dhash, thumbnail, descriptors, result))
+            self._counters['stored'] += 1
+
+            # Drop scopes with nothing inside the window, so idle rosters don't accumulate
+            cutoff = now - self.window_s
+            for idle in [name for name, queued in self._entries.items() if queued[-1][0] < cutoff]:
+                del self._entries[idle]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            size = sum(len(entries) for entries in self._entries.values())
+            scopes = len(self._entries)
+        return {
+            'enabled': self.enabled,
+            'window_s': self.window_s,
+            'max_distance': self.max_distance,
+            'min_correlation': self.min_correlation,
+            'min_descriptor_match': self.min_descriptor_match,
+            'scopes': scopes,
+            'size': size,
+            **self._counters
+        }
@@ -0,0 +1,608 @@
+"""
+Sharding router for running several matcher instances as one service.
+
+One matcher host holds every roster's features in memory and runs every
+comparison on its own cores, which caps how many schools one deployment can
+serve. The router is a thin front-end with the matcher's routes that spreads
+the work over several matcher instances (shards):
+
+- Roster identification (/identify/fingerprint) is routed by consistent
+  hashing of the roster scope (the staff_id), so each roster's features are
+  cached on one shard only and a shard's cache holds just its share.
+- Staff identification is routed to the shard owning the staff gallery.
+- All-students identification (/identify/fingerprint/multi) is a cross-shard
+  search: the posted gallery is split by each student's owning shard, the
+  shards search their parts in parallel and the best match wins. Shards
+  search exhaustively: an early accept only weighs a shard's own part, and
+  could stop on a match that loses to a better one on another shard.
+- Cache invalidations are broadcast; stats are collected from every shard.
+
+Shards are added and drained at runtime (/router/shards). The hash ring uses
+virtual nodes, so a change only moves the scopes on the arcs the shard gains
+or loses; those rosters are warmed on their new owner through
+/templates/precompute, which with a shared FEATURE_STORE_DIR loads features
+from disk rather than extracting them again. Shards failing the health check
+are skipped until they recover.
+
+Run with:
+    MATCH_SHARDS=http://host-a:5050,http://host-b:5050 gunicorn -b 0.0.0.0:5050 router:APP
+    python router.py --local 3          # three local shard processes behind a router on :5050
+"""
+import argparse
+import atexit
+import bisect
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from flask import Flask, Response, jsonify, request
+from flask_cors import CORS
+
+from gallery_wire import GALLERY_MIMETYPE, GalleryFormatError, encode_gallery, is_gallery_stream, parse_gallery
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+MATCH_SHARDS = [url.strip().rstrip('/') for url in os.environ.get('MATCH_SHARDS', '').split(',') if url.strip()]
+RING_VNODES = int(os.environ.get('ROUTER_VNODES', 64))
+ROUTER_TIMEOUT_S = float(os.environ.get('ROUTER_TIMEOUT_S', 120))
+HEALTH_INTERVAL_S = float(os.environ.get('ROUTER_HEALTH_INTERVAL_S', 5))
+# Rosters routed recently, which are re-warmed on their new owner when shards change
+RECENT_SCOPES_MAX = int(os.environ.get('ROUTER_RECENT_SCOPES', 1000))
+
+STAFF_SCOPE = 'staff'
+# The matcher's search mode without early accept, for fanned-out searches
+SEARCH_MODE_EXHAUSTIVE = 'exhaustive'
+# Headers a shard needs to see as the caller sent them
+FORWARDED_HEADERS = ('X-Request-Id', 'X-Request-Timeout-Ms', 'X-Match-Budget-Ms')
+
+SHARD_COMMAND = [sys.executable, '-c',
+                 "import os, server; server.APP.run(host='127.0.0.1', port=int(os.environ['MATCH_SHARD_PORT']), threaded=True)"]
+
+
+class HashRing:
+    """Consistent hash ring of shard URLs with virtual nodes"""
+
+    def __init__(self, nodes=(), vnodes=RING_VNODES):
+        self.vnodes = vnodes
+        self.nodes = []
+        self._points = []
+        self._owners = []
+        for node in nodes:
+            self.add(node)
+
+    @staticmethod
+    def _hash(key):
+        return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big')
+
+    def _rebuild(self):
+        points = sorted((self._hash(f"{node}#{replica}"), node) for node in self.nodes for replica in range(self.vnodes))
+        self._points = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+
+    def add(self, node):
+        if node not in self.nodes:
+            self.nodes.append(node)
+            self._rebuild()
+
+    def remove(self, node):
+        if node in self.nodes:
+            self.nodes.remove(node)
+            self._rebuild()
+
+    def lookup(self, key, exclude=()):
+        """Owner of `key`: the first node clockwise of its hash that isn't excluded"""
+        if not self._points:
+            return None
+        start = bisect.bisect(self._points, self._hash(key))
+        for step in range(len(self._points)):
+            owner = self._owners[(start + step) % len(self._points)]
+            if owner not in exclude:
+                return owner
+        return None
+
+
+class ShardUnavailable(Exception):
+    """Raised when no healthy shard can take a request"""
+
+
+class ShardPool:
+    """The ring plus shard health and the rosters routed recently"""
+
+    def __init__(self, shards, vnodes=RING_VNODES):
+        self.ring = HashRing(shards, vnodes)
+        self.unhealthy = set()
+        self.draining = set()
+        self.recent_scopes = OrderedDict()
+        self.lock = threading.Lock()
+
+    def owner(self, scope):
+        with self.lock:
+            owner = self.ring.lookup(scope, self.unhealthy)
+            if scope.startswith('roster:'):
+                self.recent_scopes[scope] = True
+                self.recent_scopes.move_to_end(scope)
+                while len(self.recent_scopes) > RECENT_SCOPES_MAX:
+                    self.recent_scopes.popitem(last=False)
+        if owner is None:
+            raise ShardUnavailable("No healthy matcher shard available")
+        return owner
+
+    def healthy(self):
+        with self.lock:
+            return [node for node in self.ring.nodes if node not in self.unhealthy]
+
+    def all(self):
+        """Every shard in the ring plus shards still draining"""
+        with self.lock:
+            return self.ring.nodes + sorted(self.draining)
+
+    def _owners(self):
+        return {scope: self.ring.lookup(scope, self.unhealthy) for scope in self.recent_scopes}
+
+    def add(self, node):
+        """Add a shard; returns the recent roster scopes it now owns"""
+        with self.lock:
+            before = self._owners()
+            self.ring.add(node)
+            self.draining.discard(node)
+            return [scope for scope, owner in self._owners().items() if owner != before[scope]]
+
+    def drain(self, node, forget=False):
+        """
+        Stop routing to a shard; returns {scope: new owner} for the recent
+        roster scopes it owned. Unless `forget`, it stays on the draining list.
+        Raises LookupError for an unknown shard and ValueError for the last
+        shard in the ring.
+        """
+        with self.lock:
+            if node not in self.ring.nodes and node not in self.draining:
+                raise LookupError("Unknown shard")
+            if self.ring.nodes == [node]:
+                raise ValueError("Cannot drain the last shard")
+            before = self._owners()
+            self.ring.remove(node)
+            self.unhealthy.discard(node)
+            if forget:
+                self.draining.discard(node)
+            else:
+                self.draining.add(node)
+            after = self._owners()
+            return {scope: owner for scope, owner in after.items() if before[scope] == node and owner}
+
+    def check_health(self):
+        for node in self.all():
+            try:
+                healthy = requests.get(f"{node}/", timeout=2).ok
+            except requests.RequestException:
+                healthy = False
+            with self.lock:
+                if healthy and node in self.unhealthy:
+                    logging.info(f"Shard {node} is healthy again")
+                    self.unhealthy.discard(node)
+                elif not healthy and node not in self.unhealthy and node not in self.draining:
+                    logging.warning(f"Shard {node} failed its health check, routing around it")
+                    self.unhealthy.add(node)
+
+    def stats(self):
+        with self.lock:
+            owned = {}
+            for scope in self.recent_scopes:
+                owner = self.ring.lookup(scope, self.unhealthy)
+                owned[owner] = owned.get(owner, 0) + 1
+            return [{
+                'url': node,
+                'healthy': node not in self.unhealthy,
+                'draining': node in self.draining,
+                'recent_rosters': owned.get(node, 0)
+            } for node in self.ring.nodes + sorted(self.draining)]
+
+
+def roster_scope(staff_id):
+    return f"roster:{staff_id}"
+
+
+def student_scope(student_id):
+    return f"student:{student_id}"
+
+
+def forward_headers(request_id):
+    headers = {name: request.headers[name] for name in FORWARDED_HEADERS if name in request.headers}
+    headers['X-Request-Id'] = request_id
+    return headers
+
+
+def request_parts():
+    """The incoming multipart request as (form fields, file parts) to re-post to a shard"""
+    form = request.form.to_dict()
+    files = {}
+    for name, upload in request.files.items():
+        files[name] = (upload.filename or name, upload.read(), upload.mimetype)
+    return form, files
+
+
+def call_shard(method, url, **kwargs):
+    """Request a shard endpoint; returns (status code, JSON body)"""
+    response = requests.request(method, url, timeout=kwargs.pop('timeout', ROUTER_TIMEOUT_S), **kwargs)
+    try:
+        return response.status_code, response.json()
+    except ValueError:
+        return response.status_code, {"status": "error", "message": response.text[:200]}
+
+
+def proxy(shard, path):
+    """Pass the current request through to a shard unchanged"""
+    response = requests.request(request.method, f"{shard}{path}", params=request.args, data=request.get_data(),
+                                headers={'Content-Type': request.content_type or '',
+                                         **forward_headers(request.headers.get('X-Request-Id') or uuid.uuid4().hex)},
+                                timeout=ROUTER_TIMEOUT_S)
+    return Response(response.content, response.status_code, content_type=response.headers.get('Content-Type'))
+
+
+def read_gallery_part(form, files, field_name):
+    """Gallery records posted as a JSON field or binary file part, and whether they were binary"""
+    if field_name in files:
+        data = files[field_name][1]
+        if is_gallery_stream(data):
+            return parse_gallery(data), True
+        return json.loads(data), False
+    if not form.get(field_name):
+        return None, False
+    return json.loads(form[field_name]), False
+
+
+def write_gallery_part(form, files, field_name, records, binary):
+    """
+    Copies of form/files carrying `records` under `field_name`, in the format
+    they arrived in. JSON goes in a file part as well, which the matcher
+    accepts and which isn't subject to the form field size limit.
+    """
+    form, files = dict(form), dict(files)
+    form.pop(field_name, None)
+    if binary:
+        files[field_name] = (field_name, encode_gallery(records), GALLERY_MIMETYPE)
+    else:
+        files[field_name] = (field_name, json.dumps(records).encode('utf-8'), 'application/json')
+    return form, files
+
+
+def partition_gallery(records, pool):
+    """{shard: [records]} by each record's owning shard"""
+    partitions = {}
+    for record in records:
+        partitions.setdefault(pool.owner(student_scope(record.get('id'))), []).append(record)
+    return partitions
+
+
+def merge_multi_results(results, sizes):
+    """
+    Merge per-shard multi-identification responses: the highest-confidence
+    match wins, counters add up and coverage is weighted by partition size.
+    """
+    answered = {shard: body for shard, (code, body) in results.items() if code == 200 and body.get('status') == 'success'}
+    matched = [body for body in answered.values() if body.get('student_id')]
+    best = max(matched or answered.values(), key=lambda body: body.get('confidence') or 0)
+    total = sum(sizes.values()) or 1
+    failed = [shard for shard in results if shard not in answered]
+    return {
+        **best,
+        "message": "Multi-fingerprint identification completed successfully",
+        "student_id": best.get('student_id') if matched else None,
+        "templates_evaluated": sum(body.get('templates_evaluated', 0) for body in answered.values()),
+        "early_accepted": any(body.get('early_accepted') for body in answered.values()),
+        "finger_fallback": any(body.get('finger_fallback') for body in answered.values()),
+        "course_fallback": any(body.get('course_fallback') for body in answered.values()),
+        "repeated_probe": all(body.get('repeated_probe') for body in answered.values()),
+        "exhaustive": not failed and all(body.get('exhaustive') for body in answered.values()),
+        "coverage": round(sum(body.get('coverage', 0) * sizes[shard] for shard, body in answered.items()) / total, 4),
+        "budget_exhausted": any(body.get('budget_exhausted') for body in answered.values()),
+        "shards": len(results),
+        "shard_errors": [{"shard": shard, "status_code": results[shard][0],
+                          "message": results[shard][1].get('message')} for shard in failed]
+    }
+
+
+def gather(shards, call):
+    """Run call(shard) on every shard in parallel; returns {shard: result}, errors as (502, body)"""
+    def guarded(shard):
+        try:
+            return call(shard)
+        except requests.RequestException as e:
+            logging.error(f"Shard {shard} request failed: {str(e)}")
+            return 502, {"status": "error", "message": f"Shard unreachable: {str(e)}"}
+
+    if not shards:
+        return {}
+    with ThreadPoolExecutor(max_workers=len(shards)) as executor:
+        return dict(zip(shards, executor.map(guarded, shards)))
+
+
+def warm_scopes(moves):
+    """Precompute moved rosters on their new owners, off the request path"""
+    def run():
+        for scope, shard in moves.items():
+            staff_id = scope.split(':', 1)[1]
+            try:
+                requests.post(f"{shard}/templates/precompute", json={'staff_id': staff_id}, timeout=ROUTER_TIMEOUT_S)
+                logging.info(f"Warmed roster {staff_id} on {shard}")
+            except requests.RequestException as e:
+                logging.warning(f"Failed to warm roster {staff_id} on {shard}: {str(e)}")
+
+    if moves:
+        threading.Thread(target=run, name='router-warm', daemon=True).start()
+
+
+def start_health_checks(pool, interval=HEALTH_INTERVAL_S):
+    def run():
+        while True:
+            time.sleep(interval)
+            pool.check_health()
+
+    threading.Thread(target=run, name='router-health', daemon=True).start()
+
+
+def create_app(shards=None):
+    app = Flask(__name__)
+    CORS(app)
+    pool = ShardPool(MATCH_SHARDS if shards is None else shards)
+    app.config['SHARD_POOL'] = pool
+    start_health_checks(pool)
+
+    @app.before_request
+    def buffer_body():
+        # Read the raw body before anything parses the form, so it can still be proxied as sent
+        request.get_data()
+
+    @app.errorhandler(ShardUnavailable)
+    def shard_unavailable(e):
+        return jsonify({"status": "error", "message": str(e)}), 503
+
+    @app.route('/')
+    def index():
+        # Same body as a matcher's, for health checks pointed at either
+        return jsonify({"status": "success"})
+
+    @app.route('/identify/fingerprint', methods=['POST'])
+    def identify_fingerprint_endpoint():
+        """Route roster identification to the shard owning the staff member's roster"""
+        staff_id = request.form.get('staff_id')
+        if not staff_id:
+            return jsonify({"status": "error", "message": "Staff ID is required"}), 400
+        try:
+            return proxy(pool.owner(roster_scope(staff_id)), request.path)
+        except requests.RequestException as e:
+            logging.error(f"Shard request failed for roster {staff_id}: {str(e)}")
+            return jsonify({"status": "error", "message": "Matcher shard unavailable"}), 502
+
+    @app.route('/identify/staff-fingerprint', methods=['POST'])
+    def identify_staff_fingerprint_endpoint():
+        """Route staff identification to the shard owning the staff gallery"""
+        try:
+            return proxy(pool.owner(STAFF_SCOPE), request.path)
+        except requests.RequestException as e:
+            logging.error(f"Shard request failed for staff identification: {str(e)}")
+            return jsonify({"status": "error", "message": "Matcher shard unavailable"}), 502
+
+    @app.route('/identify/fingerprint/multi', methods=['POST'])
+    def identify_fingerprint_multi_endpoint():
+        """Search every shard's part of the posted gallery in parallel and return the best match"""
+        try:
+            if 'file' not in request.files:
+                return jsonify({"status": "error", "message": "No file part"}), 400
+            form, files = request_parts()
+            form['search_mode'] = SEARCH_MODE_EXHAUSTIVE
+            try:
+                records, binary = read_gallery_part(form, files, 'fingerprints_data')
+            except (ValueError, GalleryFormatError) as e:
+                logging.error(f"Failed to parse fingerprints data: {str(e)}")
+                return jsonify({"status": "error", "message": "Invalid fingerprints data format"}), 400
+            if records is None:
+                return jsonify({"status": "error", "message": "No fingerprints data provided"}), 400
+            if not records:
+                return jsonify({"status": "error", "message": "No students found with fingerprints"}), 404
+
+            request_id = request.headers.get('X-Request-Id') or uuid.uuid4().hex
+            partitions = partition_gallery(records, pool)
+            # The fan-out threads have no request context: everything they send is built here
+            path, headers = request.path, forward_headers(request_id)
+            bodies = {shard: write_gallery_part(form, files, 'fingerprints_data', part, binary)
+                      for shard, part in partitions.items()}
+            results = gather(list(partitions), lambda shard: call_shard(
+                'POST', f"{shard}{path}", data=bodies[shard][0], files=bodies[shard][1], headers=headers))
+
+            # A rejected probe is rejected by every shard alike
+            for code, body in results.values():
+                if code == 422:
+                    return jsonify(body), 422
+            if not any(code == 200 for code, _ in results.values()):
+                shed = all(code == 503 for code, _ in results.values())
+                return jsonify({
+                    "status": "error",
+                    "message": "Matcher shards are busy" if shed else "No matcher shard could complete the search",
+                    "shard_errors": [{"shard": shard, "status_code": code, "message": body.get('message')}
+                                     for shard, (code, body) in results.items()]
+                }), 503 if shed else 502
+
+            merged = merge_multi_results(results, {shard: len(part) for shard, part in partitions.items()})
+            logging.info(f"Request {request_id}: searched {len(records)} templates on {len(partitions)} shards, "
+                         f"best {merged.get('student_id')} at {merged.get('confidence', 0):.2f}%")
+            return jsonify(merged)
+        except Exception as e:
+            logging.error(f"Unexpected error routing multi identification: {str(e)}")
+            return jsonify({"status": "error", "message": "Internal server error"}), 500
+
+    @app.route('/invalidate-cache', methods=['POST'])
+    @app.route('/invalidate-cache/<path:target>', methods=['POST'])
+    def invalidate_cache_endpoint(target=None):
+        """Broadcast a cache invalidation to every shard, draining ones included"""
+        path, params, body = request.path, request.args.to_dict(), request.get_data()
+        headers = {'Content-Type': request.content_type or 'application/json'}
+        results = gather(pool.all(), lambda shard: call_shard('POST', f"{shard}{path}", params=params,
+                                                              data=body, headers=headers))
+        failed = {shard: body for shard, (code, body) in results.items() if code != 200}
+        if failed and len(failed) == len(results):
+            return jsonify({"status": "error", "message": "Failed to invalidate cache", "shards": failed}), 502
+        return jsonify({
+            "status": "success",
+            "message": "Cache invalidated",
+            "shards": {shard: body for shard, (_, body) in results.items()}
+        })
+
+    def collect(path):
+        params = request.args.to_dict()
+        results = gather(pool.all(), lambda shard: call_shard('GET', f"{shard}{path}", params=params, timeout=10))
+        return {shard: body for shard, (_, body) in results.items()}
+
+    @app.route('/cache/stats', methods=['GET'])
+    def cache_stats_endpoint():
+        """Every shard's feature cache stats"""
+        return jsonify({"status": "success", "shards": collect('/cache/stats')})
+
+    @app.route('/admission/stats', methods=['GET'])
+    def admission_stats_endpoint():
+        """Every shard's admission stats"""
+        return jsonify({"status": "success", "shards": collect('/admission/stats')})
+
+    @app.route('/templates/repairs', methods=['GET'])
+    def template_repairs_endpoint():
+        """Every shard's template repair report"""
+        return jsonify({"status": "success", "shards": collect('/templates/repairs')})
+
+    @app.route('/templates/precompute', methods=['POST'])
+    def precompute_templates_endpoint():
+        """Precompute a roster on the shard that owns it (anything else on any shard, the store is shared)"""
+        body = request.get_json(silent=True) or request.form.to_dict()
+        staff_id = body.get('staff_id')
+        shard = pool.owner(roster_scope(staff_id) if staff_id else STAFF_SCOPE)
+        try:
+            return proxy(shard, request.path)
+        except requests.RequestException as e:
+            logging.error(f"Shard request failed for precompute: {str(e)}")
+            return jsonify({"status": "error", "message": "Matcher shard unavailable"}), 502
+
+    @app.route('/diagnostics/probes/<request_id>', methods=['GET'])
+    @app.route('/diagnostics/probes/<request_id>/image', methods=['GET'])
+    def diagnostics_probe_endpoint(request_id):
+        """Find a captured probe on whichever shard handled the request"""
+        for shard in pool.healthy():
+            try:
+                response = requests.get(f"{shard}{request.path}", timeout=10)
+            except requests.RequestException:
+                continue
+            if response.status_code == 200:
+                return Response(response.content, 200, content_type=response.headers.get('Content-Type'))
+        return jsonify({"status": "error", "message": "No capture for this request"}), 404
+
+    @app.route('/verify/fingerprint', methods=['GET', 'POST'])
+    @app.route('/quality/fingerprint', methods=['POST'])
+    @app.route('/templates/extract', methods=['POST'])
+    @app.route('/diagnostics/probes', methods=['GET'])
+    def stateless_endpoint():
+        """Requests that need no cached gallery go to any healthy shard"""
+        try:
+            return proxy(pool.owner(uuid.uuid4().hex), request.path)
+        except requests.RequestException as e:
+            logging.error(f"Shard request failed for {request.path}: {str(e)}")
+            return jsonify({"status": "error", "message": "Matcher shard unavailable"}), 502
+
+    @app.route('/router/shards', methods=['GET'])
+    def list_shards_endpoint():
+        """List shards with their health and how many recent rosters each owns"""
+        return jsonify({"status": "success", "shards": pool.stats()})
+
+    @app.route('/router/shards', methods=['POST'])
+    def add_shard_endpoint():
+        """Add a shard ({'url': ...}); rosters moving to it are warmed in the background"""
+        url = ((request.get_json(silent=True) or {}).get('url') or '').rstrip('/')
+        if not url:
+            return jsonify({"status": "error", "message": "Shard url is required"}), 400
+        try:
+            requests.get(f"{url}/", timeout=5).raise_for_status()
+        except requests.RequestException as e:
+            return jsonify({"status": "error", "message": f"Shard is not reachable: {str(e)}"}), 400
+        moved = pool.add(url)
+        warm_scopes({scope: url for scope in moved})
+        logging.info(f"Added shard {url}; {len(moved)} recent rosters moved to it")
+        return jsonify({"status": "success", "shard": url, "moved_rosters": len(moved), "shards": pool.stats()})
+
+    @app.route('/router/shards', methods=['DELETE'])
+    def drain_shard_endpoint():
+        """
+        Drain a shard ({'url': ...}): no new requests are routed to it, its
+        rosters are warmed on their new owners and it keeps receiving cache
+        invalidations until ?forget=1 removes it for good.
+        """
+        url = ((request.get_json(silent=True) or {}).get('url') or request.args.get('url') or '').rstrip('/')
+        try:
+            moves = pool.drain(url, forget=request.args.get('forget') == '1')
+        except LookupError as e:
+            return jsonify({"status": "error", "message": str(e)}), 404
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        warm_scopes(moves)
+        logging.info(f"Drained shard {url}; {len(moves)} recent rosters moved off it")
+        return jsonify({"status": "success", "shard": url, "moved_rosters": len(moves), "shards": pool.stats()})
+
+    return app
+
+
+def spawn_local_shards(count, base_port):
+    """Start `count` matcher processes on consecutive ports; returns their URLs once they answer"""
+    processes, urls = [], []
+    for index in range(count):
+        port = base_port + index
+        env = {**os.environ, 'MATCH_SHARD_PORT': str(port)}
+        processes.append(subprocess.Popen(SHARD_COMMAND, env=env, cwd=os.path.dirname(os.path.abspath(__file__))))
+        urls.append(f"http://127.0.0.1:{port}")
+
+    atexit.register(lambda: [process.terminate() for process in processes])
+    deadline = time.time() + 120
+    for process, url in zip(processes, urls):
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"Shard {url} exited with code {process.returncode}")
+            try:
+                if requests.get(f"{url}/", timeout=1).ok:
+                    break
+            except requests.RequestException:
+                pass
+            if time.time() > deadline:
+                raise RuntimeError(f"Shard {url} did not come up")
+            time.sleep(0.5)
+    return urls
+
+
+def __getattr__(name):
+    # router:APP for gunicorn, built on first access so `python router.py`
+    # doesn't start a second pool and health checker next to its own
+    global APP
+    if name == 'APP':
+        APP = create_app()
+        return APP
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Route matcher requests across several matcher shards")
+    parser.add_argument('--shard', action='append', default=[], help="Shard URL (repeatable; default: MATCH_SHARDS)")
+    parser.add_argument('--local', type=int, default=0, help="Start this many local shard processes")
+    parser.add_argument('--base-port', type=int, default=5061, help="First port for --local shards")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5050)
+    args = parser.parse_args()
+
+    shards = [url.rstrip('/') for url in args.shard] or list(MATCH_SHARDS)
+    if args.local:
+        shards += spawn_local_shards(args.local, args.base_port)
+    if not shards:
+        parser.error("no shards: pass --shard, --local or set MATCH_SHARDS")
+    logging.info(f"Routing across {len(shards)} shards: {', '.join(shards)}")
+    create_app(shards).run(host=args.host, port=args.port, threaded=True)
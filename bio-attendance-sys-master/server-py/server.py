@@ -4,26 +4,211 @@ import json
 import re
 import time
 import threading
+import multiprocessing
+import zlib
+import functools
+import hashlib
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 from flask import (
     Flask,
+    g,
     jsonify,
     flash,
     request,
     redirect,
-    abort
+    abort,
+    send_file
 )
-from werkzeug.utils import secure_filename
 import cv2
 import numpy as np
 from flask_cors import CORS
 import requests
 import logging
+from diagnostics import ProbeStore
+from feature_store import FeatureStore
+from feature_template import TEMPLATE_MIMETYPE, parse_template, serialize_minutiae, serialize_sift
+from probe_cache import RecentProbeCache, probe_signature
+from gallery_snapshot import SnapshotStore
+from gallery_wire import GALLERY_MIMETYPE, GalleryFormatError, is_gallery_stream, parse_gallery
+import minutiae
+from admission import AdmissionController, AdmissionRejected, PRIORITY_STAFF, PRIORITY_STUDENT
+from segmentation import segment_fingerprint
+from fingerprint_quality import (
+    REASON_TOO_FEW_FEATURES,
+    REASON_UNREADABLE,
+    ProbeQualityError,
+    assess_image,
+    assess_keypoints,
+    assess_quality,
+    to_grayscale
+)
 
-# Global cache for SIFT features
-FEATURE_CACHE = {}
-CACHE_TIMESTAMP = time.time()
+# Cached template features, held as immutable per-scope snapshots that
+# searches read without locking (see gallery_snapshot.py)
 CACHE_TTL = 3600  # 1 hour cache TTL
-CACHE_LOCK = threading.Lock()
+GALLERY_SNAPSHOTS = SnapshotStore(CACHE_TTL)
+
+# Feature extractions currently running, keyed by (cache_key, generation).
+# Concurrent misses for the same key wait on the first request's future
+# instead of running the same SIFT extraction again.
+INFLIGHT_FEATURES = {}
+INFLIGHT_LOCK = threading.Lock()
+# Updated without a lock, so the counts are approximate under contention
+CACHE_COUNTERS = {
+    'hits': 0,
+    'misses': 0,
+    'coalesced': 0
+}
+
+# Generation counters shared by every worker process. The array lives in an
+# anonymous shared mapping created at import time, so under a pre-forking
+# server (gunicorn with preload_app) all workers inherit the same memory and
+# an invalidation handled by one worker is seen by the others on their next
+# cache lookup. Owners (a student, one of their fingers, a staff member, a
+# roster scope) hash onto slots; each cache entry records the generations of
+# the slots it depends on, so invalidating any owner is a single increment
+# and never scans the cache. A collision only causes a recompute.
+# Invalidating a single owner also advances the recent-probe slot, since the
+# owner may belong to any scope's gallery.
+# An invalidation sets its slot to the next tick of a shared clock rather than
+# incrementing it, so a slot's value also orders it against entries stamped
+# with the clock when they were extracted.
+GENERATION_SLOTS = 4096
+GLOBAL_GENERATION_SLOT = GENERATION_SLOTS
+RECENT_PROBES_GENERATION_SLOT = GENERATION_SLOTS + 1
+GENERATION_CLOCK_SLOT = GENERATION_SLOTS + 2
+CACHE_GENERATIONS = multiprocessing.RawArray('Q', GENERATION_SLOTS + 3)
+GENERATION_LOCK = multiprocessing.Lock()
+
+BACKEND_URL = os.environ.get('BACKEND_URL', "http://localhost:5005")
+
+# Admission control for identification requests: at most ADMISSION_MAX_ACTIVE
+# run at once, up to ADMISSION_MAX_QUEUE wait, and a request waits at most its
+# deadline (X-Request-Timeout-Ms header, else ADMISSION_TIMEOUT_S) before it is
+# shed with a 503. Staff login outranks student scans in the queue.
+ADMISSION_MAX_ACTIVE = int(os.environ.get('ADMISSION_MAX_ACTIVE', os.cpu_count() or 1))
+ADMISSION_MAX_QUEUE = int(os.environ.get('ADMISSION_MAX_QUEUE', 32))
+ADMISSION_TIMEOUT_S = float(os.environ.get('ADMISSION_TIMEOUT_S', 10))
+ADMISSION = AdmissionController(ADMISSION_MAX_ACTIVE, ADMISSION_MAX_QUEUE)
+
+# Ordered search: candidates are tried in order of a per-scope recency prior
+# (recent successful matches, halving in weight every MATCH_PRIOR_HALF_LIFE_S)
+# and the search stops once the best score reaches EARLY_ACCEPT_SCORE with
+# EARLY_ACCEPT_MARGIN over the runner-up so far. Requests choose the mode with
+# a 'search_mode' form field; SEARCH_MODE sets the default.
+SEARCH_MODE_EXHAUSTIVE = 'exhaustive'
+SEARCH_MODE_ORDERED = 'ordered'
+DEFAULT_SEARCH_MODE = os.environ.get('SEARCH_MODE', SEARCH_MODE_EXHAUSTIVE)
+EARLY_ACCEPT_SCORE = float(os.environ.get('EARLY_ACCEPT_SCORE', 60.0))
+EARLY_ACCEPT_MARGIN = float(os.environ.get('EARLY_ACCEPT_MARGIN', 20.0))
+# Latency budget for identification (budget_ms field or X-Match-Budget-Ms
+# header; 0 = none). When it runs out the search returns its best match so far
+# if that is a confident one, else no match with budget_exhausted set.
+DEFAULT_MATCH_BUDGET_MS = float(os.environ.get('MATCH_BUDGET_MS', 0))
+MATCH_PRIOR_HALF_LIFE_S = float(os.environ.get('MATCH_PRIOR_HALF_LIFE_S', 24 * 3600))
+MATCH_PRIOR_MAX_ENTRIES = 10000
+MATCH_PRIOR = {}
+MATCH_PRIOR_LOCK = threading.Lock()
+
+# Template validation/repair verdicts keyed by payload digest. A healthy or
+# repaired template is checked once per worker rather than once per scan; an
+# irreparable one is retried only after REPAIR_IRREPARABLE_TTL_S.
+REPAIR_OK = 'ok'
+REPAIR_REPAIRED = 'repaired'
+REPAIR_IRREPARABLE = 'irreparable'
+REPAIR_CACHE = {}
+REPAIR_CACHE_LOCK = threading.Lock()
+REPAIR_CACHE_MAX_ENTRIES = int(os.environ.get('REPAIR_CACHE_MAX_ENTRIES', 20000))
+REPAIR_IRREPARABLE_TTL_S = float(os.environ.get('REPAIR_IRREPARABLE_TTL_S', 6 * 3600))
+REPAIR_COUNTERS = {
+    'hits': 0,
+    'misses': 0
+}
+
+# Matching engines: 'sift' matches whole-image SIFT descriptors with FLANN;
+# 'minutiae' matches compact ridge ending/bifurcation templates (minutiae.py).
+# Requests choose with an 'engine' form field; MATCH_ENGINE sets the default.
+# Minutiae scores run on the same 0-100 scale but are calibrated differently,
+# so that engine has its own acceptance threshold.
+ENGINE_SIFT = 'sift'
+ENGINE_MINUTIAE = 'minutiae'
+DEFAULT_MATCH_ENGINE = os.environ.get('MATCH_ENGINE', ENGINE_SIFT)
+MINUTIAE_MIN_SCORE = float(os.environ.get('MINUTIAE_MIN_SCORE', 20.0))
+# SIFT acceptance thresholds; evaluate_matcher.py reports FAR/FRR at these
+STUDENT_MATCH_THRESHOLD = 5.0
+STAFF_MATCH_THRESHOLD = 20.0
+
+# FLANN index/search parameters and the ratio-test threshold for SIFT
+# matching. tune_matcher.py writes per-gallery-size parameter sets to
+# MATCHER_PARAMS_FILE, loaded at startup; without it these defaults apply.
+DEFAULT_MATCHER_PARAMS = {'trees': 5, 'checks': 100, 'ratio': 0.9}
+MATCHER_PARAMS_FILE = os.environ.get('MATCHER_PARAMS_FILE', 'matcher_params.json')
+
+# Crop SIFT extraction to the ridge region (see segmentation.py), for probes
+# and enrolled templates alike
+SIFT_SEGMENTATION = os.environ.get('SIFT_SEGMENTATION', '1') != '0'
+
+# Feature extraction versions, stamped into the feature templates the
+# backend stores (see feature_template.py) and expected as the template
+# version of precomputed features in the binary gallery framing. Bump an
+# engine's version when its extraction changes: stored templates fall back to
+# their images, and precomputed features and feature store entries of the old
+# version are ignored.
+TEMPLATE_EXTRACTOR_VERSIONS = {ENGINE_SIFT: 1, ENGINE_MINUTIAE: 1}
+
+# Fingers a multi-finger gallery can be partitioned by (the kiosk's finger_type hint)
+FINGER_TYPES = ('thumb', 'index', 'middle', 'ring', 'pinky')
+
+# Reject blank, smudged and partial probes before searching the gallery
+PROBE_QUALITY_GATE = os.environ.get('PROBE_QUALITY_GATE', '1') != '0'
+
+# Student rosters to warm at startup (comma-separated staff IDs). Under the
+# production server this runs in the master before workers are forked.
+WARMUP_STAFF_IDS = [s for s in os.environ.get('WARMUP_STAFF_IDS', '').split(',') if s.strip()]
+# Diagnostic capture of scanned probes (see diagnostics.py): a sampled,
+# size- and age-capped ring buffer written by a background thread
+PROBE_STORE = ProbeStore(
+    os.environ.get('PROBE_CAPTURE_DIR', os.path.join('fingerprints', 'diagnostics')),
+    enabled=os.environ.get('PROBE_CAPTURE', '1') != '0',
+    sample_rate=float(os.environ.get('PROBE_CAPTURE_SAMPLE_RATE', 1.0)),
+    max_bytes=int(float(os.environ.get('PROBE_CAPTURE_MAX_MB', 200)) * 1024 * 1024),
+    max_age_s=float(os.environ.get('PROBE_CAPTURE_MAX_AGE_H', 72)) * 3600
+)
+
+# Repeated probes (double taps, kiosk retries) within a few seconds get the
+# previous result back (see probe_cache.py)
+RECENT_PROBES = RecentProbeCache(
+    enabled=os.environ.get('PROBE_DEDUP', '1') != '0',
+    window_s=float(os.environ.get('PROBE_DEDUP_WINDOW_S', 5.0)),
+    max_distance=int(os.environ.get('PROBE_DEDUP_MAX_DISTANCE', 6)),
+    min_correlation=float(os.environ.get('PROBE_DEDUP_MIN_CORRELATION', 0.95)),
+    min_descriptor_match=float(os.environ.get('PROBE_DEDUP_MIN_DESCRIPTOR_MATCH', 0.2))
+)
+
+# Extracted features by template digest (see feature_store.py), filled by
+# bulk precompute jobs and read on feature cache misses
+FEATURE_STORE = FeatureStore(
+    os.environ.get('FEATURE_STORE_DIR', os.path.join('fingerprints', 'features')),
+    enabled=os.environ.get('FEATURE_STORE', '1') != '0'
+)
+PRECOMPUTE_WORKERS = int(os.environ.get('PRECOMPUTE_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+# Precompute runs from request handlers while other threads hold locks, and
+# a forked child would inherit them held; workers are spawned from a fresh
+# interpreter instead
+PRECOMPUTE_MP_CONTEXT = multiprocessing.get_context('spawn')
+
+# Probe decode and feature extraction run on this pool while an identify
+# request fetches or parses its gallery, taking SIFT off the critical path.
+# Threads start on first use, so none exist yet when gunicorn forks. The ASGI
+# app uses its own bounded CPU pool instead (see asgi.start_probe).
+PROBE_WORKERS = int(os.environ.get('PROBE_WORKERS', os.cpu_count() or 1))
+PROBE_EXECUTOR = ThreadPoolExecutor(max_workers=PROBE_WORKERS, thread_name_prefix='probe')
+
+# Offline tools that import this module set WARMUP_ON_STARTUP=0 to skip the backend warm-up;
+# spawned precompute workers, which import it too (already named when they do), never warm up
+WARMUP_ON_STARTUP = (os.environ.get('WARMUP_ON_STARTUP', '1') != '0'
+                     and multiprocessing.current_process().name == 'MainProcess')
 
 # Try to import PIL for image processing
 try:
@@ -71,99 +256,482 @@ def clean_base64(base64_string):
 
     return base64_string
 
-def compute_sift_features(image):
-    """Compute SIFT features for an image and return keypoints and descriptors"""
+def decode_fingerprint_payload(payload):
+    """
+    Return raw image bytes for a gallery template payload.
+    Accepts the legacy base64 string (optionally a data URL) or the raw
+    bytes/memoryview produced by the binary gallery framing, which is passed
+    through without copying.
+    """
+    if isinstance(payload, (bytes, bytearray, memoryview)):
+        return payload
+    return base64.b64decode(clean_base64(payload))
+
+def parse_gallery_payload(data):
+    """Parse posted gallery records, either a binary gallery stream or JSON"""
+    if isinstance(data, (bytes, bytearray, memoryview)) and is_gallery_stream(data):
+        return parse_gallery(data)
+    return json.loads(data)
+
+def read_gallery_payload(field_name):
+    """
+    Read gallery records posted under `field_name`.
+    The field may be a JSON form value (base64 templates) or a file part
+    holding a binary gallery stream. Returns None if the field is missing;
+    raises ValueError if it cannot be parsed.
+    """
+    if field_name in request.files:
+        return parse_gallery_payload(request.files[field_name].read())
+
+    payload_json = request.form.get(field_name)
+    if not payload_json:
+        return None
+    return parse_gallery_payload(payload_json)
+
+def parse_student_gallery_response(content_type, body):
+    """Parse a backend roster response, which may use the binary gallery framing instead of base64-in-JSON"""
+    if content_type.startswith(GALLERY_MIMETYPE):
+        return parse_gallery(body)
+    return json.loads(body).get('data', {}).get('students', [])
+
+def get_record_features(record, namespace='student', finger_type=None, scope=None, engine=ENGINE_SIFT, snapshot=None):
+    """
+    Get (keypoints_count, descriptors) for a gallery record, or for the
+    minutiae engine (minutiae_count, minutiae_template).
+    Records may carry a stored feature template ('template') and records
+    from the binary framing precomputed descriptors or minutiae templates,
+    which are used as-is if their template version is the running
+    extractor's (see precomputed_features_current); image payloads are validated
+    and go through the feature cache under the record owner's namespace,
+    finger and (optional) scope, read from `snapshot` if the caller holds one.
+    Returns (0, None) if the template can't be used.
+    """
+    if record.get('template') is not None:
+        features = load_record_template(record, engine)
+        if features is not None:
+            return features
+
+    if engine == ENGINE_MINUTIAE and record.get('minutiae') is not None and precomputed_features_current(record, engine):
+        template = minutiae.deserialize_template(record['minutiae'])
+        return len(template), template
+
+    descriptors = record.get('descriptors')
+    if engine == ENGINE_SIFT and descriptors is not None and precomputed_features_current(record, engine):
+        return len(descriptors), descriptors
+
+    if not record.get('fingerprint'):
+        # Only precomputed features for the other engine
+        return 0, None
+
+    cache_key = feature_cache_key(namespace, record['id'], finger_type)
+
+    fingerprint_data = decode_fingerprint_payload(record['fingerprint'])
+
+    # Validate and repair fingerprint data if corrupted
+    validated_data = validate_template_cached(fingerprint_data, cache_key)
+    if validated_data is None:
+        logging.warning(f"Failed to validate/repair fingerprint for {cache_key}")
+        return 0, None
+
+    keypoints, descriptors = get_cached_features(cache_key, validated_data, scope, engine, snapshot)
+    if descriptors is None or len(descriptors) == 0:
+        return 0, None
+
+    return (len(keypoints) if keypoints is not None else 0), descriptors
+
+def precomputed_features_current(record, engine=ENGINE_SIFT):
+    """
+    Check that a binary-framed record's precomputed descriptors or minutiae
+    came from the running extractor (its template version is the engine's
+    TEMPLATE_EXTRACTOR_VERSIONS entry). Features from another version, say
+    full-frame SIFT from before segmentation, would score inconsistently
+    against segmented probes, so they are not used.
+    """
+    version = record.get('template_version')
+    if version == TEMPLATE_EXTRACTOR_VERSIONS[engine]:
+        return True
+    logging.warning(f"Ignoring {engine} features for {record.get('id')} from extractor version {version}, "
+                    f"expected {TEMPLATE_EXTRACTOR_VERSIONS[engine]}")
+    return False
+
+def load_record_template(record, engine=ENGINE_SIFT):
+    """
+    (feature count, features) from a record's stored feature template, or
+    None if the template is for another engine or extractor version or can't
+    be read, in which case the record's image is used instead.
+    """
     try:
+        payload = record['template']
+        # Templates come from /templates/extract as plain base64, so skip clean_base64()'s regex pass
+        template = parse_template(base64.b64decode(payload) if isinstance(payload, str) else payload)
+        if template['engine'] != engine or template['extractor_version'] != TEMPLATE_EXTRACTOR_VERSIONS[engine]:
+            return None
+        features = minutiae.deserialize_template(template['minutiae']) if engine == ENGINE_MINUTIAE \
+            else template['descriptors']
+    except ValueError as e:
+        logging.warning(f"Ignoring unreadable feature template for {record.get('id')}: {str(e)}")
+        return None
+    if len(features) == 0:
+        return None
+    return len(features), features
+
+def extract_feature_template(image_data, engine=ENGINE_SIFT):
+    """
+    Extract a serialized feature template from enrollment image bytes.
+    Returns (template bytes, feature count); raises ProbeQualityError if the
+    image can't be read or has too few features to be matched.
+    """
+    validated_data = validate_template_cached(image_data) if len(image_data) else None
+    image = cv2.imdecode(np.frombuffer(validated_data, np.uint8), cv2.IMREAD_COLOR) if validated_data else None
+    if image is None:
+        raise ProbeQualityError(REASON_UNREADABLE, {})
+
+    if engine == ENGINE_MINUTIAE:
+        template = minutiae.extract_minutiae(image)
+        if len(template) < minutiae.MIN_MINUTIAE:
+            raise ProbeQualityError(REASON_TOO_FEW_FEATURES, {'minutiae': len(template)})
+        serialized = serialize_minutiae(minutiae.serialize_template(template), len(template),
+                                        TEMPLATE_EXTRACTOR_VERSIONS[engine])
+        return serialized, len(template)
+
+    keypoints, descriptors, mask_stats = compute_sift_features(image, with_mask_stats=True)
+    count = len(keypoints) if keypoints else 0
+    if descriptors is None or assess_keypoints(count):
+        raise ProbeQualityError(REASON_TOO_FEW_FEATURES, {'keypoints': count})
+    origin = mask_stats['bbox'][:2] if mask_stats else (0, 0)
+    serialized = serialize_sift(keypoints, descriptors, TEMPLATE_EXTRACTOR_VERSIONS[engine], origin,
+                                segmented=bool(mask_stats and mask_stats['segmented']))
+    return serialized, count
+
+def has_template(record):
+    """Check whether a gallery record carries an image, a feature template, precomputed descriptors or a minutiae template"""
+    return (bool(record.get('fingerprint')) or record.get('template') is not None
+            or record.get('descriptors') is not None or record.get('minutiae') is not None)
+
+def compute_sift_features(image, with_mask_stats=False):
+    """
+    Compute SIFT features for an image and return keypoints and descriptors.
+    With SIFT_SEGMENTATION on, only the ridge region is searched for keypoints.
+    With `with_mask_stats` also returns the segmentation stats (or None).
+    """
+    try:
+        mask = mask_stats = None
+        if SIFT_SEGMENTATION:
+            image, mask, mask_stats = segment_fingerprint(to_grayscale(image))
         sift = cv2.SIFT_create()
-        keypoints, descriptors = sift.detectAndCompute(image, None)
-        return keypoints, descriptors
+        keypoints, descriptors = sift.detectAndCompute(image, mask)
+        return (keypoints, descriptors, mask_stats) if with_mask_stats else (keypoints, descriptors)
     except Exception as e:
         logging.error(f"Error computing SIFT features: {str(e)}")
-        return None, None
+        return (None, None, None) if with_mask_stats else (None, None)
 
-def get_cached_features(student_id, image_data):
-    """Get cached SIFT features for a student, computing if not cached"""
-    global FEATURE_CACHE, CACHE_TIMESTAMP
+def feature_store_kind(engine):
+    """
+    Feature store key for an engine's features, e.g. 'sift-segmented-v1':
+    segmented and full-frame SIFT features differ, and features from another
+    extractor version are not reused after a TEMPLATE_EXTRACTOR_VERSIONS bump.
+    """
+    kind = f"{engine}-segmented" if engine == ENGINE_SIFT and SIFT_SEGMENTATION else engine
+    return f"{kind}-v{TEMPLATE_EXTRACTOR_VERSIONS[engine]}"
 
-    current_time = time.time()
-    if current_time - CACHE_TIMESTAMP > CACHE_TTL:
-        # Cache expired, clear it
-        with CACHE_LOCK:
-            FEATURE_CACHE.clear()
-            CACHE_TIMESTAMP = current_time
-            logging.info("Feature cache cleared due to TTL expiration")
+def feature_cache_key(namespace, owner_id, finger_type=None):
+    """Build a namespaced cache key: 'student:<id>', 'student:<id>:<finger>' or 'staff:<id>'"""
+    if finger_type:
+        return f"{namespace}:{owner_id}:{finger_type}"
+    return f"{namespace}:{owner_id}"
 
-    cache_key = f"student_{student_id}"
+def roster_scope(staff_id):
+    """Scope name for the student roster served to a staff member"""
+    return f"roster:{staff_id}"
 
-    with CACHE_LOCK:
-        if cache_key in FEATURE_CACHE:
-            logging.debug(f"Using cached features for student {student_id}")
-            return FEATURE_CACHE[cache_key]
+def generation_slot(owner_key):
+    """Map an owner key onto its shared generation slot"""
+    return zlib.crc32(owner_key.encode('utf-8')) % GENERATION_SLOTS
+
+def generation_token(cache_key, scope=None):
+    """
+    Get the generations a cache entry depends on, as ((slot, generation), ...).
+    An entry depends on its owner, its finger (for per-finger keys), the scope
+    it was cached for and the global generation.
+    """
+    owner_keys = [cache_key]
+    namespace, owner_id, *finger = cache_key.split(':', 2)
+    if finger:
+        owner_keys.append(f"{namespace}:{owner_id}")
+    if scope:
+        owner_keys.append(f"scope:{scope}")
+
+    slots = [generation_slot(key) for key in owner_keys] + [GLOBAL_GENERATION_SLOT]
+    return tuple((slot, CACHE_GENERATIONS[slot]) for slot in slots)
+
+def is_generation_current(token):
+    """Check that no owner a cache entry depends on has been invalidated since"""
+    return all(CACHE_GENERATIONS[slot] == generation for slot, generation in token)
+
+def bump_generation(slot):
+    """Advance a shared generation slot, invalidating its entries in every worker"""
+    with GENERATION_LOCK:
+        CACHE_GENERATIONS[GENERATION_CLOCK_SLOT] += 1
+        CACHE_GENERATIONS[slot] = CACHE_GENERATIONS[GENERATION_CLOCK_SLOT]
+
+def shared_entry(entry, scope):
+    """
+    A cache entry of another scope as an entry of `scope`, or None if `scope`
+    was invalidated after the entry was extracted. The copy also depends on
+    the scope's generation, so invalidating the scope drops it again.
+    """
+    if not scope:
+        return entry
+    slot = generation_slot(f"scope:{scope}")
+    generation = CACHE_GENERATIONS[slot]
+    if generation > entry[4]:
+        return None
+    return entry[:2] + (entry[2] + ((slot, generation),),) + entry[3:]
+
+def load_scanned_image(scanned_fingerprint):
+    """Load a scanned fingerprint from a file path, encoded image bytes or an already decoded image"""
+    if scanned_fingerprint is None or isinstance(scanned_fingerprint, np.ndarray):
+        return scanned_fingerprint
+    if isinstance(scanned_fingerprint, (bytes, bytearray, memoryview)):
+        logging.info(f"Decoding scanned fingerprint from {len(scanned_fingerprint)} bytes")
+        return cv2.imdecode(np.frombuffer(scanned_fingerprint, np.uint8), cv2.IMREAD_COLOR)
+    logging.info(f"Loading scanned fingerprint from: {scanned_fingerprint}")
+    return cv2.imread(scanned_fingerprint)
+
+def snapshot_scope(cache_key, scope=None):
+    """Snapshot a template is cached in: its scope, else its namespace's whole gallery"""
+    return scope or cache_key.split(':', 1)[0]
+
+def current_snapshot(namespace='student', scope=None):
+    """The gallery snapshot a search reads for the whole request"""
+    return GALLERY_SNAPSHOTS.current(scope or namespace)
+
+def get_cached_features(cache_key, image_data, scope=None, engine=ENGINE_SIFT, snapshot=None):
+    """
+    Get cached features for a namespaced template key, computing if not cached.
+    Each engine's features are stored under their own entry; invalidation
+    (generations) is per template owner and covers every engine.
+    Entries are (keypoints, descriptors, generation token, mask stats,
+    clock tick when extracted).
+    Hits are read from `snapshot` (or the scope's current snapshot) without
+    locking. A miss reuses the template if another scope cached it (and this
+    scope hasn't been invalidated since), else
+    extracts it once however many requests miss together, and publishes it
+    in a new snapshot of the scope.
+    """
+    scope_name = snapshot_scope(cache_key, scope)
+    if snapshot is None:
+        snapshot = GALLERY_SNAPSHOTS.current(scope_name)
+
+    entry_key = cache_key if engine == ENGINE_SIFT else f"{engine}/{cache_key}"
+
+    cached = snapshot.get(entry_key)
+    if cached is not None and is_generation_current(cached[2]):
+        CACHE_COUNTERS['hits'] += 1
+        logging.debug(f"Using cached features for {entry_key}")
+        return cached[0], cached[1]
+
+    # Published since the caller took its snapshot
+    cached = GALLERY_SNAPSHOTS.current(scope_name).get(entry_key)
+    if cached is not None and is_generation_current(cached[2]):
+        CACHE_COUNTERS['hits'] += 1
+        return cached[0], cached[1]
+
+    # Cached for another scope (a student on several rosters): share it
+    cached = GALLERY_SNAPSHOTS.lookup_any(entry_key)
+    if cached is not None and is_generation_current(cached[2]):
+        shared = shared_entry(cached, scope)
+        if shared is not None:
+            CACHE_COUNTERS['hits'] += 1
+            publish_features(scope_name, entry_key, shared)
+            return shared[0], shared[1]
+
+    # Read before computing so an invalidation racing the computation leaves a stale entry
+    issued = CACHE_GENERATIONS[GENERATION_CLOCK_SLOT]
+    generation = generation_token(cache_key, scope)
+
+    with INFLIGHT_LOCK:
+        inflight_key = (entry_key, generation)
+        future = INFLIGHT_FEATURES.get(inflight_key)
+        is_leader = future is None
+        if is_leader:
+            CACHE_COUNTERS['misses'] += 1
+            future = Future()
+            INFLIGHT_FEATURES[inflight_key] = future
+        else:
+            CACHE_COUNTERS['coalesced'] += 1
+
+    if not is_leader:
+        logging.debug(f"Waiting for in-flight feature extraction for {entry_key}")
+        return future.result()
 
     # Compute features if not cached
+    try:
+        keypoints, descriptors, mask_stats = load_or_extract_features(cache_key, image_data, engine)
+        if descriptors is not None:
+            publish_features(scope_name, entry_key, (keypoints, descriptors, generation, mask_stats, issued))
+            logging.debug(f"Cached features for {entry_key}: {len(descriptors)} descriptors")
+        future.set_result((keypoints, descriptors))
+        return keypoints, descriptors
+    finally:
+        if not future.done():
+            future.set_result((None, None))
+        with INFLIGHT_LOCK:
+            INFLIGHT_FEATURES.pop(inflight_key, None)
+
+def publish_features(scope_name, entry_key, entry):
+    """Swap in a new snapshot of a scope with one more entry (compactions drop invalidated entries)"""
+    GALLERY_SNAPSHOTS.publish(scope_name, {entry_key: entry}, keep=lambda cached: is_generation_current(cached[2]))
+
+def load_or_extract_features(cache_key, image_data, engine=ENGINE_SIFT):
+    """
+    Get a template's features from the feature store, or extract them.
+    Returns (keypoints, descriptors, mask_stats); mask_stats is None unless
+    SIFT features were just extracted from a segmented image.
+    Stored features come back as (features, features, None): SIFT has one
+    descriptor per keypoint, so callers only need the count.
+    """
+    if FEATURE_STORE.enabled:
+        stored = FEATURE_STORE.load(payload_digest(image_data), feature_store_kind(engine))
+        if stored is not None:
+            logging.debug(f"Loaded stored {engine} features for {cache_key}")
+            return stored, stored, None
+
+    if engine == ENGINE_MINUTIAE:
+        return (*extract_minutiae_features(cache_key, image_data), None)
+    return extract_image_features(cache_key, image_data)
+
+def extract_image_features(cache_key, image_data):
+    """Decode an enrolled image and compute its SIFT features and mask stats, or (None, None, None)"""
     try:
         nparr = np.frombuffer(image_data, np.uint8)
         img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
 
         if img is None:
-            logging.error(f"Failed to decode image for student {student_id}")
-            return None, None
+            logging.error(f"Failed to decode image for {cache_key}")
+            return None, None, None
 
-        keypoints, descriptors = compute_sift_features(img)
+        keypoints, descriptors, mask_stats = compute_sift_features(img, with_mask_stats=True)
 
         if descriptors is not None and len(descriptors) > 0:
-            with CACHE_LOCK:
-                FEATURE_CACHE[cache_key] = (keypoints, descriptors)
-                logging.debug(f"Cached features for student {student_id}: {len(descriptors)} descriptors")
-            return keypoints, descriptors
+            return keypoints, descriptors, mask_stats
         else:
-            logging.warning(f"No descriptors found for student {student_id}")
+            logging.warning(f"No descriptors found for {cache_key}")
+            return None, None, None
+
+    except Exception as e:
+        logging.error(f"Error computing features for {cache_key}: {str(e)}")
+        return None, None, None
+
+def extract_minutiae_features(cache_key, image_data):
+    """
+    Decode an enrolled image and extract its minutiae template, or (None, None).
+    Returns the template twice so callers can treat it like (keypoints, descriptors).
+    """
+    try:
+        img = cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            logging.error(f"Failed to decode image for {cache_key}")
+            return None, None
+
+        template = minutiae.extract_minutiae(img)
+        if len(template) < minutiae.MIN_MINUTIAE:
+            logging.warning(f"Only {len(template)} minutiae found for {cache_key}")
             return None, None
+        return template, template
 
     except Exception as e:
-        logging.error(f"Error computing features for student {student_id}: {str(e)}")
+        logging.error(f"Error extracting minutiae for {cache_key}: {str(e)}")
         return None, None
 
-def get_fingerprint_match_score_optimized(des1, des2, keypoints1_count, keypoints2_count):
-    """Optimized fingerprint matching using pre-computed descriptors"""
+def load_matcher_params(path=None):
+    """
+    Load tuned matcher parameter sets, ordered by gallery size band.
+    Returns a list of {'max_gallery': n or None, 'trees', 'checks', 'ratio'};
+    the defaults as a single unbounded band if there is no usable file.
+    """
+    path = path or MATCHER_PARAMS_FILE
+    try:
+        with open(path, encoding='utf-8') as f:
+            bands = json.load(f)['bands']
+        bands = [
+            {'max_gallery': band.get('max_gallery'), **{key: band[key] for key in DEFAULT_MATCHER_PARAMS}}
+            for band in bands
+        ]
+        # Unbounded band last
+        bands.sort(key=lambda band: float('inf') if band['max_gallery'] is None else band['max_gallery'])
+        logging.info(f"Loaded matcher parameters from {path}: {bands}")
+        return bands
+    except FileNotFoundError:
+        return [{'max_gallery': None, **DEFAULT_MATCHER_PARAMS}]
+    except (ValueError, KeyError, TypeError) as e:
+        logging.error(f"Ignoring invalid matcher parameters in {path}: {str(e)}")
+        return [{'max_gallery': None, **DEFAULT_MATCHER_PARAMS}]
+
+MATCHER_PARAMS = load_matcher_params()
+
+def matcher_params(gallery_size):
+    """Matcher parameters tuned for a gallery of this many templates"""
+    for band in MATCHER_PARAMS:
+        if band['max_gallery'] is None or gallery_size <= band['max_gallery']:
+            return band
+    return MATCHER_PARAMS[-1]
+
+def match_threshold(engine, staff=False):
+    """Lowest score accepted as a match for an engine, for student or staff identification"""
+    if engine != ENGINE_SIFT:
+        return MINUTIAE_MIN_SCORE
+    return STAFF_MATCH_THRESHOLD if staff else STUDENT_MATCH_THRESHOLD
+
+def match_score_from_count(good_count, keypoints1_count, keypoints2_count):
+    """Match score (0-100) from the number of ratio-test matches and the two keypoint counts"""
+    # Calculate score based on good matches and average keypoints
+    if keypoints1_count == 0 or keypoints2_count == 0:
+        return 0.0
+
+    avg_keypoints = (keypoints1_count + keypoints2_count) / 2.0
+    match_score = (good_count / avg_keypoints) * 100
+
+    # Add bonus for high number of good matches (more aggressive)
+    if good_count > 4:
+        match_score *= 1.8  # 80% bonus for strong matches
+    elif good_count > 3:
+        match_score *= 1.6  # 60% bonus for decent matches
+    elif good_count > 2:
+        match_score *= 1.4  # 40% bonus for weak matches
+    elif good_count > 1:
+        match_score *= 1.2  # 20% bonus for very weak matches
+
+    return min(match_score, 100.0)  # Cap at 100%
+
+def get_fingerprint_match_score_optimized(des1, des2, keypoints1_count, keypoints2_count, params=None):
+    """
+    Optimized fingerprint matching using pre-computed descriptors.
+    `params` (trees, checks, ratio) default to the set tuned for the largest galleries.
+    """
     try:
         if des1 is None or des2 is None or len(des1) == 0 or len(des2) == 0:
             return 0.0
 
+        params = params or MATCHER_PARAMS[-1]
+
         # Use FLANN-based matcher for faster matching (more lenient)
         FLANN_INDEX_KDTREE = 1
-        index_params = dict(algorithm=FLANN_INDEX_KDTREE, trees=5)
-        search_params = dict(checks=100)  # Increased checks for better matching
+        index_params = dict(algorithm=FLANN_INDEX_KDTREE, trees=params['trees'])
+        search_params = dict(checks=params['checks'])
         flann = cv2.FlannBasedMatcher(index_params, search_params)
 
         matches = flann.knnMatch(des1, des2, k=2)
 
-        # Apply ratio test (Lowe's ratio test) - made more lenient for fingerprint matching
-        good_matches = []
+        # Apply ratio test (Lowe's ratio test) - lenient by default for fingerprint matching
+        good_count = 0
         for match in matches:
             if len(match) == 2:
                 m, n = match
-                if m.distance < 0.9 * n.distance:  # More lenient ratio for fingerprint matching
-                    good_matches.append(m)
-
-        # Calculate score based on good matches and average keypoints
-        if keypoints1_count == 0 or keypoints2_count == 0:
-            return 0.0
+                if m.distance < params['ratio'] * n.distance:
+                    good_count += 1
 
-        avg_keypoints = (keypoints1_count + keypoints2_count) / 2.0
-        match_score = (len(good_matches) / avg_keypoints) * 100
-
-        # Add bonus for high number of good matches (more aggressive)
-        if len(good_matches) > 4:
-            match_score *= 1.8  # 80% bonus for strong matches
-        elif len(good_matches) > 3:
-            match_score *= 1.6  # 60% bonus for decent matches
-        elif len(good_matches) > 2:
-            match_score *= 1.4  # 40% bonus for weak matches
-        elif len(good_matches) > 1:
-            match_score *= 1.2  # 20% bonus for very weak matches
-
-        return min(match_score, 100.0)  # Cap at 100%
+        return match_score_from_count(good_count, keypoints1_count, keypoints2_count)
 
     except Exception as e:
         logging.error(f"Error in optimized match score calculation: {str(e)}")
@@ -297,103 +865,522 @@ def validate_fingerprint_data(fingerprint_data):
         logging.error(f"PNG validation/repair failed: {str(e)}")
         return None
 
-def identify_fingerprint_optimized(scanned_fingerprint_path, students_fingerprints):
+def payload_digest(data):
+    """Content digest of a template payload"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def validate_template_cached(fingerprint_data, owner_key=None):
     """
-    Optimized fingerprint identification using cached SIFT features
-    Returns the best matching student ID and confidence score
+    validate_fingerprint_data() behind the repair cache.
+    Returns the usable image bytes (the payload itself, or its repaired
+    re-encoding) or None for an irreparable template. `owner_key` is recorded
+    so the repair report can name the enrollments to redo.
     """
-    best_match = {
-        'student_id': None,
-        'confidence': 0.0
+    digest = payload_digest(fingerprint_data)
+    now = time.time()
+
+    with REPAIR_CACHE_LOCK:
+        entry = REPAIR_CACHE.get(digest)
+        if entry is not None and (entry['expires_at'] is None or entry['expires_at'] > now):
+            REPAIR_COUNTERS['hits'] += 1
+            entry['hits'] += 1
+            entry['last_seen'] = now
+            if owner_key:
+                entry['owners'].add(owner_key)
+            return fingerprint_data if entry['verdict'] == REPAIR_OK else entry['data']
+        REPAIR_COUNTERS['misses'] += 1
+
+    validated_data = validate_fingerprint_data(fingerprint_data)
+
+    if validated_data is None:
+        verdict = REPAIR_IRREPARABLE
+        logging.warning(f"Template {owner_key or digest} is irreparable; skipping it for {REPAIR_IRREPARABLE_TTL_S:.0f}s - re-enrollment needed")
+    elif validated_data is fingerprint_data:
+        verdict = REPAIR_OK
+    else:
+        verdict = REPAIR_REPAIRED
+        logging.warning(f"Template {owner_key or digest} needed repair - re-enrollment recommended")
+
+    entry = {
+        'verdict': verdict,
+        # Only repaired templates keep their bytes; a healthy payload is returned as given
+        'data': validated_data if verdict == REPAIR_REPAIRED else None,
+        'expires_at': now + REPAIR_IRREPARABLE_TTL_S if verdict == REPAIR_IRREPARABLE else None,
+        'owners': {owner_key} if owner_key else set(),
+        'first_seen': now,
+        'last_seen': now,
+        'hits': 0
     }
+    with REPAIR_CACHE_LOCK:
+        REPAIR_CACHE.pop(digest, None)
+        REPAIR_CACHE[digest] = entry
+        while len(REPAIR_CACHE) > REPAIR_CACHE_MAX_ENTRIES:
+            # Dicts keep insertion order, so this drops the oldest verdict
+            del REPAIR_CACHE[next(iter(REPAIR_CACHE))]
+
+    return validated_data
+
+def get_repair_report():
+    """Templates this worker had to repair or found irreparable, for re-enrollment"""
+    with REPAIR_CACHE_LOCK:
+        templates = [
+            {
+                'digest': digest,
+                'verdict': entry['verdict'],
+                'owners': sorted(entry['owners']),
+                'hits': entry['hits'],
+                'first_seen': entry['first_seen'],
+                'last_seen': entry['last_seen'],
+                'retry_after': entry['expires_at']
+            }
+            for digest, entry in REPAIR_CACHE.items()
+            if entry['verdict'] != REPAIR_OK
+        ]
+        counters = {
+            'entries': len(REPAIR_CACHE),
+            **REPAIR_COUNTERS
+        }
 
-    logging.info(f"Starting optimized identification for {len(students_fingerprints)} students")
-
-    start_time = time.time()
-    corrupted_count = 0
-    processed_count = 0
+    return {
+        **counters,
+        'repaired': sum(1 for template in templates if template['verdict'] == REPAIR_REPAIRED),
+        'irreparable': sum(1 for template in templates if template['verdict'] == REPAIR_IRREPARABLE),
+        'templates': sorted(templates, key=lambda template: template['last_seen'], reverse=True)
+    }
 
-    # First, compute features for the scanned fingerprint
+def compute_probe_features(scanned_fingerprint, engine=ENGINE_SIFT):
+    """
+    Load a scanned fingerprint and compute its SIFT features; returns (keypoints_count, descriptors) or (0, None).
+    For the minutiae engine returns (minutiae_count, minutiae_template) instead.
+    With PROBE_QUALITY_GATE on, raises ProbeQualityError for a probe too poor to match,
+    checking brightness/contrast before extraction and the feature count after it.
+    """
     try:
-        logging.info(f"Loading scanned fingerprint from: {scanned_fingerprint_path}")
-        scanned_img = cv2.imread(scanned_fingerprint_path)
+        scanned_img = load_scanned_image(scanned_fingerprint)
         if scanned_img is None:
             logging.error("Failed to load scanned fingerprint image")
-            return best_match
+            if PROBE_QUALITY_GATE:
+                raise ProbeQualityError(REASON_UNREADABLE, {})
+            return 0, None
 
         logging.info(f"Scanned image shape: {scanned_img.shape}, dtype: {scanned_img.dtype}")
-        scanned_keypoints, scanned_descriptors = compute_sift_features(scanned_img)
+        scanned_gray = to_grayscale(scanned_img)
+
+        if PROBE_QUALITY_GATE:
+            reason, metrics = assess_image(scanned_gray)
+            if reason:
+                logging.warning(f"Rejected scanned fingerprint before matching: {reason} {metrics}")
+                raise ProbeQualityError(reason, metrics)
+
+        if engine == ENGINE_MINUTIAE:
+            template = minutiae.extract_minutiae(scanned_gray)
+            logging.info(f"Scanned fingerprint: {len(template)} minutiae")
+            if len(template) < minutiae.MIN_MINUTIAE:
+                if PROBE_QUALITY_GATE:
+                    raise ProbeQualityError(REASON_TOO_FEW_FEATURES, {**metrics, 'minutiae': len(template)})
+                return 0, None
+            return len(template), template
+
+        scanned_keypoints, scanned_descriptors = compute_sift_features(scanned_gray)
         scanned_keypoints_count = len(scanned_keypoints) if scanned_keypoints else 0
 
         logging.info(f"Scanned fingerprint: {scanned_keypoints_count} keypoints, {len(scanned_descriptors) if scanned_descriptors is not None else 0} descriptors")
 
+        if PROBE_QUALITY_GATE:
+            reason = assess_keypoints(scanned_keypoints_count)
+            if reason:
+                metrics = {**metrics, 'keypoints': scanned_keypoints_count}
+                logging.warning(f"Rejected scanned fingerprint before matching: {reason} {metrics}")
+                raise ProbeQualityError(reason, metrics)
+
         if scanned_descriptors is None or len(scanned_descriptors) == 0:
             logging.error("No descriptors found in scanned fingerprint - image may be corrupted or too low quality")
-            return best_match
+            return 0, None
 
+        return scanned_keypoints_count, scanned_descriptors
+
+    except ProbeQualityError:
+        raise
     except Exception as e:
         logging.error(f"Error processing scanned fingerprint: {str(e)}")
-        return best_match
+        return 0, None
+
+class ProbeExtraction:
+    """
+    A probe being decoded and then run through feature extraction on a pool
+    (see start_probe_extraction). The decoded image is available as soon as
+    decoding finishes, so a repeated probe can be answered from the
+    recent-probe cache without waiting for its features.
+    """
+
+    def __init__(self, scanned_fingerprint, engine, executor):
+        self.decoded = Future()
+        self._cancelled = threading.Event()
+        self.features = executor.submit(self._run, scanned_fingerprint, engine)
+
+    def _run(self, scanned_fingerprint, engine):
+        try:
+            image = load_scanned_image(scanned_fingerprint)
+        except BaseException as e:
+            self.decoded.set_exception(e)
+            raise
+        self.decoded.set_result(image)
+        if self._cancelled.is_set():
+            return 0, None
+        return compute_probe_features(image, engine)
+
+    def image(self):
+        """The decoded probe image, waiting for the decode only"""
+        return self.decoded.result()
+
+    def cancel(self):
+        """Skip feature extraction if it hasn't started yet"""
+        self._cancelled.set()
+
+def start_probe_extraction(scanned_fingerprint, engine=None, executor=None):
+    """
+    Decode a probe and compute its features on `executor` (the probe pool by
+    default) while the caller fetches or parses its gallery. Pass the result
+    to an identify function as `probe`.
+    """
+    return ProbeExtraction(scanned_fingerprint, engine or DEFAULT_MATCH_ENGINE, executor or PROBE_EXECUTOR)
+
+def resolve_probe_image(scanned_fingerprint, probe=None):
+    """The decoded probe image, from a background `probe` if there is one"""
+    if probe is None:
+        return load_scanned_image(scanned_fingerprint)
+    return probe.image()
+
+def resolve_probe_features(scanned_image, engine, probe=None):
+    """The probe's (features_count, features), joining a background `probe` (re-raising a ProbeQualityError)"""
+    if probe is None:
+        return compute_probe_features(scanned_image, engine)
+    return probe.features.result()
+
+def answer_repeated_probe(repeated, probe=None):
+    """Return a recent-probe cache hit, skipping the background `probe`'s extraction"""
+    if probe is not None:
+        probe.cancel()
+    return repeated
+
+def decayed_prior_weight(entry, now):
+    """Current weight of a match-history entry after exponential decay"""
+    if entry is None:
+        return 0.0
+    weight, last_match = entry
+    return weight * 0.5 ** ((now - last_match) / MATCH_PRIOR_HALF_LIFE_S)
+
+def record_successful_match(prior_scope, owner_id):
+    """Remember a successful identification so ordered searches try this owner early next time"""
+    now = time.time()
+    with MATCH_PRIOR_LOCK:
+        entries = MATCH_PRIOR.setdefault(prior_scope, {})
+        entries[owner_id] = (decayed_prior_weight(entries.get(owner_id), now) + 1.0, now)
+
+        if len(entries) > MATCH_PRIOR_MAX_ENTRIES:
+            # Forget the least likely tenth of the scope in one pass
+            ranked = sorted(entries, key=lambda key: decayed_prior_weight(entries[key], now))
+            for key in ranked[:len(entries) // 10]:
+                del entries[key]
+
+def order_by_prior(records, prior_scope):
+    """Order gallery records by how recently and often their owner matched in this scope"""
+    with MATCH_PRIOR_LOCK:
+        entries = dict(MATCH_PRIOR.get(prior_scope, {}))
+
+    if not entries:
+        return list(records)
+
+    now = time.time()
+    # sorted() is stable, so owners without history keep their payload order
+    return sorted(records, key=lambda record: -decayed_prior_weight(entries.get(record.get('id')), now))
+
+def confident_match(search):
+    """Whether a search's best score is one to stop on: EARLY_ACCEPT_SCORE with EARLY_ACCEPT_MARGIN over the runner-up"""
+    return (search['confidence'] >= EARLY_ACCEPT_SCORE
+            and search['confidence'] - search['runner_up'] >= EARLY_ACCEPT_MARGIN)
+
+def accepted_match(search, threshold):
+    """
+    Whether a search's best match is an answer: at least `threshold`, and
+    confident if the budget cut the search short (any other print scores
+    well above the threshold, so a partial search's best is rarely the owner)
+    """
+    if search['confidence'] < threshold:
+        return False
+    if search['budget_exhausted'] and not confident_match(search):
+        logging.warning(f"Budget ran out before a confident match (best {search['confidence']:.2f}%), returning no match")
+        return False
+    return True
+
+def search_gallery(scanned_descriptors, scanned_keypoints_count, records, label='student',
+                   namespace='student', per_finger=False, scope=None,
+                   prior_scope=None, search_mode=None, engine=ENGINE_SIFT, deadline=None):
+    """
+    Score a probe against gallery records and keep the best match.
+
+    In ordered mode records are tried in recency-prior order for `prior_scope`
+    and the search stops as soon as the best score reaches EARLY_ACCEPT_SCORE
+    with at least EARLY_ACCEPT_MARGIN over the best other owner seen so far.
+
+    With a `deadline` (time.monotonic()) records are also tried in prior
+    order, and the search stops with its best match so far once the deadline
+    passes.
+
+    Returns a dict with the best record and score, the runner-up score and
+    counters: processed, corrupted, templates_evaluated, early_accepted,
+    budget_exhausted.
+    """
+    ordered = (search_mode or DEFAULT_SEARCH_MODE) == SEARCH_MODE_ORDERED
+    if ordered or deadline is not None:
+        records = order_by_prior(records, prior_scope)
+    params = matcher_params(len(records))
+    # One consistent view of the cached gallery for the whole search
+    snapshot = current_snapshot(namespace, scope)
+
+    result = {
+        'record': None,
+        'confidence': 0.0,
+        'runner_up': 0.0,
+        'processed': 0,
+        'corrupted': 0,
+        'templates_evaluated': 0,
+        'early_accepted': False,
+        'budget_exhausted': False
+    }
+
+    for record in records:
+        if deadline is not None and time.monotonic() >= deadline:
+            result['budget_exhausted'] = True
+            logging.warning(f"Match budget ran out after {result['processed']} of {len(records)} records; best so far {result['confidence']:.2f}%")
+            break
 
-    # Process each student fingerprint
-    for student in students_fingerprints:
         try:
-            processed_count += 1
+            result['processed'] += 1
+
+            owner_id = record.get('id')
+            finger_type = record.get('finger_type') if per_finger else None
+            description = f"{label} {owner_id}" + (f" ({finger_type})" if finger_type else "")
 
             # Check if fingerprint data is available
-            if not student.get('fingerprint'):
-                logging.warning(f"Student {student['id']} has no fingerprint enrolled")
+            if not has_template(record):
+                logging.warning(f"{description} has no fingerprint enrolled")
                 continue
 
             # Check for corruption flags from Node.js server
-            if student.get('isCorrupted'):
-                logging.warning(f"Student {student['id']} has corrupted fingerprint data (detected by Node.js)")
-                corrupted_count += 1
-                continue
-
-            # Clean and decode base64 fingerprint to image data
-            fingerprint_str = clean_base64(student['fingerprint'])
-            fingerprint_data = base64.b64decode(fingerprint_str)
-
-            # Validate and repair fingerprint data if corrupted
-            validated_data = validate_fingerprint_data(fingerprint_data)
-            if validated_data is None:
-                logging.warning(f"Failed to validate/repair fingerprint for student {student['id']}")
-                corrupted_count += 1
+            if record.get('isCorrupted'):
+                logging.warning(f"{description} has corrupted fingerprint data (detected by Node.js)")
+                result['corrupted'] += 1
                 continue
 
             # Get cached features or compute them
-            student_keypoints, student_descriptors = get_cached_features(student['id'], validated_data)
+            enrolled_keypoints_count, enrolled_descriptors = get_record_features(
+                record, namespace=namespace, finger_type=finger_type, scope=scope, engine=engine, snapshot=snapshot
+            )
 
-            if student_descriptors is None or len(student_descriptors) == 0:
-                logging.warning(f"No descriptors found for student {student['id']}")
-                corrupted_count += 1
+            if enrolled_descriptors is None:
+                logging.warning(f"No descriptors found for {description}")
+                result['corrupted'] += 1
                 continue
 
-            student_keypoints_count = len(student_keypoints) if student_keypoints else 0
-
             # Compare fingerprints using optimized matching
-            match_score = get_fingerprint_match_score_optimized(
-                scanned_descriptors, student_descriptors,
-                scanned_keypoints_count, student_keypoints_count
-            )
+            if engine == ENGINE_MINUTIAE:
+                match_score = minutiae.match_templates(scanned_descriptors, enrolled_descriptors)
+            else:
+                match_score = get_fingerprint_match_score_optimized(
+                    scanned_descriptors, enrolled_descriptors,
+                    scanned_keypoints_count, enrolled_keypoints_count, params
+                )
+            result['templates_evaluated'] += 1
 
             # Log detailed matching info for debugging
-            logging.info(f"Matching student {student['id']}: score={match_score:.2f}%, scanned_kp={scanned_keypoints_count}, student_kp={student_keypoints_count}")
-
-            # Update best match if this score is higher
-            if match_score > best_match['confidence']:
-                best_match = {
-                    'student_id': student['id'],
-                    'confidence': match_score
-                }
-                logging.info(f"✓ New best match: student {student['id']} with score {match_score:.2f}%")
+            logging.info(f"Matching {description}: score={match_score:.2f}%, scanned_kp={scanned_keypoints_count}, enrolled_kp={enrolled_keypoints_count}")
+
+            best = result['record']
+            if match_score > result['confidence']:
+                # The previous best becomes the runner-up unless it is another finger of the same owner
+                if best is not None and best.get('id') != owner_id:
+                    result['runner_up'] = max(result['runner_up'], result['confidence'])
+                result['record'] = record
+                result['confidence'] = match_score
+                logging.info(f"✓ New best match: {description} with score {match_score:.2f}%")
+            elif best is not None and best.get('id') != owner_id:
+                result['runner_up'] = max(result['runner_up'], match_score)
+
+            if ordered and confident_match(result):
+                result['early_accepted'] = True
+                logging.info(f"Early accept after {result['templates_evaluated']} templates: {result['confidence']:.2f}% (runner-up {result['runner_up']:.2f}%)")
+                break
 
         except Exception as e:
-            logging.error(f"Error processing student {student['id']}: {str(e)}")
-            corrupted_count += 1
+            logging.error(f"Error processing {label} {record.get('id')}: {str(e)}")
+            result['corrupted'] += 1
             continue
 
+    return result
+
+def search_coverage(search, gallery_size):
+    """Result fields saying how much of the gallery a search covered"""
+    return {
+        'exhaustive': search['processed'] >= gallery_size,
+        'coverage': round(search['processed'] / gallery_size, 4) if gallery_size else 1.0,
+        'budget_exhausted': search['budget_exhausted']
+    }
+
+def gallery_signature(records):
+    """Cheap digest of a gallery's records (owner, finger, template size), to tell posted galleries apart"""
+    digest = hashlib.blake2b(digest_size=16)
+    for record in records:
+        template = record.get('fingerprint')
+        for key in ('template', 'descriptors', 'minutiae'):
+            if template is None:
+                template = record.get(key)
+        size = len(template) if template is not None else 0
+        digest.update(f"{record.get('id')}|{record.get('finger_type')}|{size}|{bool(record.get('isCorrupted'))};".encode('utf-8'))
+    return digest.hexdigest()
+
+def recent_probe_lookup(scope, records, scanned_image, *options):
+    """
+    Look a decoded probe up in the recent-probe cache.
+    Returns (result or None, handle); pass the handle to remember_probe_result
+    with the fresh result. Entries are keyed by the gallery's signature, the
+    search options and the generations of the scope, so re-enrolling anyone
+    or invalidating the scope makes earlier results unreachable.
+    """
+    if not RECENT_PROBES.enabled or scanned_image is None:
+        return None, None
+
+    key = (
+        gallery_signature(records), options,
+        CACHE_GENERATIONS[generation_slot(f"scope:{scope}")],
+        CACHE_GENERATIONS[GLOBAL_GENERATION_SLOT],
+        CACHE_GENERATIONS[RECENT_PROBES_GENERATION_SLOT]
+    )
+    signature = probe_signature(to_grayscale(scanned_image))
+    result = RECENT_PROBES.lookup(scope, key, signature)
+    if result is not None:
+        logging.info(f"Repeated probe in {scope}, returning the previous result")
+        return {**result, 'repeated_probe': True}, None
+    return None, (scope, key, signature)
+
+def remember_probe_result(handle, result):
+    """Store an identification result for repeats of its probe; returns the result"""
+    # A search cut short by its budget is no answer for a retry
+    if handle is not None and not result.get('budget_exhausted'):
+        RECENT_PROBES.store(*handle, result)
+    return {**result, 'repeated_probe': False}
+
+def partition_by_finger(records, finger_type):
+    """Split gallery records into those enrolled for `finger_type` and the rest, keeping payload order"""
+    hinted, others = [], []
+    for record in records:
+        (hinted if str(record.get('finger_type') or '').lower() == finger_type else others).append(record)
+    return hinted, others
+
+def course_scope(course_id):
+    """Scope name for the students of a course or section"""
+    return f"course:{course_id}"
+
+def record_courses(record):
+    """IDs and section codes of a gallery record's courses ('courses' holds IDs or course objects)"""
+    courses = set()
+    for course in record.get('courses') or ():
+        if isinstance(course, dict):
+            courses.update(str(course[key]) for key in ('id', 'course_id', 'course_code') if course.get(key) is not None)
+        elif course is not None:
+            courses.add(str(course))
+    return courses
+
+def partition_by_course(records, course_id):
+    """Split gallery records into the students of `course_id` and the rest, keeping payload order"""
+    enrolled, others = [], []
+    for record in records:
+        (enrolled if course_id in record_courses(record) else others).append(record)
+    return enrolled, others
+
+def multi_search_tiers(records, course_id=None, finger_type=None):
+    """
+    Partitions of a multi-finger gallery in the order they are searched, as
+    (records, scope, outside_course, other_fingers): the course's students
+    before everyone else, and within each the hinted finger before the
+    others. A course's templates are cached in their own scope, so its
+    search reads a class-sized snapshot.
+    """
+    enrolled, rest = partition_by_course(records, course_id) if course_id else (records, [])
+    tiers = []
+    for part, scope, outside_course in ((enrolled, course_scope(course_id) if course_id else None, False),
+                                        (rest, None, True)):
+        hinted, others = partition_by_finger(part, finger_type) if finger_type else (part, [])
+        tiers += [(hinted, scope, outside_course, False), (others, scope, outside_course, True)]
+    return [tier for tier in tiers if tier[0]] or [(records, None, False, False)]
+
+def merge_search_results(first, second):
+    """Combine the results of searching two disjoint parts of a gallery"""
+    best, other = (first, second) if first['confidence'] >= second['confidence'] else (second, first)
+    same_owner = (best['record'] is not None and other['record'] is not None
+                  and best['record'].get('id') == other['record'].get('id'))
+    return {
+        'record': best['record'],
+        'confidence': best['confidence'],
+        'runner_up': max(best['runner_up'], other['runner_up'] if same_owner else other['confidence']),
+        'processed': first['processed'] + second['processed'],
+        'corrupted': first['corrupted'] + second['corrupted'],
+        'templates_evaluated': first['templates_evaluated'] + second['templates_evaluated'],
+        'early_accepted': best['early_accepted'],
+        'budget_exhausted': first['budget_exhausted'] or second['budget_exhausted']
+    }
+
+def identify_fingerprint_optimized(scanned_fingerprint, students_fingerprints, scope=None, search_mode=None, engine=None,
+                                   deadline=None, probe=None):
+    """
+    Optimized fingerprint identification using cached SIFT features
+    Templates are cached under `scope` (the roster they were fetched for)
+    With a `deadline` (time.monotonic()) returns the best match found before it, if confident
+    With a `probe` (see start_probe_extraction) uses the features extracted in the background
+    Returns the best matching student ID and confidence score
+    """
+    engine = engine or DEFAULT_MATCH_ENGINE
+    best_match = {
+        'student_id': None,
+        'confidence': 0.0,
+        'templates_evaluated': 0,
+        'early_accepted': False,
+        'exhaustive': False,
+        'coverage': 0.0,
+        'budget_exhausted': False,
+        'engine': engine
+    }
+
+    logging.info(f"Starting optimized identification for {len(students_fingerprints)} students")
+
+    scanned_fingerprint = resolve_probe_image(scanned_fingerprint, probe)
+    repeated, recent_handle = recent_probe_lookup(scope or 'students', students_fingerprints, scanned_fingerprint, engine, search_mode)
+    if repeated is not None:
+        return answer_repeated_probe(repeated, probe)
+
+    start_time = time.time()
+
+    # First, compute features for the scanned fingerprint
+    scanned_keypoints_count, scanned_descriptors = resolve_probe_features(scanned_fingerprint, engine, probe)
+    if scanned_descriptors is None:
+        return best_match
+
+    # Process each student fingerprint
+    search = search_gallery(
+        scanned_descriptors, scanned_keypoints_count, students_fingerprints,
+        scope=scope, prior_scope=scope or 'students', search_mode=search_mode, engine=engine, deadline=deadline
+    )
+    processed_count = search['processed']
+    corrupted_count = search['corrupted']
+    best_match = {
+        'student_id': search['record']['id'] if search['record'] else None,
+        'confidence': search['confidence'],
+        'templates_evaluated': search['templates_evaluated'],
+        'early_accepted': search['early_accepted'],
+        **search_coverage(search, len(students_fingerprints)),
+        'engine': engine
+    }
+
     processing_time = time.time() - start_time
     logging.info(f"Optimized identification complete in {processing_time:.2f}s. Best match: {best_match}")
     logging.info(f"Processed {processed_count} students, detected {corrupted_count} corrupted fingerprints")
@@ -404,26 +1391,162 @@ def identify_fingerprint_optimized(scanned_fingerprint_path, students_fingerprin
         logging.error(f"High fingerprint corruption rate detected: {corruption_rate:.1f}% ({corrupted_count}/{processed_count})")
 
     # Only return a match if confidence is above threshold (accept any positive match)
-    if best_match['confidence'] < 5.0:
+    if not accepted_match(search, match_threshold(engine)):
         logging.warning(f"Low confidence ({best_match['confidence']:.2f}%), returning no match")
         logging.info("Possible causes:")
         logging.info("  - Scanned fingerprint quality is poor")
         logging.info("  - Enrolled fingerprints are corrupted")
         logging.info("  - Fingerprint scanner needs cleaning")
         logging.info("  - Student fingerprint not enrolled or doesn't match")
-        return {
+        return remember_probe_result(recent_handle, {
+            **best_match,
             'student_id': None,
             'confidence': 0.0
-        }
+        })
 
+    record_successful_match(scope or 'students', best_match['student_id'])
     logging.info(f"✓ SUCCESS: Returning best match with confidence: {best_match['confidence']:.2f}%")
-    return best_match
+    return remember_probe_result(recent_handle, best_match)
 
-def identify_fingerprint(scanned_fingerprint_path, students_fingerprints):
+def identify_fingerprint(scanned_fingerprint, students_fingerprints, scope=None, search_mode=None, engine=None, deadline=None,
+                         probe=None):
     """
     Legacy identification function - now uses optimized version
     """
-    return identify_fingerprint_optimized(scanned_fingerprint_path, students_fingerprints)
+    return identify_fingerprint_optimized(scanned_fingerprint, students_fingerprints, scope, search_mode, engine, deadline,
+                                          probe)
+
+def identify_fingerprint_multi(scanned_fingerprint, all_fingerprints, search_mode=None, engine=None, finger_type=None,
+                               deadline=None, probe=None, course_id=None):
+    """
+    Optimized multi-fingerprint identification.
+    Identifies against ALL enrolled fingerprints for ALL students.
+    
+    Args:
+        scanned_fingerprint: Scanned fingerprint as a file path, encoded image bytes or decoded image
+        all_fingerprints: List of all fingerprint records with format:
+            [{
+                'id': student_id,
+                'name': student_name,
+                'matric_no': student_matric_no,
+                'grade': student_grade,
+                'fingerprint': fingerprint_data,
+                'finger_type': 'thumb' | 'index' | 'middle' | 'ring' | 'pinky',
+                'fingerprint_id': unique_fingerprint_id,
+                'courses': [...]
+            }, ...]
+        search_mode: 'exhaustive' or 'ordered' (see search_gallery)
+        engine: 'sift' or 'minutiae' (defaults to MATCH_ENGINE)
+        finger_type: Optional hint of the finger being scanned; only that finger's
+            templates are searched unless none of them is a confident match
+        deadline: Optional time.monotonic() by which to return the best match so far, if confident
+        probe: Optional ProbeExtraction from start_probe_extraction() computing the probe's features
+        course_id: Optional course ID or section code of the scheduled class; its
+            students are searched first and the rest of the gallery unless one
+            of them is a confident match (see confident_match)
+    
+    Returns:
+        {
+            'student_id': matched_student_id or None,
+            'confidence': confidence_score,
+            'finger_type': matched_finger_type or None,
+            'templates_evaluated': number_of_templates_scored,
+            'early_accepted': whether_the_search_stopped_early,
+            'finger_fallback': whether_the_hinted_finger_missed_and_all_fingers_were_searched,
+            'course_fallback': whether_the_course_missed_and_the_whole_gallery_was_searched,
+            'exhaustive': whether_every_template_was_searched,
+            'coverage': fraction_of_templates_searched,
+            'budget_exhausted': whether_the_deadline_cut_the_search_short
+        }
+    """
+    engine = engine or DEFAULT_MATCH_ENGINE
+    threshold = match_threshold(engine)
+    best_match = {
+        'student_id': None,
+        'confidence': 0.0,
+        'finger_type': None,
+        'templates_evaluated': 0,
+        'early_accepted': False,
+        'finger_fallback': False,
+        'course_fallback': False,
+        'exhaustive': False,
+        'coverage': 0.0,
+        'budget_exhausted': False,
+        'engine': engine
+    }
+
+    logging.info(f"Starting multi-fingerprint identification for {len(all_fingerprints)} fingerprint records")
+
+    scanned_fingerprint = resolve_probe_image(scanned_fingerprint, probe)
+    repeated, recent_handle = recent_probe_lookup('multi', all_fingerprints, scanned_fingerprint, engine, search_mode, finger_type,
+                                                  course_id)
+    if repeated is not None:
+        return answer_repeated_probe(repeated, probe)
+
+    start_time = time.time()
+
+    # Compute features for the scanned fingerprint
+    scanned_keypoints_count, scanned_descriptors = resolve_probe_features(scanned_fingerprint, engine, probe)
+    if scanned_descriptors is None:
+        return best_match
+
+    # Process each fingerprint record; cached per finger, so re-enrolling one
+    # finger only invalidates that template. With a course or finger hint the
+    # narrowest partition is searched first, widening only on a miss.
+    search, finger_fallback, course_fallback = None, False, False
+    for records, scope, outside_course, other_fingers in multi_search_tiers(all_fingerprints, course_id, finger_type):
+        if search is not None:
+            # Any other print clears the acceptance threshold (different prints
+            # score 20-40%), so a narrower partition only answers with a confident match
+            if confident_match(search) or search['budget_exhausted']:
+                break
+            logging.info(f"No confident match (best {search['confidence']:.2f}%, runner-up {search['runner_up']:.2f}%), searching {len(records)} more"
+                         + (f" outside course {course_id}" if outside_course else "")
+                         + (f" (other than {finger_type})" if other_fingers else ""))
+        tier = search_gallery(
+            scanned_descriptors, scanned_keypoints_count, records, per_finger=True, scope=scope,
+            prior_scope='multi', search_mode=search_mode, engine=engine, deadline=deadline
+        )
+        search = tier if search is None else merge_search_results(search, tier)
+        finger_fallback = finger_fallback or other_fingers
+        course_fallback = course_fallback or outside_course
+    processed_count = search['processed']
+    corrupted_count = search['corrupted']
+    best_record = search['record']
+    best_match = {
+        'student_id': best_record.get('id') if best_record else None,
+        'confidence': search['confidence'],
+        'finger_type': best_record.get('finger_type', 'unknown') if best_record else None,
+        'templates_evaluated': search['templates_evaluated'],
+        'early_accepted': search['early_accepted'],
+        'finger_fallback': finger_fallback,
+        'course_fallback': course_fallback,
+        **search_coverage(search, len(all_fingerprints)),
+        'engine': engine
+    }
+
+    processing_time = time.time() - start_time
+    logging.info(f"Multi-fingerprint identification complete in {processing_time:.2f}s")
+    logging.info(f"Processed {processed_count} fingerprint records, detected {corrupted_count} corrupted")
+
+    # Alert if high corruption rate
+    corruption_rate = (corrupted_count / processed_count) * 100 if processed_count > 0 else 0
+    if corruption_rate > 20:
+        logging.error(f"High corruption rate: {corruption_rate:.1f}% ({corrupted_count}/{processed_count})")
+
+    # Only return match if confidence is above threshold
+    if not accepted_match(search, threshold):
+        logging.warning(f"Low confidence ({best_match['confidence']:.2f}%), returning no match")
+        return remember_probe_result(recent_handle, {
+            **best_match,
+            'student_id': None,
+            'confidence': 0.0,
+            'finger_type': None
+        })
+
+    record_successful_match('multi', best_match['student_id'])
+    logging.info(f"✓ SUCCESS: Returning best match - student {best_match['student_id']} ({best_match['finger_type']}) with {best_match['confidence']:.2f}% confidence")
+    return remember_probe_result(recent_handle, best_match)
 
 def repair_png_data(fingerprint_data):
     """
@@ -512,95 +1635,55 @@ def repair_png_data(fingerprint_data):
         logging.error(f"PNG repair failed: {str(e)}")
         return None
 
-def identify_staff_fingerprint_optimized(scanned_fingerprint_path, staff_fingerprints):
+def identify_staff_fingerprint_optimized(scanned_fingerprint, staff_fingerprints, search_mode=None, engine=None, deadline=None,
+                                         probe=None):
     """
     Optimized staff fingerprint identification using cached SIFT features
+    With a `deadline` (time.monotonic()) returns the best match found before it, if confident
     Returns the best matching staff ID and confidence score
     """
+    engine = engine or DEFAULT_MATCH_ENGINE
     best_match = {
         'staff_id': None,
-        'confidence': 0.0
+        'confidence': 0.0,
+        'templates_evaluated': 0,
+        'early_accepted': False,
+        'exhaustive': False,
+        'coverage': 0.0,
+        'budget_exhausted': False,
+        'engine': engine
     }
 
     logging.info(f"Starting optimized staff identification for {len(staff_fingerprints)} staff members")
 
+    scanned_fingerprint = resolve_probe_image(scanned_fingerprint, probe)
+    repeated, recent_handle = recent_probe_lookup('staff', staff_fingerprints, scanned_fingerprint, engine, search_mode)
+    if repeated is not None:
+        return answer_repeated_probe(repeated, probe)
+
     start_time = time.time()
-    corrupted_count = 0
-    processed_count = 0
 
     # First, compute features for the scanned fingerprint
-    try:
-        scanned_img = cv2.imread(scanned_fingerprint_path)
-        if scanned_img is None:
-            logging.error("Failed to load scanned staff fingerprint image")
-            return best_match
-
-        scanned_keypoints, scanned_descriptors = compute_sift_features(scanned_img)
-        if scanned_descriptors is None or len(scanned_descriptors) == 0:
-            logging.error("No descriptors found in scanned staff fingerprint")
-            return best_match
-
-        scanned_keypoints_count = len(scanned_keypoints) if scanned_keypoints else 0
-
-    except Exception as e:
-        logging.error(f"Error processing scanned staff fingerprint: {str(e)}")
+    scanned_keypoints_count, scanned_descriptors = resolve_probe_features(scanned_fingerprint, engine, probe)
+    if scanned_descriptors is None:
         return best_match
 
     # Process each staff fingerprint
-    for staff in staff_fingerprints:
-        try:
-            processed_count += 1
-
-            # Check if fingerprint data is available
-            if not staff.get('fingerprint'):
-                logging.warning(f"Staff {staff['id']} has no fingerprint enrolled")
-                continue
-
-            # Check for corruption flags from Node.js server
-            if staff.get('isCorrupted'):
-                logging.warning(f"Staff {staff['id']} has corrupted fingerprint data (detected by Node.js)")
-                corrupted_count += 1
-                continue
-
-            # Clean and decode base64 fingerprint to image data
-            fingerprint_str = clean_base64(staff['fingerprint'])
-            fingerprint_data = base64.b64decode(fingerprint_str)
-
-            # Validate and repair fingerprint data if corrupted
-            validated_data = validate_fingerprint_data(fingerprint_data)
-            if validated_data is None:
-                logging.warning(f"Failed to validate/repair fingerprint for staff {staff['id']}")
-                corrupted_count += 1
-                continue
-
-            # Get cached features or compute them
-            staff_keypoints, staff_descriptors = get_cached_features(f"staff_{staff['id']}", validated_data)
-
-            if staff_descriptors is None or len(staff_descriptors) == 0:
-                logging.warning(f"No descriptors found for staff {staff['id']}")
-                corrupted_count += 1
-                continue
-
-            staff_keypoints_count = len(staff_keypoints) if staff_keypoints else 0
-
-            # Compare fingerprints using optimized matching
-            match_score = get_fingerprint_match_score_optimized(
-                scanned_descriptors, staff_descriptors,
-                scanned_keypoints_count, staff_keypoints_count
-            )
-
-            # Update best match if this score is higher
-            if match_score > best_match['confidence']:
-                best_match = {
-                    'staff_id': staff['id'],
-                    'confidence': match_score
-                }
-                logging.debug(f"New best match: staff {staff['id']} with score {match_score:.2f}%")
-
-        except Exception as e:
-            logging.error(f"Error processing staff {staff['id']}: {str(e)}")
-            corrupted_count += 1
-            continue
+    search = search_gallery(
+        scanned_descriptors, scanned_keypoints_count, staff_fingerprints,
+        label='staff', namespace='staff', prior_scope='staff', search_mode=search_mode, engine=engine,
+        deadline=deadline
+    )
+    processed_count = search['processed']
+    corrupted_count = search['corrupted']
+    best_match = {
+        'staff_id': search['record']['id'] if search['record'] else None,
+        'confidence': search['confidence'],
+        'templates_evaluated': search['templates_evaluated'],
+        'early_accepted': search['early_accepted'],
+        **search_coverage(search, len(staff_fingerprints)),
+        'engine': engine
+    }
 
     processing_time = time.time() - start_time
     logging.info(f"Optimized staff identification complete in {processing_time:.2f}s. Best match: {best_match}")
@@ -612,96 +1695,403 @@ def identify_staff_fingerprint_optimized(scanned_fingerprint_path, staff_fingerp
         logging.error(f"High staff fingerprint corruption rate detected: {corruption_rate:.1f}% ({corrupted_count}/{processed_count})")
 
     # Only return a match if confidence is above threshold (lowered for better recognition)
-    if best_match['confidence'] < 20.0:
+    if not accepted_match(search, match_threshold(engine, staff=True)):
         logging.info("Confidence too low, returning no match")
-        return {
+        return remember_probe_result(recent_handle, {
+            **best_match,
             'staff_id': None,
             'confidence': 0.0
-        }
+        })
 
+    record_successful_match('staff', best_match['staff_id'])
     logging.info(f"Returning best staff match with confidence: {best_match['confidence']:.2f}%")
-    return best_match
+    return remember_probe_result(recent_handle, best_match)
 
-def identify_staff_fingerprint(scanned_fingerprint_path, staff_fingerprints):
+def identify_staff_fingerprint(scanned_fingerprint, staff_fingerprints, search_mode=None, engine=None, deadline=None,
+                               probe=None):
     """
     Legacy staff identification function - now uses optimized version
     """
-    return identify_staff_fingerprint_optimized(scanned_fingerprint_path, staff_fingerprints)
+    return identify_staff_fingerprint_optimized(scanned_fingerprint, staff_fingerprints, search_mode, engine, deadline, probe)
 
-def invalidate_cache_entry(student_id):
-    """Invalidate cache entry for a specific student"""
-    cache_key = f"student_{student_id}"
-    with CACHE_LOCK:
-        if cache_key in FEATURE_CACHE:
-            del FEATURE_CACHE[cache_key]
-            logging.info(f"Invalidated cache for student {student_id}")
+def invalidate_cache_entry(student_id, finger_type=None):
+    """
+    Invalidate cached templates for a student in every worker.
+    Without a finger type this covers all of the student's fingers.
+    """
+    bump_generation(generation_slot(feature_cache_key('student', student_id, finger_type)))
+    bump_generation(RECENT_PROBES_GENERATION_SLOT)
+    logging.info(f"Invalidated cache for student {student_id}" + (f" ({finger_type})" if finger_type else ""))
 
 def invalidate_staff_cache_entry(staff_id):
-    """Invalidate cache entry for a specific staff member"""
-    cache_key = f"staff_{staff_id}"
-    with CACHE_LOCK:
-        if cache_key in FEATURE_CACHE:
-            del FEATURE_CACHE[cache_key]
-            logging.info(f"Invalidated cache for staff {staff_id}")
-
-def precompute_features_on_startup():
-    """Precompute SIFT features for all students and staff on server startup"""
-    try:
-        logging.info("Starting feature precomputation on server startup...")
-
-        BACKEND_URL = "http://localhost:5005"
+    """Invalidate the cached template for a specific staff member in every worker"""
+    bump_generation(generation_slot(feature_cache_key('staff', staff_id)))
+    bump_generation(RECENT_PROBES_GENERATION_SLOT)
+    logging.info(f"Invalidated cache for staff {staff_id}")
+
+def invalidate_scope(scope):
+    """Invalidate every template cached while serving a scope (e.g. a staff member's roster)"""
+    bump_generation(generation_slot(f"scope:{scope}"))
+    logging.info(f"Invalidated cache for scope {scope}")
+
+def invalidate_all_cache():
+    """Invalidate every cached template in every worker"""
+    bump_generation(GLOBAL_GENERATION_SLOT)
+    # This worker can also let go of the features now; searches holding a snapshot finish on it
+    GALLERY_SNAPSHOTS.clear()
+    logging.info("Invalidated entire feature cache")
+
+def apply_cache_invalidation(payload):
+    """
+    Apply a bulk invalidation request:
+        {
+            'students': [student_id, ...],
+            'fingers': [{'student_id': ..., 'finger_type': ...}, ...],
+            'staff': [staff_id, ...],
+            'rosters': [staff_id, ...],
+            'all': bool
+        }
+    Returns how many owners of each kind were invalidated.
+    Raises ValueError if the payload is malformed.
+    """
+    if not isinstance(payload, dict):
+        raise ValueError("Invalidation payload must be a JSON object")
+
+    summary = {'students': 0, 'fingers': 0, 'staff': 0, 'rosters': 0, 'all': False}
+
+    if payload.get('all'):
+        invalidate_all_cache()
+        summary['all'] = True
+
+    for student_id in payload.get('students') or []:
+        invalidate_cache_entry(student_id)
+        summary['students'] += 1
+
+    for finger in payload.get('fingers') or []:
+        if not isinstance(finger, dict) or not finger.get('student_id') or not finger.get('finger_type'):
+            raise ValueError("Each finger needs a student_id and finger_type")
+        invalidate_cache_entry(finger['student_id'], finger['finger_type'])
+        summary['fingers'] += 1
+
+    for staff_id in payload.get('staff') or []:
+        invalidate_staff_cache_entry(staff_id)
+        summary['staff'] += 1
+
+    for staff_id in payload.get('rosters') or []:
+        invalidate_scope(roster_scope(staff_id))
+        summary['rosters'] += 1
+
+    return summary
+
+def fetch_student_gallery(staff_id):
+    """Fetch the student fingerprint roster for a staff member from the backend"""
+    response = requests.get(
+        f"{BACKEND_URL}/api/students/fingerprints/{staff_id}",
+        headers={"Accept": f"{GALLERY_MIMETYPE}, application/json"},
+        timeout=30
+    )
+    response.raise_for_status()
+    return parse_student_gallery_response(response.headers.get('Content-Type', ''), response.content)
+
+def precompute_features_on_startup(staff_ids=None):
+    """
+    Precompute SIFT features for all staff and for the student rosters of the
+    given staff members (defaults to WARMUP_STAFF_IDS).
+    Student rosters are scoped per staff member, so any roster not listed here
+    is computed on demand during its first identification instead.
+    """
+    if staff_ids is None:
+        staff_ids = WARMUP_STAFF_IDS
 
-        # Precompute student features - SKIP THIS since we don't know staff_id at startup
-        # We'll compute features on-demand during first identification instead
-        logging.info("Feature precomputation skipped - will compute on-demand during identification")
-        
-        # Note: We can't precompute student features at startup because each staff has different students
-        # Features will be cached automatically during the first identification request
+    logging.info("Starting feature precomputation on server startup...")
 
+    # Precompute staff features
+    try:
+        response = requests.get(f"{BACKEND_URL}/api/staff/fingerprints/all", timeout=30)
+        if response.status_code == 200:
+            staff_data = response.json().get('data', {}).get('staff', [])
+            logging.info(f"Precomputing features for {len(staff_data)} staff members")
+
+            for staff in staff_data:
+                if has_template(staff) and not staff.get('isCorrupted'):
+                    try:
+                        get_record_features(staff, namespace='staff')
+                        logging.debug(f"Precomputed features for staff {staff['id']}")
+                    except Exception as e:
+                        logging.warning(f"Failed to precompute features for staff {staff['id']}: {str(e)}")
+        else:
+            logging.warning("Could not fetch staff for precomputation")
     except Exception as e:
-        logging.error(f"Feature precomputation failed: {str(e)}")
+        logging.error(f"Error during staff feature precomputation: {str(e)}")
 
-        # Precompute staff features
+    # Precompute student features for the configured rosters
+    for staff_id in staff_ids:
         try:
-            response = requests.get(f"{BACKEND_URL}/api/staff/fingerprints/all")
-            if response.status_code == 200:
-                staff_data = response.json().get('data', {}).get('staff', [])
-                logging.info(f"Precomputing features for {len(staff_data)} staff members")
-
-                for staff in staff_data:
-                    if staff.get('fingerprint') and not staff.get('isCorrupted'):
-                        try:
-                            fingerprint_str = clean_base64(staff['fingerprint'])
-                            fingerprint_data = base64.b64decode(fingerprint_str)
-                            validated_data = validate_fingerprint_data(fingerprint_data)
-
-                            if validated_data:
-                                get_cached_features(f"staff_{staff['id']}", validated_data)
-                                logging.debug(f"Precomputed features for staff {staff['id']}")
-                        except Exception as e:
-                            logging.warning(f"Failed to precompute features for staff {staff['id']}: {str(e)}")
-            else:
-                logging.warning("Could not fetch staff for precomputation")
+            students = fetch_student_gallery(staff_id)
+            logging.info(f"Precomputing features for {len(students)} students of staff {staff_id}")
+
+            for student in students:
+                if has_template(student) and not student.get('isCorrupted'):
+                    try:
+                        get_record_features(student, scope=roster_scope(staff_id))
+                    except Exception as e:
+                        logging.warning(f"Failed to precompute features for student {student['id']}: {str(e)}")
         except Exception as e:
-            logging.error(f"Error during staff feature precomputation: {str(e)}")
+            logging.error(f"Error during student feature precomputation for staff {staff_id}: {str(e)}")
 
-        # Log cache statistics
-        with CACHE_LOCK:
-            cache_size = len(FEATURE_CACHE)
-            logging.info(f"Feature precomputation complete. Cache contains {cache_size} entries")
+    # Log cache statistics
+    cache_size = GALLERY_SNAPSHOTS.stats()['entries']
+    logging.info(f"Feature precomputation complete. Cache contains {cache_size} entries")
+
+def precompute_template(job):
+    """
+    Decode, validate and extract one template into the feature store; runs in a pool worker.
+    Returns a report row with status 'stored', 'already_stored' or 'failed' (with a reason).
+    """
+    row = {'id': job['id'], 'finger_type': job['finger_type'], 'engine': job['engine'], 'status': 'failed', 'reason': None}
+    cache_key = feature_cache_key(job['namespace'], job['id'], job['finger_type'])
+    try:
+        validated_data = validate_fingerprint_data(decode_fingerprint_payload(job['payload']))
+        if validated_data is None:
+            row['reason'] = 'irreparable'
+            return row
+
+        digest = payload_digest(validated_data)
+        row['digest'] = digest
+        if FEATURE_STORE.contains(digest, feature_store_kind(job['engine'])):
+            row['status'] = 'already_stored'
+            return row
+
+        if job['engine'] == ENGINE_MINUTIAE:
+            _, features = extract_minutiae_features(cache_key, validated_data)
+        else:
+            _, features, _ = extract_image_features(cache_key, validated_data)
+        if features is None:
+            row['reason'] = 'no_features'
+            return row
+
+        FEATURE_STORE.save(digest, feature_store_kind(job['engine']), features)
+        row.update(status='stored', features=len(features))
+        return row
 
     except Exception as e:
-        logging.error(f"Feature precomputation failed: {str(e)}")
+        row['reason'] = str(e)
+        return row
+
+def precompute_templates(records, namespace='student', engines=(ENGINE_SIFT,), workers=None):
+    """
+    Extract features for a batch of gallery records into the feature store
+    across a process pool, so the first live identification against a newly
+    enrolled roster finds them instead of extracting inline.
+
+    Returns {'summary': {status: count}, 'failures': [report rows]}.
+    """
+    if not FEATURE_STORE.enabled:
+        raise ValueError("Feature store is disabled (FEATURE_STORE=0)")
+
+    rows = []
+    jobs = []
+    for record in records:
+        for engine in engines:
+            row = {'id': record.get('id'), 'finger_type': record.get('finger_type'), 'engine': engine, 'reason': None}
+            if record.get('isCorrupted'):
+                rows.append({**row, 'status': 'failed', 'reason': 'flagged_corrupted'})
+            elif not record.get('fingerprint'):
+                precomputed = record.get('descriptors' if engine == ENGINE_SIFT else 'minutiae') is not None
+                if precomputed and record.get('template') is None and not precomputed_features_current(record, engine):
+                    rows.append({**row, 'status': 'failed', 'reason': 'stale_version'})
+                    continue
+                has_features = record.get('template') is not None or precomputed
+                rows.append({**row, 'status': 'precomputed' if has_features else 'failed',
+                             'reason': None if has_features else 'missing'})
+            else:
+                payload = record['fingerprint']
+                jobs.append({
+                    **row,
+                    'namespace': namespace,
+                    # Binary gallery payloads are memoryviews of the request and can't be pickled
+                    'payload': bytes(payload) if isinstance(payload, memoryview) else payload
+                })
+
+    workers = workers or PRECOMPUTE_WORKERS
+    started = time.time()
+    if jobs:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=PRECOMPUTE_MP_CONTEXT) as executor:
+            rows.extend(executor.map(precompute_template, jobs, chunksize=max(1, len(jobs) // (workers * 8))))
+
+    summary = {}
+    for row in rows:
+        summary[row['status']] = summary.get(row['status'], 0) + 1
+    logging.info(f"Precomputed {len(jobs)} {namespace} templates in {time.time() - started:.1f}s with {workers} workers: {summary}")
+    return {
+        'summary': summary,
+        'failures': [row for row in rows if row['status'] == 'failed']
+    }
+
+def precompute_request_records(body):
+    """
+    Resolve the records and namespace of a precompute request: a backend
+    roster ('staff_id'), the staff gallery ('staff': true) or posted
+    'templates' (a JSON list, or a binary gallery file part).
+    """
+    if body.get('staff_id'):
+        return fetch_student_gallery(body['staff_id']), 'student'
+    if str(body.get('staff', '')).lower() in ('1', 'true'):
+        response = requests.get(f"{BACKEND_URL}/api/staff/fingerprints/all", timeout=30)
+        response.raise_for_status()
+        return response.json().get('data', {}).get('staff', []), 'staff'
+    templates = body.get('templates')
+    if isinstance(templates, str):
+        templates = parse_gallery_payload(templates)
+    if templates is None:
+        raise ValueError("Provide staff_id, staff or templates")
+    return templates, 'staff' if body.get('namespace') == 'staff' else 'student'
+
+def request_engines(value):
+    """Engines named in a comma-separated 'engine' field, defaulting to the default engine"""
+    engines = [engine for engine in str(value or '').split(',') if engine in (ENGINE_SIFT, ENGINE_MINUTIAE)]
+    return tuple(engines) or (DEFAULT_MATCH_ENGINE,)
+
+def segmentation_summary(entries):
+    """Aggregate the mask stats of cached SIFT entries"""
+    stats = [entry[3] for entry in entries if len(entry) > 3 and entry[3] is not None]
+    segmented = [entry for entry in stats if entry['segmented']]
+    return {
+        'enabled': SIFT_SEGMENTATION,
+        'entries': len(stats),
+        'segmented': len(segmented),
+        'mean_foreground': round(sum(entry['foreground'] for entry in segmented) / len(segmented), 4) if segmented else None
+    }
 
 def get_cache_stats():
     """Get cache statistics for monitoring"""
-    with CACHE_LOCK:
-        return {
-            'cache_size': len(FEATURE_CACHE),
-            'cache_ttl': CACHE_TTL,
-            'cache_timestamp': CACHE_TIMESTAMP,
-            'memory_usage_mb': len(FEATURE_CACHE) * 0.1  # Rough estimate
-        }
+    index = GALLERY_SNAPSHOTS.index()
+    snapshots = GALLERY_SNAPSHOTS.stats()
+    return {
+        'cache_size': len(index),
+        'cache_ttl': CACHE_TTL,
+        'cache_timestamp': snapshots['oldest_created_at'],
+        'snapshots': snapshots,
+        'global_generation': CACHE_GENERATIONS[GLOBAL_GENERATION_SLOT],
+        'hits': CACHE_COUNTERS['hits'],
+        'misses': CACHE_COUNTERS['misses'],
+        'coalesced': CACHE_COUNTERS['coalesced'],
+        'inflight': len(INFLIGHT_FEATURES),
+        'repair_cache_size': len(REPAIR_CACHE),
+        'recent_probes': RECENT_PROBES.stats(),
+        'feature_store': FEATURE_STORE.stats(),
+        'segmentation': segmentation_summary(index.values()),
+        'worker_pid': os.getpid(),
+        'memory_usage_mb': len(index) * 0.1  # Rough estimate
+    }
+
+def request_timeout(headers):
+    """Get a request's queueing deadline in seconds from its X-Request-Timeout-Ms header"""
+    try:
+        timeout_ms = float(headers.get('X-Request-Timeout-Ms', ''))
+        if timeout_ms > 0:
+            return timeout_ms / 1000.0
+    except ValueError:
+        pass
+    return ADMISSION_TIMEOUT_S
+
+def request_deadline(budget_value, headers, started=None):
+    """
+    Get a request's identification deadline (time.monotonic()) from its
+    'budget_ms' field or X-Match-Budget-Ms header, counted from `started`
+    (when the request arrived, before any admission queueing). None if the
+    request has no budget and MATCH_BUDGET_MS is unset.
+    """
+    try:
+        budget_ms = float(budget_value or headers.get('X-Match-Budget-Ms') or DEFAULT_MATCH_BUDGET_MS)
+    except ValueError:
+        budget_ms = DEFAULT_MATCH_BUDGET_MS
+    if budget_ms <= 0:
+        return None
+    return (started if started is not None else time.monotonic()) + budget_ms / 1000.0
+
+def request_engine(value):
+    """Get a request's matching engine from its 'engine' field, falling back to the default"""
+    if value in (ENGINE_SIFT, ENGINE_MINUTIAE):
+        return value
+    return DEFAULT_MATCH_ENGINE
+
+def request_finger_type(value):
+    """Get a request's finger hint from its 'finger_type' field, or None if absent or unknown"""
+    value = (value or '').strip().lower()
+    return value if value in FINGER_TYPES else None
+
+def request_course_id(value):
+    """Get a request's course scope from its 'course_id' field (a course ID or section code), or None"""
+    value = str(value or '').strip()
+    return value or None
+
+def request_search_mode(value):
+    """Get a request's search mode from its 'search_mode' field, falling back to the default"""
+    if value in (SEARCH_MODE_EXHAUSTIVE, SEARCH_MODE_ORDERED):
+        return value
+    return DEFAULT_SEARCH_MODE
+
+def assess_fingerprint_bytes(image_data):
+    """Quality report for an encoded fingerprint image, as checked before enrollment"""
+    image = cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_COLOR) if len(image_data) else None
+    return assess_quality(image)
+
+def feature_template_body(template, count, engine):
+    """JSON response body for an extracted feature template"""
+    return {
+        "status": "success",
+        "template": base64.b64encode(template).decode('ascii'),
+        "engine": engine,
+        "extractor_version": TEMPLATE_EXTRACTOR_VERSIONS[engine],
+        "features": count,
+        "bytes": len(template)
+    }
+
+def wants_binary_template(args, headers):
+    """Whether a caller asked for the raw template (?format=binary or an Accept header) instead of JSON"""
+    return args.get('format') == 'binary' or TEMPLATE_MIMETYPE in headers.get('Accept', '')
+
+def request_identifier(headers):
+    """Use the caller's X-Request-Id (so kiosk logs line up with diagnostics) or make one up"""
+    return headers.get('X-Request-Id') or uuid.uuid4().hex
+
+def probe_quality_body(rejection):
+    """JSON body for a probe rejected by the quality gate"""
+    return {
+        "status": "error",
+        "message": str(rejection),
+        "reason": rejection.reason,
+        "quality": rejection.metrics
+    }
+
+def admission_rejected_body(rejection):
+    """JSON body for a request shed by admission control"""
+    return {
+        "status": "error",
+        "message": "Server busy, please retry",
+        "reason": rejection.reason,
+        "retry_after": rejection.retry_after
+    }
+
+def admitted(priority):
+    """Place a Flask view behind the admission queue in the given priority class"""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            # Match budgets count from here, so time spent queued is spent from the budget
+            g.request_started = time.monotonic()
+            try:
+                with ADMISSION.admit(priority, request_timeout(request.headers)):
+                    return view(*args, **kwargs)
+            except AdmissionRejected as e:
+                logging.warning(f"Shed {request.path}: {e.reason} (retry after {e.retry_after}s)")
+                response = jsonify(admission_rejected_body(e))
+                response.status_code = 503
+                response.headers['Retry-After'] = str(e.retry_after)
+                return response
+        return wrapper
+    return decorator
 
 def allowed_file(filename):
     return '.' in filename and \
@@ -727,7 +2117,8 @@ def create_app(test_config=None):
         logging.info(f"Created upload folder: {UPLOAD_FOLDER}")
 
     # Precompute features on startup
-    precompute_features_on_startup()
+    if WARMUP_ON_STARTUP:
+        precompute_features_on_startup()
 
     @app.route('/')
     def home():
@@ -761,6 +2152,7 @@ def create_app(test_config=None):
             return jsonify({"status": "success"})
 
     @app.route('/identify/fingerprint', methods=['POST'])
+    @admitted(PRIORITY_STUDENT)
     def identify_fingerprint_endpoint():
         try:
             if request.method == 'POST':
@@ -773,15 +2165,28 @@ def create_app(test_config=None):
                     logging.error("Staff ID is required")
                     return jsonify({"status": "error", "message": "Staff ID is required"}), 400
 
+                file = request.files['file']
+                if file.filename == '':
+                    logging.error("No file selected")
+                    return jsonify({"status": "error", "message": "No file selected"}), 400
+
+                if not allowed_file(file.filename):
+                    logging.error(f"Invalid file type: {file.filename}")
+                    return jsonify({"status": "error", "message": "Invalid file type"}), 400
+
+                # Decode and extract the probe while the roster is being fetched
+                scanned = file.read()
+                engine = request_engine(request.form.get('engine'))
+                probe = start_probe_extraction(scanned, engine)
+
                 try:
-                    BACKEND_URL = "http://localhost:5005"
                     logging.info(f"Fetching all student fingerprints for identification")
-                    response = requests.get(f"{BACKEND_URL}/api/students/fingerprints/{staff_id}")
-                    if response.status_code != 200:
-                        logging.error(f"Failed to fetch students' fingerprints: {response.status_code}")
+                    try:
+                        students_fingerprints = fetch_student_gallery(staff_id)
+                    except requests.HTTPError as e:
+                        logging.error(f"Failed to fetch students' fingerprints: {e.response.status_code}")
                         return jsonify({"status": "error", "message": "Failed to fetch students' fingerprints"}), 500
 
-                    students_fingerprints = response.json().get('data', {}).get('students', [])
                     if not students_fingerprints:
                         logging.warning("No students found with fingerprints")
                         return jsonify({"status": "error", "message": "No students found with fingerprints"}), 200
@@ -791,84 +2196,91 @@ def create_app(test_config=None):
                 except requests.RequestException as e:
                     logging.error(f"Failed to connect to backend: {str(e)}")
                     return jsonify({"status": "error", "message": f"Failed to connect to backend: {str(e)}"}), 500
+                except GalleryFormatError as e:
+                    logging.error(f"Invalid binary gallery from backend: {str(e)}")
+                    return jsonify({"status": "error", "message": "Invalid fingerprints data format"}), 500
+
+                # Match from memory; diagnostic capture happens off the request path
+                request_id = request_identifier(request.headers)
+
+                # DEBUG LOGS - Enhanced debugging
+                logging.info("=" * 50)
+                logging.info("STARTING FINGERPRINT IDENTIFICATION")
+                logging.info(f"Students to check: {len(students_fingerprints)}")
+                logging.info(f"Request {request_id}: scanned fingerprint is {len(scanned)} bytes")
+                logging.info("=" * 50)
+
+                identification_result = identify_fingerprint(
+                    scanned, students_fingerprints, roster_scope(staff_id),
+                    request_search_mode(request.form.get('search_mode')), engine,
+                    deadline=request_deadline(request.form.get('budget_ms'), request.headers, g.get('request_started')),
+                    probe=probe
+                )
 
-                file = request.files['file']
-                if file.filename == '':
-                    logging.error("No file selected")
-                    return jsonify({"status": "error", "message": "No file selected"}), 400
-
-                if file and allowed_file(file.filename):
-                    # Save with original extension to preserve format
-                    filename = secure_filename(file.filename)
-                    scanned_path = os.path.join(app.config['UPLOAD_FOLDER'], f"scanned_fingerprint_{filename}")
-                    file.save(scanned_path)
-                    logging.info(f"Saved scanned fingerprint to: {scanned_path}")
-
-                    # DEBUG LOGS - Enhanced debugging
-                    logging.info("=" * 50)
-                    logging.info("STARTING FINGERPRINT IDENTIFICATION")
-                    logging.info(f"Students to check: {len(students_fingerprints)}")
-                    logging.info(f"Scanned file saved to: {scanned_path}")
-                    logging.info(f"File exists: {os.path.exists(scanned_path)}")
-                    if os.path.exists(scanned_path):
-                        file_size = os.path.getsize(scanned_path)
-                        logging.info(f"Scanned file size: {file_size} bytes")
-                    logging.info("=" * 50)
-
-                    identification_result = identify_fingerprint(scanned_path, students_fingerprints)
-
-                    # DEBUG LOGS - Enhanced result logging
-                    logging.info("=" * 50)
-                    logging.info("IDENTIFICATION RESULT:")
-                    logging.info(f"Student ID: {identification_result.get('student_id')}")
-                    logging.info(f"Confidence: {identification_result.get('confidence'):.2f}%")
-                    if identification_result.get('student_id') is None:
-                        logging.info("REASON FOR FAILURE: Confidence below threshold")
-                        logging.info("TROUBLESHOOTING:")
-                        logging.info("  - Check scanned fingerprint image quality")
-                        logging.info("  - Verify enrolled fingerprints are valid")
-                        logging.info("  - Ensure scanner is clean and well-positioned")
-                        logging.info("  - Try re-enrolling student fingerprint")
-                    logging.info("=" * 50)
-
-                    # Log detailed results for debugging
-                    if identification_result.get('student_id'):
-                        logging.info(f"✓ SUCCESS: Matched student {identification_result['student_id']} with {identification_result['confidence']:.2f}% confidence")
-                    else:
-                        logging.warning("✗ FAILED: No student match found - confidence too low or no valid fingerprints")
-                        logging.info(f"Debug info: Best match confidence was {identification_result.get('confidence', 0):.2f}% (threshold: 15.0%)")
-                        logging.info("Troubleshooting tips:")
-                        logging.info("  - Check if scanned fingerprint is clear and well-positioned")
-                        logging.info("  - Verify enrolled fingerprints are not corrupted")
-                        logging.info("  - Ensure sufficient lighting and clean fingerprint scanner")
-                        logging.info("  - Try re-enrolling the fingerprint if issues persist")
-                        logging.info("  - Check server logs for detailed matching information")
-
-                    logging.info("Keeping scanned fingerprint for diagnostics")
-
-                    # Debug: Log the exact response being sent
-                    response_data = {
-                        "status": "success",
-                        "message": "Identification completed successfully",
-                        "student_id": identification_result['student_id'],
-                        "confidence": identification_result['confidence']
-                    }
-                    logging.info(f"DEBUG: Sending response: {response_data}")
-                    return jsonify(response_data)
+                # DEBUG LOGS - Enhanced result logging
+                logging.info("=" * 50)
+                logging.info("IDENTIFICATION RESULT:")
+                logging.info(f"Student ID: {identification_result.get('student_id')}")
+                logging.info(f"Confidence: {identification_result.get('confidence'):.2f}%")
+                if identification_result.get('student_id') is None:
+                    logging.info("REASON FOR FAILURE: Confidence below threshold")
+                    logging.info("TROUBLESHOOTING:")
+                    logging.info("  - Check scanned fingerprint image quality")
+                    logging.info("  - Verify enrolled fingerprints are valid")
+                    logging.info("  - Ensure scanner is clean and well-positioned")
+                    logging.info("  - Try re-enrolling student fingerprint")
+                logging.info("=" * 50)
+
+                # Log detailed results for debugging
+                if identification_result.get('student_id'):
+                    logging.info(f"✓ SUCCESS: Matched student {identification_result['student_id']} with {identification_result['confidence']:.2f}% confidence")
                 else:
-                    logging.error("Invalid file type")
-                    return jsonify({"status": "error", "message": "Invalid file type"}), 400
+                    logging.warning("✗ FAILED: No student match found - confidence too low or no valid fingerprints")
+                    logging.info(f"Debug info: Best match confidence was {identification_result.get('confidence', 0):.2f}% (threshold: 15.0%)")
+                    logging.info("Troubleshooting tips:")
+                    logging.info("  - Check if scanned fingerprint is clear and well-positioned")
+                    logging.info("  - Verify enrolled fingerprints are not corrupted")
+                    logging.info("  - Ensure sufficient lighting and clean fingerprint scanner")
+                    logging.info("  - Try re-enrolling the fingerprint if issues persist")
+                    logging.info("  - Check server logs for detailed matching information")
+
+                PROBE_STORE.capture(request_id, 'student', scanned, identification_result)
+
+                # Debug: Log the exact response being sent
+                response_data = {
+                    "status": "success",
+                    "message": "Identification completed successfully",
+                    "request_id": request_id,
+                    "student_id": identification_result['student_id'],
+                    "confidence": identification_result['confidence'],
+                    "templates_evaluated": identification_result['templates_evaluated'],
+                    "early_accepted": identification_result['early_accepted'],
+                    "repeated_probe": identification_result.get('repeated_probe', False),
+                    "exhaustive": identification_result['exhaustive'],
+                    "coverage": identification_result['coverage'],
+                    "budget_exhausted": identification_result['budget_exhausted'],
+                    "engine": identification_result['engine']
+                }
+                logging.info(f"DEBUG: Sending response: {response_data}")
+                return jsonify(response_data)
             else:
                 return jsonify({"status": "success"})
+        except ProbeQualityError as e:
+            return jsonify(probe_quality_body(e)), 422
         except Exception as e:
             logging.error(f"Unexpected error in identify_fingerprint_endpoint: {str(e)}")
             return jsonify({"status": "error", "message": "Internal server error"}), 500
 
     @app.route('/identify/fingerprint/multi', methods=['POST'])
+    @admitted(PRIORITY_STUDENT)
     def identify_fingerprint_multi_endpoint():
         """
         Identifies a fingerprint against ALL enrolled fingerprints for ALL students.
         This supports multiple fingerprints per student (up to 5).
+        An optional 'finger_type' field restricts the search to that finger
+        first, widening to all fingers unless it finds a confident match. Likewise an
+        optional 'course_id' (course ID or section code) searches the scheduled
+        class before the rest of the school.
 
         Returns:
             - student_id: The matched student's ID
@@ -881,233 +2293,101 @@ def create_app(test_config=None):
                     logging.error("No file part in request")
                     return jsonify({"status": "error", "message": "No file part"}), 400
 
-                fingerprints_data_json = request.form.get('fingerprints_data')
-                if not fingerprints_data_json:
-                    logging.error("No fingerprints data provided")
-                    return jsonify({"status": "error", "message": "No fingerprints data provided"}), 400
+                file = request.files['file']
+                if file.filename == '':
+                    logging.error("No file selected")
+                    return jsonify({"status": "error", "message": "No file selected"}), 400
+
+                if not allowed_file(file.filename):
+                    logging.error(f"Invalid file type: {file.filename}")
+                    return jsonify({"status": "error", "message": "Invalid file type"}), 400
+
+                # Decode and extract the probe while the gallery is being parsed
+                scanned = file.read()
+                engine = request_engine(request.form.get('engine'))
+                probe = start_probe_extraction(scanned, engine)
 
                 try:
-                    # Parse the fingerprints data sent from Node.js server
-                    all_fingerprints = json.loads(fingerprints_data_json)
+                    # Parse the fingerprints data sent from Node.js server (JSON field or binary gallery part)
+                    all_fingerprints = read_gallery_payload('fingerprints_data')
+                    if all_fingerprints is None:
+                        logging.error("No fingerprints data provided")
+                        return jsonify({"status": "error", "message": "No fingerprints data provided"}), 400
+
                     logging.info(f"Received {len(all_fingerprints)} fingerprint records from Node.js server")
 
                     if not all_fingerprints:
                         logging.warning("No fingerprints found for identification")
                         return jsonify({"status": "error", "message": "No students found with fingerprints"}), 404
 
-                except json.JSONDecodeError as e:
+                except (json.JSONDecodeError, GalleryFormatError) as e:
                     logging.error(f"Failed to parse fingerprints data: {str(e)}")
                     return jsonify({"status": "error", "message": "Invalid fingerprints data format"}), 400
 
-                file = request.files['file']
-                if file.filename == '':
-                    logging.error("No file selected")
-                    return jsonify({"status": "error", "message": "No file selected"}), 400
+                # Match from memory; diagnostic capture happens off the request path
+                request_id = request_identifier(request.headers)
+
+                # DEBUG LOGS
+                logging.info("=" * 50)
+                logging.info("STARTING MULTI-FINGERPRINT IDENTIFICATION")
+                logging.info(f"Total fingerprint records to check: {len(all_fingerprints)}")
+                logging.info(f"Request {request_id}: scanned fingerprint is {len(scanned)} bytes")
+                logging.info("=" * 50)
+
+                # Perform identification
+                identification_result = identify_fingerprint_multi(
+                    scanned, all_fingerprints, request_search_mode(request.form.get('search_mode')),
+                    engine, request_finger_type(request.form.get('finger_type')),
+                    request_deadline(request.form.get('budget_ms'), request.headers, g.get('request_started')),
+                    probe=probe, course_id=request_course_id(request.form.get('course_id'))
+                )
 
-                if file and allowed_file(file.filename):
-                    # Save scanned fingerprint
-                    filename = secure_filename(file.filename)
-                    scanned_path = os.path.join(app.config['UPLOAD_FOLDER'], f"scanned_multi_{filename}")
-                    file.save(scanned_path)
-                    logging.info(f"Saved scanned fingerprint to: {scanned_path}")
-
-                    # DEBUG LOGS
-                    logging.info("=" * 50)
-                    logging.info("STARTING MULTI-FINGERPRINT IDENTIFICATION")
-                    logging.info(f"Total fingerprint records to check: {len(all_fingerprints)}")
-                    logging.info(f"Scanned file: {scanned_path}")
-                    logging.info("=" * 50)
-
-                    # Perform identification
-                    identification_result = identify_fingerprint_multi(scanned_path, all_fingerprints)
-
-                    # DEBUG LOGS
-                    logging.info("=" * 50)
-                    logging.info("MULTI-FINGERPRINT IDENTIFICATION RESULT:")
-                    logging.info(f"Student ID: {identification_result.get('student_id')}")
-                    logging.info(f"Confidence: {identification_result.get('confidence'):.2f}%")
-                    logging.info(f"Matched Finger: {identification_result.get('finger_type')}")
-                    logging.info("=" * 50)
-
-                    # Log detailed results
-                    if identification_result.get('student_id'):
-                        logging.info(f"✓ SUCCESS: Matched student {identification_result['student_id']} - {identification_result['finger_type']} finger with {identification_result['confidence']:.2f}% confidence")
-                    else:
-                        logging.warning("✗ FAILED: No student match found")
-                        logging.info(f"Best match confidence was {identification_result.get('confidence', 0):.2f}%")
-
-                    # Cleanup
-                    if os.path.exists(scanned_path):
-                        os.remove(scanned_path)
-                        logging.info("Cleaned up scanned fingerprint file")
-
-                    return jsonify({
-                        "status": "success",
-                        "message": "Multi-fingerprint identification completed successfully",
-                        "student_id": identification_result['student_id'],
-                        "confidence": identification_result['confidence'],
-                        "finger_type": identification_result.get('finger_type')
-                    })
+                # DEBUG LOGS
+                logging.info("=" * 50)
+                logging.info("MULTI-FINGERPRINT IDENTIFICATION RESULT:")
+                logging.info(f"Student ID: {identification_result.get('student_id')}")
+                logging.info(f"Confidence: {identification_result.get('confidence'):.2f}%")
+                logging.info(f"Matched Finger: {identification_result.get('finger_type')}")
+                logging.info("=" * 50)
+
+                # Log detailed results
+                if identification_result.get('student_id'):
+                    logging.info(f"✓ SUCCESS: Matched student {identification_result['student_id']} - {identification_result['finger_type']} finger with {identification_result['confidence']:.2f}% confidence")
                 else:
-                    logging.error("Invalid file type")
-                    return jsonify({"status": "error", "message": "Invalid file type"}), 400
+                    logging.warning("✗ FAILED: No student match found")
+                    logging.info(f"Best match confidence was {identification_result.get('confidence', 0):.2f}%")
+
+                PROBE_STORE.capture(request_id, 'multi', scanned, identification_result)
+
+                return jsonify({
+                    "status": "success",
+                    "message": "Multi-fingerprint identification completed successfully",
+                    "request_id": request_id,
+                    "student_id": identification_result['student_id'],
+                    "confidence": identification_result['confidence'],
+                    "finger_type": identification_result.get('finger_type'),
+                    "templates_evaluated": identification_result['templates_evaluated'],
+                    "early_accepted": identification_result['early_accepted'],
+                    "finger_fallback": identification_result['finger_fallback'],
+                    "course_fallback": identification_result['course_fallback'],
+                    "repeated_probe": identification_result.get('repeated_probe', False),
+                    "exhaustive": identification_result['exhaustive'],
+                    "coverage": identification_result['coverage'],
+                    "budget_exhausted": identification_result['budget_exhausted'],
+                    "engine": identification_result['engine']
+                })
             else:
                 return jsonify({"status": "success"})
+        except ProbeQualityError as e:
+            return jsonify(probe_quality_body(e)), 422
         except Exception as e:
             logging.error(f"Unexpected error in identify_fingerprint_multi_endpoint: {str(e)}")
             import traceback
             logging.error(traceback.format_exc())
             return jsonify({"status": "error", "message": "Internal server error"}), 500
 
-
-    def identify_fingerprint_multi(scanned_fingerprint_path, all_fingerprints):
-        """
-        Optimized multi-fingerprint identification.
-        Identifies against ALL enrolled fingerprints for ALL students.
-        
-        Args:
-            scanned_fingerprint_path: Path to the scanned fingerprint image
-            all_fingerprints: List of all fingerprint records with format:
-                [{
-                    'id': student_id,
-                    'name': student_name,
-                    'matric_no': student_matric_no,
-                    'grade': student_grade,
-                    'fingerprint': fingerprint_data,
-                    'finger_type': 'thumb' | 'index' | 'middle' | 'ring' | 'pinky',
-                    'fingerprint_id': unique_fingerprint_id,
-                    'courses': [...]
-                }, ...]
-        
-        Returns:
-            {
-                'student_id': matched_student_id or None,
-                'confidence': confidence_score,
-                'finger_type': matched_finger_type or None
-            }
-        """
-        best_match = {
-            'student_id': None,
-            'confidence': 0.0,
-            'finger_type': None
-        }
-
-        logging.info(f"Starting multi-fingerprint identification for {len(all_fingerprints)} fingerprint records")
-
-        start_time = time.time()
-        corrupted_count = 0
-        processed_count = 0
-
-        # Compute features for the scanned fingerprint
-        try:
-            logging.info(f"Loading scanned fingerprint from: {scanned_fingerprint_path}")
-            scanned_img = cv2.imread(scanned_fingerprint_path)
-            if scanned_img is None:
-                logging.error("Failed to load scanned fingerprint image")
-                return best_match
-
-            logging.info(f"Scanned image shape: {scanned_img.shape}, dtype: {scanned_img.dtype}")
-            scanned_keypoints, scanned_descriptors = compute_sift_features(scanned_img)
-            scanned_keypoints_count = len(scanned_keypoints) if scanned_keypoints else 0
-
-            logging.info(f"Scanned fingerprint: {scanned_keypoints_count} keypoints, {len(scanned_descriptors) if scanned_descriptors is not None else 0} descriptors")
-
-            if scanned_descriptors is None or len(scanned_descriptors) == 0:
-                logging.error("No descriptors found in scanned fingerprint")
-                return best_match
-
-        except Exception as e:
-            logging.error(f"Error processing scanned fingerprint: {str(e)}")
-            return best_match
-
-        # Process each fingerprint record
-        for fingerprint_record in all_fingerprints:
-            try:
-                processed_count += 1
-
-                student_id = fingerprint_record.get('id')
-                finger_type = fingerprint_record.get('finger_type', 'unknown')
-                fingerprint_id = fingerprint_record.get('fingerprint_id', 'unknown')
-
-                # Check if fingerprint data is available
-                if not fingerprint_record.get('fingerprint'):
-                    logging.warning(f"Fingerprint record {fingerprint_id} has no fingerprint data")
-                    continue
-
-                # Check for corruption flags
-                if fingerprint_record.get('isCorrupted'):
-                    logging.warning(f"Fingerprint {fingerprint_id} is corrupted (detected by Node.js)")
-                    corrupted_count += 1
-                    continue
-
-                # Clean and decode base64 fingerprint
-                fingerprint_str = clean_base64(fingerprint_record['fingerprint'])
-                fingerprint_data = base64.b64decode(fingerprint_str)
-
-                # Validate and repair if needed
-                validated_data = validate_fingerprint_data(fingerprint_data)
-                if validated_data is None:
-                    logging.warning(f"Failed to validate/repair fingerprint {fingerprint_id}")
-                    corrupted_count += 1
-                    continue
-
-                # Get cached features or compute them
-                # Use unique cache key combining student_id and finger_type
-                cache_key = f"{student_id}_{finger_type}"
-                student_keypoints, student_descriptors = get_cached_features(cache_key, validated_data)
-
-                if student_descriptors is None or len(student_descriptors) == 0:
-                    logging.warning(f"No descriptors found for fingerprint {fingerprint_id}")
-                    corrupted_count += 1
-                    continue
-
-                student_keypoints_count = len(student_keypoints) if student_keypoints else 0
-
-                # Compare fingerprints
-                match_score = get_fingerprint_match_score_optimized(
-                    scanned_descriptors, student_descriptors,
-                    scanned_keypoints_count, student_keypoints_count
-                )
-
-                # Log matching info
-                logging.info(f"Matching student {student_id} ({finger_type}): score={match_score:.2f}%, scanned_kp={scanned_keypoints_count}, enrolled_kp={student_keypoints_count}")
-
-                # Update best match if this score is higher
-                if match_score > best_match['confidence']:
-                    best_match = {
-                        'student_id': student_id,
-                        'confidence': match_score,
-                        'finger_type': finger_type
-                    }
-                    logging.info(f"✓ New best match: student {student_id} ({finger_type}) with score {match_score:.2f}%")
-
-            except Exception as e:
-                logging.error(f"Error processing fingerprint record: {str(e)}")
-                corrupted_count += 1
-                continue
-
-        processing_time = time.time() - start_time
-        logging.info(f"Multi-fingerprint identification complete in {processing_time:.2f}s")
-        logging.info(f"Processed {processed_count} fingerprint records, detected {corrupted_count} corrupted")
-
-        # Alert if high corruption rate
-        corruption_rate = (corrupted_count / processed_count) * 100 if processed_count > 0 else 0
-        if corruption_rate > 20:
-            logging.error(f"High corruption rate: {corruption_rate:.1f}% ({corrupted_count}/{processed_count})")
-
-        # Only return match if confidence is above threshold
-        if best_match['confidence'] < 5.0:
-            logging.warning(f"Low confidence ({best_match['confidence']:.2f}%), returning no match")
-            return {
-                'student_id': None,
-                'confidence': 0.0,
-                'finger_type': None
-            }
-
-        logging.info(f"✓ SUCCESS: Returning best match - student {best_match['student_id']} ({best_match['finger_type']}) with {best_match['confidence']:.2f}% confidence")
-        return best_match
-
     @app.route('/identify/staff-fingerprint', methods=['POST'])
+    @admitted(PRIORITY_STAFF)
     def identify_staff_fingerprint_endpoint():
         try:
             if request.method == 'POST':
@@ -1115,15 +2395,28 @@ def create_app(test_config=None):
                     logging.error("No file part in request")
                     return jsonify({"status": "error", "message": "No file part"}), 400
 
-                staff_fingerprints_json = request.form.get('staff_fingerprints')
-                if not staff_fingerprints_json:
-                    logging.error("No staff fingerprints provided in request")
-                    return jsonify({"status": "error", "message": "No staff fingerprints provided"}), 400
+                file = request.files['file']
+                if file.filename == '':
+                    logging.error("No file selected")
+                    return jsonify({"status": "error", "message": "No file selected"}), 400
+
+                if not allowed_file(file.filename):
+                    logging.error(f"Invalid file type: {file.filename}")
+                    return jsonify({"status": "error", "message": "Invalid file type"}), 400
+
+                # Decode and extract the probe while the gallery is being parsed
+                scanned = file.read()
+                engine = request_engine(request.form.get('engine'))
+                probe = start_probe_extraction(scanned, engine)
 
                 try:
-                    staff_fingerprints = json.loads(staff_fingerprints_json)
+                    staff_fingerprints = read_gallery_payload('staff_fingerprints')
+                    if staff_fingerprints is None:
+                        logging.error("No staff fingerprints provided in request")
+                        return jsonify({"status": "error", "message": "No staff fingerprints provided"}), 400
+
                     logging.info(f"Received {len(staff_fingerprints)} staff fingerprints from Node.js server")
-                except json.JSONDecodeError as e:
+                except (json.JSONDecodeError, GalleryFormatError) as e:
                     logging.error(f"Failed to parse staff fingerprints JSON: {str(e)}")
                     return jsonify({"status": "error", "message": "Invalid staff fingerprints format"}), 400
 
@@ -1131,44 +2424,156 @@ def create_app(test_config=None):
                     logging.warning("No staff found with fingerprints")
                     return jsonify({"status": "error", "message": "No staff found with fingerprints"}), 404
 
-                file = request.files['file']
-                if file.filename == '':
-                    logging.error("No file selected")
-                    return jsonify({"status": "error", "message": "No file selected"}), 400
-
-                if file and allowed_file(file.filename):
-                    scanned_path = os.path.join(app.config['UPLOAD_FOLDER'], "scanned_staff_fingerprint.png")
-                    file.save(scanned_path)
-                    logging.info(f"Saved scanned staff fingerprint to: {scanned_path}")
+                request_id = request_identifier(request.headers)
 
-                    identification_result = identify_staff_fingerprint_optimized(scanned_path, staff_fingerprints)
-
-                    if os.path.exists(scanned_path):
-                        os.remove(scanned_path)
-                        logging.info("Cleaned up scanned staff fingerprint file")
+                identification_result = identify_staff_fingerprint_optimized(
+                    scanned, staff_fingerprints, request_search_mode(request.form.get('search_mode')), engine,
+                    request_deadline(request.form.get('budget_ms'), request.headers, g.get('request_started')),
+                    probe=probe
+                )
 
-                    return jsonify({
-                        "status": "success",
-                        "message": "Staff identification completed successfully",
-                        "staff_id": identification_result['staff_id'],
-                        "confidence": identification_result['confidence']
-                    })
-                else:
-                    logging.error("Invalid file type")
-                    return jsonify({"status": "error", "message": "Invalid file type"}), 400
+                PROBE_STORE.capture(request_id, 'staff', scanned, identification_result)
+
+                return jsonify({
+                    "status": "success",
+                    "message": "Staff identification completed successfully",
+                    "request_id": request_id,
+                    "staff_id": identification_result['staff_id'],
+                    "confidence": identification_result['confidence'],
+                    "templates_evaluated": identification_result['templates_evaluated'],
+                    "early_accepted": identification_result['early_accepted'],
+                    "repeated_probe": identification_result.get('repeated_probe', False),
+                    "exhaustive": identification_result['exhaustive'],
+                    "coverage": identification_result['coverage'],
+                    "budget_exhausted": identification_result['budget_exhausted'],
+                    "engine": identification_result['engine']
+                })
             else:
                 return jsonify({"status": "success"})
+        except ProbeQualityError as e:
+            return jsonify(probe_quality_body(e)), 422
         except Exception as e:
             logging.error(f"Unexpected error in identify_staff_fingerprint_endpoint: {str(e)}")
             import traceback
             logging.error(traceback.format_exc())
             return jsonify({"status": "error", "message": "Internal server error"}), 500
 
+    @app.route('/quality/fingerprint', methods=['POST'])
+    def fingerprint_quality_endpoint():
+        """Assess a fingerprint before enrollment (file upload or base64 'fingerprint' field)"""
+        try:
+            if 'file' in request.files:
+                image_data = request.files['file'].read()
+            elif request.form.get('fingerprint'):
+                image_data = decode_fingerprint_payload(request.form['fingerprint'])
+            else:
+                return jsonify({"status": "error", "message": "No fingerprint provided"}), 400
+
+            return jsonify({"status": "success", "quality": assess_fingerprint_bytes(image_data)})
+        except Exception as e:
+            logging.error(f"Error assessing fingerprint quality: {str(e)}")
+            return jsonify({"status": "error", "message": "Invalid fingerprint data"}), 400
+
+    @app.route('/diagnostics/probes', methods=['GET'])
+    def diagnostics_probes_endpoint():
+        """Report probe capture counters and this worker's most recent captures"""
+        return jsonify({
+            "status": "success",
+            "capture": PROBE_STORE.stats(),
+            "recent": PROBE_STORE.recent(int(request.args.get('limit', 50)))
+        })
+
+    @app.route('/diagnostics/probes/<request_id>', methods=['GET'])
+    def diagnostics_probe_endpoint(request_id):
+        """Get the captured result for a request id"""
+        entry = PROBE_STORE.lookup(request_id)
+        if entry is None:
+            return jsonify({"status": "error", "message": "No capture for this request"}), 404
+        return jsonify({"status": "success", "probe": entry})
+
+    @app.route('/diagnostics/probes/<request_id>/image', methods=['GET'])
+    def diagnostics_probe_image_endpoint(request_id):
+        """Download the captured probe image for a request id"""
+        image = PROBE_STORE.image_file(request_id)
+        if image is None:
+            return jsonify({"status": "error", "message": "No capture for this request"}), 404
+        path, mimetype = image
+        return send_file(os.path.abspath(path), mimetype=mimetype)
+
+    @app.route('/templates/repairs', methods=['GET'])
+    def template_repairs_endpoint():
+        """List gallery templates that needed repair or could not be repaired"""
+        return jsonify({"status": "success", "repairs": get_repair_report()})
+
+    @app.route('/templates/precompute', methods=['POST'])
+    def precompute_templates_endpoint():
+        """
+        Extract features for a batch of templates into the feature store ahead
+        of their first identification. Takes JSON or form fields: staff_id (a
+        backend roster), staff (the staff gallery) or templates (records, JSON
+        or a binary gallery file part), plus optional namespace and engine.
+        """
+        try:
+            body = request.get_json(silent=True) or request.form.to_dict()
+            if 'templates' in request.files:
+                body['templates'] = read_gallery_payload('templates')
+            records, namespace = precompute_request_records(body)
+            report = precompute_templates(records, namespace, request_engines(body.get('engine')))
+            return jsonify({"status": "success", "templates": len(records), **report})
+        except (ValueError, GalleryFormatError) as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        except requests.RequestException as e:
+            logging.error(f"Failed to fetch templates to precompute: {str(e)}")
+            return jsonify({"status": "error", "message": "Failed to fetch templates from backend"}), 502
+        except Exception as e:
+            logging.error(f"Error precomputing templates: {str(e)}")
+            return jsonify({"status": "error", "message": "Internal server error"}), 500
+
+    @app.route('/templates/extract', methods=['POST'])
+    def extract_template_endpoint():
+        """
+        Extract a feature template from an enrollment image (file upload or
+        base64 'fingerprint' field) for the backend to store and post back in
+        the gallery's 'template' field. Returns JSON with the template in
+        base64, or the raw template with ?format=binary.
+        """
+        try:
+            if 'file' in request.files:
+                image_data = request.files['file'].read()
+            elif request.form.get('fingerprint'):
+                image_data = decode_fingerprint_payload(request.form['fingerprint'])
+            else:
+                return jsonify({"status": "error", "message": "No fingerprint provided"}), 400
+
+            engine = request_engine(request.form.get('engine'))
+            template, count = extract_feature_template(image_data, engine)
+            if wants_binary_template(request.args, request.headers):
+                return app.response_class(template, mimetype=TEMPLATE_MIMETYPE, headers={
+                    'X-Template-Engine': engine,
+                    'X-Template-Extractor-Version': str(TEMPLATE_EXTRACTOR_VERSIONS[engine])
+                })
+            return jsonify(feature_template_body(template, count, engine))
+        except ProbeQualityError as e:
+            return jsonify(probe_quality_body(e)), 422
+        except Exception as e:
+            logging.error(f"Error extracting feature template: {str(e)}")
+            return jsonify({"status": "error", "message": "Invalid fingerprint data"}), 400
+
+    @app.route('/cache/stats', methods=['GET'])
+    def cache_stats_endpoint():
+        """Report feature cache size and hit/miss/coalesced counters"""
+        return jsonify({"status": "success", "cache": get_cache_stats()})
+
+    @app.route('/admission/stats', methods=['GET'])
+    def admission_stats_endpoint():
+        """Report identification queue depth, active requests and shed counts"""
+        return jsonify({"status": "success", "admission": ADMISSION.stats()})
+
     @app.route('/invalidate-cache/<student_id>', methods=['POST'])
     def invalidate_cache_endpoint(student_id):
-        """Invalidate cache entry for a specific student"""
+        """Invalidate cache entries for a student (all fingers, or ?finger_type=)"""
         try:
-            invalidate_cache_entry(student_id)
+            invalidate_cache_entry(student_id, request.args.get('finger_type'))
             logging.info(f"Cache invalidated for student {student_id}")
             return jsonify({
                 "status": "success",
@@ -1178,6 +2583,48 @@ def create_app(test_config=None):
             logging.error(f"Error invalidating cache for student {student_id}: {str(e)}")
             return jsonify({"status": "error", "message": "Failed to invalidate cache"}), 500
 
+    @app.route('/invalidate-cache/staff/<staff_id>', methods=['POST'])
+    def invalidate_staff_cache_endpoint(staff_id):
+        """Invalidate the cache entry for a staff member"""
+        try:
+            invalidate_staff_cache_entry(staff_id)
+            return jsonify({
+                "status": "success",
+                "message": f"Cache invalidated for staff {staff_id}"
+            })
+        except Exception as e:
+            logging.error(f"Error invalidating cache for staff {staff_id}: {str(e)}")
+            return jsonify({"status": "error", "message": "Failed to invalidate cache"}), 500
+
+    @app.route('/invalidate-cache/roster/<staff_id>', methods=['POST'])
+    def invalidate_roster_cache_endpoint(staff_id):
+        """Invalidate every template cached for a staff member's student roster"""
+        try:
+            invalidate_scope(roster_scope(staff_id))
+            return jsonify({
+                "status": "success",
+                "message": f"Cache invalidated for roster of staff {staff_id}"
+            })
+        except Exception as e:
+            logging.error(f"Error invalidating roster cache for staff {staff_id}: {str(e)}")
+            return jsonify({"status": "error", "message": "Failed to invalidate cache"}), 500
+
+    @app.route('/invalidate-cache', methods=['POST'])
+    def invalidate_cache_bulk_endpoint():
+        """Invalidate many students, fingers, staff members and rosters in one call"""
+        try:
+            summary = apply_cache_invalidation(request.get_json(silent=True))
+            return jsonify({
+                "status": "success",
+                "message": "Cache invalidated",
+                "invalidated": summary
+            })
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        except Exception as e:
+            logging.error(f"Error applying bulk cache invalidation: {str(e)}")
+            return jsonify({"status": "error", "message": "Failed to invalidate cache"}), 500
+
     return app
 
 APP = create_app()
@@ -0,0 +1,12 @@
+import os
+import sys
+
+# The matcher modules live next to this directory, not in an installed package
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+FINGERPRINTS_DIR = os.path.join(SERVER_DIR, 'fingerprints')
+
+# Importing server must not warm the cache, capture probes or write features to disk
+for name in ('WARMUP_ON_STARTUP', 'PROBE_CAPTURE', 'PROBE_DEDUP', 'FEATURE_STORE'):
+    os.environ.setdefault(name, '0')
@@ -0,0 +1,216 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from admission import PRIORITY_STAFF, PRIORITY_STUDENT, AdmissionController, AdmissionRejected
+
+
+class Request(threading.Thread):
+    """A request that holds its slot until released"""
+
+    def __init__(self, controller, priority, timeout=5):
+        super().__init__(daemon=True)
+        self.controller = controller
+        self.priority = priority
+        self.timeout = timeout
+        self.admitted = threading.Event()
+        self.release = threading.Event()
+        self.rejection = None
+
+    def run(self):
+        try:
+            with self.controller.admit(self.priority, self.timeout):
+                self.admitted.set()
+                self.release.wait(5)
+        except AdmissionRejected as e:
+            self.rejection = e
+
+
+def start(controller, priority, timeout=5):
+    request = Request(controller, priority, timeout)
+    request.start()
+    return request
+
+
+def wait_until(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.005)
+
+
+def test_admits_up_to_max_active_then_queues():
+    controller = AdmissionController(max_active=2, max_queue=4)
+    running = [start(controller, PRIORITY_STUDENT) for _ in range(2)]
+    for request in running:
+        assert request.admitted.wait(1)
+
+    waiting = start(controller, PRIORITY_STUDENT)
+    wait_until(lambda: controller.stats()['queued'] == 1)
+    assert not waiting.admitted.is_set()
+
+    running[0].release.set()
+    assert waiting.admitted.wait(1)
+    for request in running[1:] + [waiting]:
+        request.release.set()
+        request.join(1)
+    assert controller.stats()['active'] == 0
+    assert controller.stats()['admitted'] == 3
+
+
+def test_sheds_when_queue_is_full():
+    controller = AdmissionController(max_active=1, max_queue=1)
+    running = start(controller, PRIORITY_STUDENT)
+    assert running.admitted.wait(1)
+    queued = start(controller, PRIORITY_STUDENT)
+    wait_until(lambda: controller.stats()['queued'] == 1)
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        with controller.admit(PRIORITY_STUDENT, 5):
+            pass
+    assert rejected.value.reason == 'queue_full'
+    assert rejected.value.retry_after >= 1
+    assert controller.stats()['shed_queue_full'] == 1
+
+    running.release.set()
+    queued.release.set()
+    queued.join(1)
+    assert queued.rejection is None
+
+
+def test_staff_evicts_queued_student():
+    controller = AdmissionController(max_active=1, max_queue=1)
+    running = start(controller, PRIORITY_STUDENT)
+    assert running.admitted.wait(1)
+    student = start(controller, PRIORITY_STUDENT)
+    wait_until(lambda: controller.stats()['queued'] == 1)
+
+    staff = start(controller, PRIORITY_STAFF)
+    student.join(1)
+    assert student.rejection is not None and student.rejection.reason == 'evicted'
+    assert controller.stats()['queued_by_class'] == {'staff': 1, 'student': 0}
+
+    running.release.set()
+    assert staff.admitted.wait(1)
+    staff.release.set()
+
+
+def test_staff_jumps_the_queue():
+    controller = AdmissionController(max_active=1, max_queue=4)
+    running = start(controller, PRIORITY_STUDENT)
+    assert running.admitted.wait(1)
+    student = start(controller, PRIORITY_STUDENT)
+    wait_until(lambda: controller.stats()['queued'] == 1)
+    staff = start(controller, PRIORITY_STAFF)
+    wait_until(lambda: controller.stats()['queued'] == 2)
+
+    running.release.set()
+    assert staff.admitted.wait(1)
+    assert not student.admitted.is_set()
+    staff.release.set()
+    assert student.admitted.wait(1)
+    student.release.set()
+
+
+def test_sheds_after_deadline():
+    controller = AdmissionController(max_active=1, max_queue=4)
+    running = start(controller, PRIORITY_STUDENT)
+    assert running.admitted.wait(1)
+
+    late = start(controller, PRIORITY_STUDENT, timeout=0.05)
+    late.join(1)
+    assert late.rejection is not None and late.rejection.reason == 'deadline_exceeded'
+    assert controller.stats()['queued'] == 0
+    assert controller.stats()['shed_deadline'] == 1
+    running.release.set()
+
+
+def test_async_admission_waits_and_sheds():
+    controller = AdmissionController(max_active=1, max_queue=1)
+
+    async def scenario():
+        order = []
+
+        async def request(name, hold):
+            async with controller.admit_async(PRIORITY_STUDENT, 1):
+                order.append(name)
+                await asyncio.sleep(hold)
+
+        first = asyncio.ensure_future(request('first', 0.05))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(request('second', 0))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected):
+            await request('third', 0)
+        await asyncio.gather(first, second)
+        return order
+
+    assert asyncio.run(scenario()) == ['first', 'second']
+    assert controller.stats()['shed_queue_full'] == 1
+
+
+def test_cancelled_async_waiter_frees_its_place():
+    controller = AdmissionController(max_active=1, max_queue=4)
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def holder():
+            async with controller.admit_async(PRIORITY_STUDENT, 5):
+                await release.wait()
+
+        async def waiter():
+            async with controller.admit_async(PRIORITY_STUDENT, 5):
+                pass
+
+        running = asyncio.ensure_future(holder())
+        await asyncio.sleep(0)
+        queued = asyncio.ensure_future(waiter())
+        await asyncio.sleep(0)
+        assert controller.stats()['queued'] == 1
+
+        queued.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+        assert controller.stats()['queued'] == 0
+
+        release.set()
+        await running
+
+    asyncio.run(scenario())
+    stats = controller.stats()
+    assert stats['active'] == 0 and stats['queued'] == 0
+    assert stats['cancelled'] == 1
+
+
+def test_waiter_cancelled_after_its_grant_releases_the_slot():
+    controller = AdmissionController(max_active=1, max_queue=4)
+
+    async def scenario():
+        waiters = []
+        active_at_grant = []
+
+        async def holder():
+            async with controller.admit_async(PRIORITY_STUDENT, 5):
+                await asyncio.sleep(0.01)
+            # The slot was just handed to the waiter, which is cancelled before it wakes up
+            active_at_grant.append(controller.stats()['active'])
+            waiters[0].cancel()
+
+        async def waiter():
+            async with controller.admit_async(PRIORITY_STUDENT, 5):
+                pass
+
+        running = asyncio.ensure_future(holder())
+        await asyncio.sleep(0)
+        waiters.append(asyncio.ensure_future(waiter()))
+        await running
+        with pytest.raises(asyncio.CancelledError):
+            await waiters[0]
+        return active_at_grant
+
+    assert asyncio.run(scenario()) == [1]
+    stats = controller.stats()
+    assert stats['active'] == 0 and stats['queued'] == 0
@@ -0,0 +1,86 @@
+import glob
+import os
+import time
+
+import cv2
+import numpy as np
+
+from conftest import FINGERPRINTS_DIR
+from diagnostics import ProbeStore, image_format, sanitize_request_id
+
+PRINT = sorted(glob.glob(os.path.join(FINGERPRINTS_DIR, 'temp_*.png')))[0]
+
+
+def encoded(extension):
+    return cv2.imencode(f".{extension}", cv2.imread(PRINT, cv2.IMREAD_GRAYSCALE))[1].tobytes()
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "writer did not catch up"
+        time.sleep(0.01)
+
+
+def wait_for_writes(store, count):
+    wait_until(lambda: store.stats()['captured'] + store.stats()['write_errors'] >= count)
+
+
+def test_image_format_from_magic_bytes():
+    assert image_format(encoded('png')) == ('png', 'image/png')
+    assert image_format(encoded('jpg')) == ('jpg', 'image/jpeg')
+    assert image_format(encoded('bmp')) == ('bmp', 'image/bmp')
+    assert image_format(b'not an image') == ('bin', 'application/octet-stream')
+
+
+def test_captures_keep_their_format(tmp_path):
+    store = ProbeStore(str(tmp_path))
+    store.capture('png-probe', 'student', encoded('png'), {'student_id': 's1'})
+    store.capture('jpeg-probe', 'student', encoded('jpg'), {'student_id': 's2'})
+    wait_for_writes(store, 2)
+
+    path, mimetype = store.image_file('jpeg-probe')
+    assert path.endswith('.jpg') and mimetype == 'image/jpeg'
+    with open(path, 'rb') as f:
+        assert f.read() == encoded('jpg')
+    assert store.image_file('png-probe')[1] == 'image/png'
+    assert store.lookup('jpeg-probe')['student_id'] == 's2'
+
+
+def test_ring_stays_within_max_bytes(tmp_path):
+    probe = encoded('png')
+    store = ProbeStore(str(tmp_path), max_bytes=3 * len(probe) + 2048)
+    for index in range(8):
+        store.capture(f"probe-{index}", 'student', probe, {})
+        wait_for_writes(store, index + 1)
+        time.sleep(0.002)
+
+    # Eviction runs right after each write
+    wait_until(lambda: store.stats()['evicted'] == 5)
+    total = sum(entry.stat().st_size for entry in os.scandir(tmp_path))
+    assert total <= store.max_bytes
+    assert store.stats()['evicted'] == 5
+    assert store.image_file('probe-0') is None
+    assert store.image_file('probe-7') is not None
+
+
+def test_existing_captures_are_evicted_first(tmp_path):
+    probe = encoded('png')
+    old_stem = f"{int(time.time() * 1000) - 1000}_{sanitize_request_id('old')}"
+    (tmp_path / f"{old_stem}.png").write_bytes(probe)
+    (tmp_path / f"{old_stem}.json").write_text('{}')
+
+    store = ProbeStore(str(tmp_path), max_bytes=len(probe) + 1024)
+    store.capture('new', 'student', probe, {})
+    wait_until(lambda: not (tmp_path / f"{old_stem}.png").exists())
+    assert sorted(os.listdir(tmp_path))[0].endswith('_new.json')
+
+
+def test_expired_captures_are_evicted(tmp_path):
+    store = ProbeStore(str(tmp_path), max_age_s=0.05)
+    store.capture('first', 'student', encoded('png'), {})
+    wait_for_writes(store, 1)
+    time.sleep(0.1)
+    store.capture('second', 'student', encoded('png'), {})
+    wait_until(lambda: store.image_file('first') is None)
+    assert store.image_file('second') is not None
@@ -0,0 +1,89 @@
+import glob
+import os
+
+import numpy as np
+import pytest
+
+import server
+from conftest import FINGERPRINTS_DIR
+from feature_store import FeatureStore
+
+PRINT = sorted(glob.glob(os.path.join(FINGERPRINTS_DIR, 'temp_*.png')))[0]
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = FeatureStore(str(tmp_path))
+    monkeypatch.setattr(server, 'FEATURE_STORE', store)
+    return store
+
+
+@pytest.fixture
+def extractions(monkeypatch):
+    """Count SIFT extractions instead of decoding images"""
+    calls = []
+
+    def extract(cache_key, image_data):
+        calls.append(cache_key)
+        return ['keypoint'], np.ones((1, 128), np.float32), None
+
+    monkeypatch.setattr(server, 'extract_image_features', extract)
+    return calls
+
+
+def test_round_trip(store):
+    features = np.arange(256, dtype=np.float32).reshape(2, 128)
+    assert store.save('ab' * 16, 'sift-v1', features)
+    assert store.contains('ab' * 16, 'sift-v1')
+    np.testing.assert_array_equal(store.load('ab' * 16, 'sift-v1'), features)
+    assert store.load('ab' * 16, 'sift-v2') is None
+    assert store.stats()['hits'] == 1 and store.stats()['misses'] == 1
+
+
+def test_unreadable_entry_is_a_miss(store):
+    path = store.path('cd' * 16, 'sift-v1')
+    store.save('cd' * 16, 'sift-v1', np.zeros((1, 128), np.float32))
+    with open(path, 'wb') as f:
+        f.write(b'truncated')
+    assert store.load('cd' * 16, 'sift-v1') is None
+    assert store.stats()['errors'] == 1
+
+
+def test_kind_includes_extractor_version(monkeypatch):
+    assert server.feature_store_kind(server.ENGINE_SIFT).endswith('-v1')
+    monkeypatch.setitem(server.TEMPLATE_EXTRACTOR_VERSIONS, server.ENGINE_SIFT, 2)
+    assert server.feature_store_kind(server.ENGINE_SIFT).endswith('-v2')
+
+
+def test_stored_features_are_reused(store, extractions):
+    store.save(server.payload_digest(b'template'), server.feature_store_kind(server.ENGINE_SIFT),
+               np.zeros((3, 128), np.float32))
+    _, descriptors, _ = server.load_or_extract_features('student:1', b'template')
+    assert len(descriptors) == 3
+    assert extractions == []
+
+
+def test_version_bump_misses_the_store(store, extractions, monkeypatch):
+    store.save(server.payload_digest(b'template'), server.feature_store_kind(server.ENGINE_SIFT),
+               np.zeros((3, 128), np.float32))
+    monkeypatch.setitem(server.TEMPLATE_EXTRACTOR_VERSIONS, server.ENGINE_SIFT, 2)
+
+    _, descriptors, _ = server.load_or_extract_features('student:1', b'template')
+    assert len(descriptors) == 1
+    assert extractions == ['student:1']
+
+
+def test_precompute_workers_fill_the_store(tmp_path, monkeypatch):
+    # Pool workers import server afresh and open the store from the environment
+    monkeypatch.setenv('FEATURE_STORE_DIR', str(tmp_path))
+    monkeypatch.setenv('FEATURE_STORE', '1')
+    monkeypatch.setattr(server, 'FEATURE_STORE', FeatureStore(str(tmp_path)))
+    with open(PRINT, 'rb') as f:
+        image = f.read()
+    records = [{'id': 's1', 'finger_type': 'thumb', 'fingerprint': image},
+               {'id': 's2', 'finger_type': 'thumb', 'fingerprint': image}]
+
+    report = server.precompute_templates(records, workers=2)
+    assert report['summary'].get('stored', 0) + report['summary'].get('already_stored', 0) == 2
+    digest = server.payload_digest(server.validate_fingerprint_data(image))
+    assert server.FEATURE_STORE.contains(digest, server.feature_store_kind(server.ENGINE_SIFT))
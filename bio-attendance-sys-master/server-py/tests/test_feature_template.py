@@ -0,0 +1,95 @@
+import glob
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from conftest import FINGERPRINTS_DIR
+from feature_template import (COORDINATE_SCALE, TemplateFormatError, is_feature_template, keypoint_geometry,
+                              parse_template, serialize_minutiae, serialize_sift)
+
+PRINT = sorted(glob.glob(os.path.join(FINGERPRINTS_DIR, 'temp_*.png')))[0]
+
+
+@pytest.fixture(scope='module')
+def sift_features():
+    gray = cv2.imread(PRINT, cv2.IMREAD_GRAYSCALE)
+    return cv2.SIFT_create().detectAndCompute(gray, None)
+
+
+def test_sift_round_trip(sift_features):
+    keypoints, descriptors = sift_features
+    data = serialize_sift(keypoints, descriptors, extractor_version=3, segmented=True)
+    assert is_feature_template(data)
+
+    template = parse_template(data)
+    assert template['engine'] == 'sift'
+    assert template['extractor_version'] == 3
+    assert template['segmented'] is True
+    assert template['count'] == len(keypoints)
+    # SIFT descriptor components are whole numbers, so the bytes are lossless
+    np.testing.assert_array_equal(template['descriptors'], descriptors)
+
+    geometry = keypoint_geometry(template)
+    expected = np.array([(point.pt[0], point.pt[1], point.size) for point in keypoints], np.float32)
+    np.testing.assert_allclose(geometry[:, :3], expected, atol=0.5 / COORDINATE_SCALE + 1e-6)
+    angle_error = np.abs((geometry[:, 3] - [point.angle for point in keypoints] + 180) % 360 - 180)
+    assert angle_error.max() <= 360 / 256
+
+
+def test_origin_offsets_keypoints(sift_features):
+    keypoints, descriptors = sift_features
+    geometry = keypoint_geometry(parse_template(serialize_sift(keypoints[:5], descriptors[:5], 1, origin=(40, 20))))
+    np.testing.assert_allclose(geometry[:, 0], [point.pt[0] + 40 for point in keypoints[:5]], atol=0.1)
+    np.testing.assert_allclose(geometry[:, 1], [point.pt[1] + 20 for point in keypoints[:5]], atol=0.1)
+
+
+def test_empty_sift_template():
+    template = parse_template(serialize_sift([], None, 1))
+    assert template['count'] == 0
+    assert template['descriptors'].shape == (0, 128)
+
+
+def test_keypoints_need_descriptors(sift_features):
+    keypoints, descriptors = sift_features
+    with pytest.raises(TemplateFormatError):
+        serialize_sift(keypoints, descriptors[:-1], 1)
+
+
+def test_minutiae_round_trip():
+    template = parse_template(serialize_minutiae(b'serialized minutiae', 7, extractor_version=2))
+    assert template['engine'] == 'minutiae'
+    assert template['extractor_version'] == 2
+    assert template['count'] == 7
+    assert bytes(template['minutiae']) == b'serialized minutiae'
+
+
+def test_malformed_templates(sift_features):
+    keypoints, descriptors = sift_features
+    data = serialize_sift(keypoints[:3], descriptors[:3], 1)
+
+    with pytest.raises(TemplateFormatError, match='too short'):
+        parse_template(data[:8])
+    with pytest.raises(TemplateFormatError, match='magic'):
+        parse_template(b'XXXX' + data[4:])
+    with pytest.raises(TemplateFormatError, match='version'):
+        parse_template(data[:4] + b'\x09' + data[5:])
+    with pytest.raises(TemplateFormatError, match='engine'):
+        parse_template(data[:5] + b'\x09' + data[6:])
+    with pytest.raises(TemplateFormatError, match='feature count'):
+        parse_template(data[:-1])
+    assert not is_feature_template(b'\x89PNG\r\n\x1a\n')
+
+
+def test_matcher_only_loads_its_extractor_version(sift_features):
+    import server
+
+    keypoints, descriptors = sift_features
+    version = server.TEMPLATE_EXTRACTOR_VERSIONS[server.ENGINE_SIFT]
+    current = {'id': 'student-1', 'template': serialize_sift(keypoints, descriptors, version)}
+    stale = {'id': 'student-1', 'template': serialize_sift(keypoints, descriptors, version + 1)}
+
+    assert server.load_record_template(current)[0] == len(keypoints)
+    assert server.load_record_template(stale) is None
+    assert server.load_record_template({'id': 'student-1', 'template': b'FPFT'}) is None
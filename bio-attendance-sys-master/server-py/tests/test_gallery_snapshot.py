@@ -0,0 +1,140 @@
+import time
+
+import pytest
+
+import server
+from gallery_snapshot import MIN_DELTA, SnapshotStore
+
+
+def test_held_snapshot_is_unchanged_by_publish():
+    store = SnapshotStore(ttl=60)
+    store.publish('roster:1', {'a': 1})
+    held = store.current('roster:1')
+
+    store.publish('roster:1', {'b': 2})
+    assert held.get('b') is None and len(held) == 1
+    assert store.current('roster:1').get('b') == 2
+    assert store.current('roster:1').version == held.version + 1
+
+
+def test_compaction_drops_entries_failing_keep():
+    store = SnapshotStore(ttl=60)
+    store.publish('roster:1', {'stale': 'old'})
+    for index in range(MIN_DELTA):
+        snapshot = store.publish('roster:1', {f"key-{index}": index}, keep=lambda entry: entry != 'old')
+
+    # The delta outgrew MIN_DELTA and was folded into the base without the stale entry
+    assert not snapshot.delta
+    assert snapshot.get('stale') is None
+    assert len(snapshot) == MIN_DELTA
+    assert store.lookup_any('stale') is None
+
+
+def test_size_counts_replaced_keys_once():
+    store = SnapshotStore(ttl=60)
+    store.publish('roster:1', {'a': 1})
+    assert len(store.publish('roster:1', {'a': 2})) == 1
+
+
+def test_lookup_any_finds_other_scopes():
+    store = SnapshotStore(ttl=60)
+    store.publish('roster:1', {'student:1': 'features'})
+    assert store.current('roster:2').get('student:1') is None
+    assert store.lookup_any('student:1') == 'features'
+
+
+def test_clear_scope_keeps_other_scopes_entry():
+    store = SnapshotStore(ttl=60)
+    store.publish('roster:1', {'student:1': 'first'})
+    store.publish('roster:2', {'student:1': 'second'})
+
+    store.clear('roster:1')
+    assert len(store.current('roster:1')) == 0
+    assert store.lookup_any('student:1') == 'second'
+
+    store.clear()
+    assert store.lookup_any('student:1') is None
+    assert store.stats()['scopes'] == 0
+
+
+def test_expired_scopes_read_empty_and_are_pruned():
+    store = SnapshotStore(ttl=0.05)
+    store.publish('roster:1', {'a': 1})
+    time.sleep(0.1)
+    assert len(store.current('roster:1')) == 0
+
+    store.publish('roster:2', {'b': 2})
+    assert store.lookup_any('a') is None
+    assert store.stats()['scopes'] == 1
+
+
+def test_publishing_many_entries_stays_cheap():
+    store = SnapshotStore(ttl=60)
+    started = time.perf_counter()
+    for index in range(5000):
+        store.publish('roster:1', {index: index})
+    assert len(store.current('roster:1')) == 5000
+    assert time.perf_counter() - started < 5
+
+
+@pytest.fixture
+def extractions(monkeypatch):
+    """Count feature extractions instead of decoding images"""
+    calls = []
+
+    def extract(cache_key, image_data, engine=server.ENGINE_SIFT):
+        calls.append(cache_key)
+        return ['keypoint'], ['descriptor'], None
+
+    monkeypatch.setattr(server, 'load_or_extract_features', extract)
+    server.GALLERY_SNAPSHOTS.clear()
+    yield calls
+    server.GALLERY_SNAPSHOTS.clear()
+
+
+def test_cached_features_hit(extractions):
+    server.get_cached_features('student:hit', b'', scope='roster:hit')
+    server.get_cached_features('student:hit', b'', scope='roster:hit')
+    assert extractions == ['student:hit']
+
+
+def test_student_invalidation_forces_extraction(extractions):
+    server.get_cached_features('student:inv:right_thumb', b'', scope='roster:inv')
+    server.invalidate_cache_entry('inv')
+    server.get_cached_features('student:inv:right_thumb', b'', scope='roster:inv')
+    assert len(extractions) == 2
+
+
+def test_held_snapshot_entry_fails_generation_check(extractions):
+    server.get_cached_features('student:held', b'', scope='roster:held')
+    snapshot = server.current_snapshot(scope='roster:held')
+    server.invalidate_cache_entry('held')
+    assert not server.is_generation_current(snapshot.get('student:held')[2])
+
+    server.get_cached_features('student:held', b'', scope='roster:held', snapshot=snapshot)
+    assert len(extractions) == 2
+
+
+def test_entry_is_shared_across_scopes(extractions):
+    server.get_cached_features('student:shared', b'', scope='roster:first')
+    server.get_cached_features('student:shared', b'', scope='roster:second')
+    assert extractions == ['student:shared']
+
+
+def test_scope_invalidation_is_not_bypassed_by_another_scope(extractions):
+    server.get_cached_features('student:scoped', b'', scope='roster:kept')
+    server.invalidate_scope('roster:reloaded')
+    server.get_cached_features('student:scoped', b'', scope='roster:reloaded')
+    assert len(extractions) == 2
+
+    # The scope that wasn't invalidated keeps its entry
+    server.get_cached_features('student:scoped', b'', scope='roster:kept')
+    assert len(extractions) == 2
+
+
+def test_invalidate_all(extractions):
+    server.get_cached_features('student:all', b'', scope='roster:all')
+    server.invalidate_all_cache()
+    assert server.GALLERY_SNAPSHOTS.stats()['entries'] == 0
+    server.get_cached_features('student:all', b'', scope='roster:all')
+    assert len(extractions) == 2
@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+from gallery_wire import (FORMAT_VERSION, MAGIC, GalleryFormatError, encode_gallery, is_gallery_stream,
+                          parse_gallery)
+
+
+def sample_records():
+    descriptors = np.arange(3 * 128, dtype=np.float32).reshape(3, 128)
+    return [
+        {'id': 'student-1', 'fingerprint': b'\x89PNG image bytes', 'finger_type': 'right_thumb', 'fingerprint_id': 'fp-1'},
+        {'id': 'student-2', 'descriptors': descriptors, 'template_version': 1, 'isCorrupted': True},
+        {'id': 'student-3', 'minutiae': b'minutiae bytes', 'template_version': 2},
+        {'id': 'student-4', 'template': b'FPFT template bytes'}
+    ]
+
+
+def test_round_trip():
+    stream = encode_gallery(sample_records())
+    assert is_gallery_stream(stream)
+
+    image, descriptors, minutiae, template = parse_gallery(stream)
+    assert image['id'] == 'student-1'
+    assert bytes(image['fingerprint']) == b'\x89PNG image bytes'
+    assert image['finger_type'] == 'right_thumb'
+    assert image['fingerprint_id'] == 'fp-1'
+    assert image['isCorrupted'] is False
+    assert image['template_version'] == 0
+
+    assert descriptors['finger_type'] is None
+    assert descriptors['isCorrupted'] is True
+    assert descriptors['template_version'] == 1
+    np.testing.assert_array_equal(descriptors['descriptors'], sample_records()[1]['descriptors'])
+
+    assert bytes(minutiae['minutiae']) == b'minutiae bytes'
+    assert minutiae['template_version'] == 2
+    assert bytes(template['template']) == b'FPFT template bytes'
+
+
+def test_payloads_are_views_of_the_stream():
+    stream = bytearray(encode_gallery(sample_records()[:1]))
+    record = parse_gallery(stream)[0]
+    stream[-1] = ord('!')
+    assert bytes(record['fingerprint']).endswith(b'!')
+
+
+def test_empty_gallery():
+    assert parse_gallery(encode_gallery([])) == []
+
+
+def test_not_a_gallery_stream():
+    assert not is_gallery_stream(b'{"fingerprints": []}')
+    assert not is_gallery_stream(b'FP')
+
+
+@pytest.mark.parametrize('stream, message', [
+    (b'FPGW', 'too short'),
+    (b'XXXX' + bytes([FORMAT_VERSION]) + b'\x00\x00\x00\x00', 'magic'),
+    (MAGIC + bytes([FORMAT_VERSION + 1]) + b'\x00\x00\x00\x00', 'version'),
+    (MAGIC + bytes([FORMAT_VERSION]) + b'\x00\x00\x00\x01', 'Truncated record header'),
+])
+def test_malformed_header(stream, message):
+    with pytest.raises(GalleryFormatError, match=message):
+        parse_gallery(stream)
+
+
+def test_every_truncation_is_rejected():
+    stream = encode_gallery(sample_records())
+    for length in range(len(stream)):
+        with pytest.raises(GalleryFormatError):
+            parse_gallery(stream[:length])
+
+
+def test_partial_descriptor_row():
+    stream = bytearray(encode_gallery([{'id': 'student-1', 'descriptors': np.zeros((1, 128), np.float32)}]))
+    # Shrink the payload length by one float and drop its bytes
+    stream[-516:-512] = (508).to_bytes(4, 'big')
+    with pytest.raises(GalleryFormatError, match='whole number of rows'):
+        parse_gallery(bytes(stream[:-4]))
+
+
+def test_unknown_kind():
+    stream = bytearray(encode_gallery(sample_records()[:1]))
+    stream[9] = 99
+    with pytest.raises(GalleryFormatError, match='Unknown payload kind'):
+        parse_gallery(bytes(stream))
+
+
+def test_header_field_too_long():
+    with pytest.raises(GalleryFormatError, match='too long'):
+        encode_gallery([{'id': 'x' * 256, 'fingerprint': b''}])
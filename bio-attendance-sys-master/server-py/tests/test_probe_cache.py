@@ -0,0 +1,84 @@
+import glob
+import os
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+from conftest import FINGERPRINTS_DIR
+from probe_cache import RecentProbeCache, probe_signature
+
+PRINTS = sorted(glob.glob(os.path.join(FINGERPRINTS_DIR, 'temp_*.png')))
+# Two different staff prints whose dHash and thumbnail are within the thresholds
+LOOKALIKES = [os.path.join(FINGERPRINTS_DIR, f"temp_staff_{name}.png")
+              for name in ('27031289-9dc0-4fb1-a07b-f46070b2290c', '80d1d64c-71ed-4191-89ed-910c1fef47f0')]
+
+
+def load(path):
+    return cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+
+
+def shifted(gray, dx, dy):
+    return cv2.warpAffine(gray, np.float32([[1, 0, dx], [0, 1, dy]]), gray.shape[::-1], borderMode=cv2.BORDER_REPLICATE)
+
+
+@pytest.fixture
+def cache():
+    return RecentProbeCache(window_s=5.0)
+
+
+def test_same_probe_hits(cache):
+    gray = load(PRINTS[0])
+    cache.store('roster:1', 'v1', probe_signature(gray), 'student-1')
+    assert cache.lookup('roster:1', 'v1', probe_signature(gray.copy())) == 'student-1'
+    assert cache.stats()['hits'] == 1
+
+
+def test_shifted_rescan_hits(cache):
+    gray = load(PRINTS[0])
+    cache.store('roster:1', 'v1', probe_signature(gray), 'student-1')
+    assert cache.lookup('roster:1', 'v1', probe_signature(shifted(gray, 3, 2))) == 'student-1'
+
+
+def test_lookalike_print_misses_on_descriptors(cache):
+    first, second = (load(path) for path in LOOKALIKES)
+    cache.store('staff', 'v1', probe_signature(first), 'staff-1')
+    assert cache.lookup('staff', 'v1', probe_signature(second)) is None
+    assert cache.stats()['misses'] == 1
+
+
+def test_distinct_prints_miss(cache):
+    signatures = [probe_signature(load(path)) for path in PRINTS]
+    for index, signature in enumerate(signatures):
+        cache.clear()
+        cache.store('roster:1', 'v1', signature, index)
+        for other, probe in enumerate(signatures):
+            assert cache.lookup('roster:1', 'v1', probe) == (index if other == index else None)
+
+
+def test_other_scope_or_key_misses(cache):
+    signature = probe_signature(load(PRINTS[0]))
+    cache.store('roster:1', 'v1', signature, 'student-1')
+    assert cache.lookup('roster:2', 'v1', signature) is None
+    assert cache.lookup('roster:1', 'v2', signature) is None
+
+
+def test_entries_expire_after_window():
+    cache = RecentProbeCache(window_s=0.05)
+    signature = probe_signature(load(PRINTS[0]))
+    cache.store('roster:1', 'v1', signature, 'student-1')
+    time.sleep(0.1)
+    assert cache.lookup('roster:1', 'v1', signature) is None
+
+    # Storing elsewhere drops the idle scope
+    cache.store('roster:2', 'v1', signature, 'student-2')
+    assert cache.stats()['scopes'] == 1
+
+
+def test_disabled_cache_never_hits():
+    cache = RecentProbeCache(enabled=False)
+    signature = probe_signature(load(PRINTS[0]))
+    cache.store('roster:1', 'v1', signature, 'student-1')
+    assert cache.lookup('roster:1', 'v1', signature) is None
+    assert cache.stats()['size'] == 0
@@ -0,0 +1,149 @@
+import pytest
+
+import router
+from router import HashRing, ShardPool, ShardUnavailable
+
+SHARDS = ['http://shard-a:5050', 'http://shard-b:5050', 'http://shard-c:5050']
+KEYS = [f"roster:{index}" for index in range(2000)]
+
+
+def owners(ring):
+    return {key: ring.lookup(key) for key in KEYS}
+
+
+def test_keys_spread_over_every_shard():
+    counts = {}
+    for owner in owners(HashRing(SHARDS)).values():
+        counts[owner] = counts.get(owner, 0) + 1
+    assert set(counts) == set(SHARDS)
+    assert min(counts.values()) > len(KEYS) / len(SHARDS) / 2
+
+
+def test_adding_a_shard_only_moves_keys_to_it():
+    ring = HashRing(SHARDS)
+    before = owners(ring)
+    ring.add('http://shard-d:5050')
+    after = owners(ring)
+
+    moved = [key for key in KEYS if before[key] != after[key]]
+    assert all(after[key] == 'http://shard-d:5050' for key in moved)
+    assert len(KEYS) / 8 < len(moved) < len(KEYS) / 2
+
+
+def test_removing_a_shard_only_moves_its_keys():
+    ring = HashRing(SHARDS)
+    before = owners(ring)
+    ring.remove('http://shard-b:5050')
+    after = owners(ring)
+
+    for key in KEYS:
+        if before[key] == 'http://shard-b:5050':
+            assert after[key] != 'http://shard-b:5050'
+        else:
+            assert after[key] == before[key]
+
+
+def test_lookup_skips_excluded_shards():
+    ring = HashRing(SHARDS)
+    for key in KEYS[:200]:
+        assert ring.lookup(key, exclude={ring.lookup(key)}) not in (None, ring.lookup(key))
+    assert ring.lookup('roster:1', exclude=set(SHARDS)) is None
+    assert HashRing().lookup('roster:1') is None
+
+
+def test_pool_add_reports_moved_recent_rosters():
+    pool = ShardPool(SHARDS)
+    before = {key: pool.owner(key) for key in KEYS[:300]}
+    moved = pool.add('http://shard-d:5050')
+
+    assert moved and set(moved) == {key for key in before if pool.owner(key) != before[key]}
+    assert all(pool.owner(key) == 'http://shard-d:5050' for key in moved)
+
+
+def test_pool_drain_reports_new_owners():
+    pool = ShardPool(SHARDS)
+    before = {key: pool.owner(key) for key in KEYS[:300]}
+    moves = pool.drain('http://shard-a:5050')
+
+    assert set(moves) == {key for key, owner in before.items() if owner == 'http://shard-a:5050'}
+    assert all(pool.owner(key) == owner != 'http://shard-a:5050' for key, owner in moves.items())
+    # Still receives invalidations until forgotten
+    assert 'http://shard-a:5050' in pool.all()
+    pool.drain('http://shard-a:5050', forget=True)
+    assert 'http://shard-a:5050' not in pool.all()
+
+
+def test_pool_drain_refuses_unknown_and_last_shard():
+    pool = ShardPool(SHARDS[:1])
+    with pytest.raises(LookupError):
+        pool.drain('http://elsewhere:5050')
+    with pytest.raises(ValueError):
+        pool.drain(SHARDS[0])
+
+
+def test_pool_routes_around_unhealthy_shards():
+    pool = ShardPool(SHARDS[:1])
+    pool.unhealthy.add(SHARDS[0])
+    with pytest.raises(ShardUnavailable):
+        pool.owner('roster:1')
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(router, 'start_health_checks', lambda pool: None)
+    monkeypatch.setattr(router, 'warm_scopes', lambda moves: None)
+    return router.create_app(SHARDS[:2]).test_client()
+
+
+def test_drain_endpoint(client):
+    assert client.delete('/router/shards', json={'url': 'http://elsewhere:5050'}).status_code == 404
+    assert client.delete('/router/shards', json={'url': SHARDS[0]}).status_code == 200
+    response = client.delete('/router/shards', json={'url': SHARDS[1]})
+    assert response.status_code == 400
+    assert response.get_json()['message'] == "Cannot drain the last shard"
+
+
+def test_index_matches_the_matcher(client):
+    import server
+
+    response = client.get('/')
+    assert response.status_code == 200
+    assert response.get_json() == server.APP.test_client().get('/').get_json()
+
+
+def test_multi_search_merges_conflicting_shard_candidates(client, monkeypatch):
+    import io
+    import json
+
+    pool = ShardPool(SHARDS[:2])
+    records = [{'id': f"s{index}", 'finger_type': 'thumb', 'fingerprint': 'aW1hZ2U='} for index in range(40)]
+    by_shard = {}
+    for record in records:
+        by_shard.setdefault(pool.owner(router.student_scope(record['id'])), []).append(record['id'])
+    assert len(by_shard) == 2
+    # One shard holds a good candidate, the other a better one
+    candidates = {SHARDS[0]: (by_shard[SHARDS[0]][0], 65.0), SHARDS[1]: (by_shard[SHARDS[1]][0], 80.0)}
+
+    forwarded = {}
+
+    def call_shard(method, url, data=None, files=None, headers=None, **kwargs):
+        shard = url[:-len('/identify/fingerprint/multi')]
+        forwarded[shard] = data
+        student_id, confidence = candidates[shard]
+        return 200, {'status': 'success', 'student_id': student_id, 'confidence': confidence,
+                     'templates_evaluated': 20, 'early_accepted': False, 'exhaustive': True, 'coverage': 1.0}
+
+    monkeypatch.setattr(router, 'call_shard', call_shard)
+    response = client.post('/identify/fingerprint/multi', data={
+        'file': (io.BytesIO(b'probe'), 'probe.png'),
+        'fingerprints_data': json.dumps(records),
+        'search_mode': 'ordered'
+    }, content_type='multipart/form-data')
+
+    body = response.get_json()
+    assert response.status_code == 200
+    assert body['student_id'] == candidates[SHARDS[1]][0] and body['confidence'] == 80.0
+    assert body['templates_evaluated'] == 40 and body['shards'] == 2
+    assert body['early_accepted'] is False
+    # No shard may stop early on a match that only beats its own part
+    assert all(form['search_mode'] == 'exhaustive' for form in forwarded.values())
@@ -0,0 +1,57 @@
+import glob
+import os
+
+import cv2
+import numpy as np
+
+from conftest import FINGERPRINTS_DIR
+from segmentation import BLOCK_SIZE, segment_fingerprint
+
+PRINTS = sorted(glob.glob(os.path.join(FINGERPRINTS_DIR, 'temp_*.png')))
+
+
+def ridge_frame(seed=0):
+    """A 320x320 noisy background with a 128x160 patch of parallel ridges at (96, 64)"""
+    rng = np.random.default_rng(seed)
+    frame = np.clip(200 + rng.normal(0, 6, (320, 320)), 0, 255)
+    y, x = np.mgrid[0:160, 0:128]
+    frame[64:224, 96:224] = 128 + 100 * np.sin((x + 0.5 * y) * 2 * np.pi / 8)
+    return frame.astype(np.uint8)
+
+
+def test_crops_to_ridge_region():
+    crop, mask, stats = segment_fingerprint(ridge_frame())
+    assert stats['segmented'] is True
+    x, y, width, height = stats['bbox']
+    assert abs(x - 96) <= BLOCK_SIZE and abs(y - 64) <= BLOCK_SIZE
+    assert abs(width - 128) <= 2 * BLOCK_SIZE and abs(height - 160) <= 2 * BLOCK_SIZE
+    assert crop.shape == mask.shape == (height, width)
+    assert mask.dtype == np.uint8 and set(np.unique(mask)) <= {0, 255}
+    assert (mask == 255).mean() > 0.8
+
+
+def test_noise_alone_is_not_foreground():
+    rng = np.random.default_rng(1)
+    noise = np.clip(200 + rng.normal(0, 40, (320, 320)), 0, 255).astype(np.uint8)
+    crop, mask, stats = segment_fingerprint(noise)
+    assert stats['segmented'] is False
+    assert mask is None and crop is noise
+
+
+def test_blank_and_tiny_frames_use_the_full_frame():
+    blank = np.full((320, 320), 255, np.uint8)
+    assert segment_fingerprint(blank)[2] == {'foreground': 0.0, 'bbox': [0, 0, 320, 320], 'segmented': False}
+
+    tiny = ridge_frame()[:20, :20]
+    crop, mask, stats = segment_fingerprint(tiny)
+    assert crop is tiny and mask is None and stats['foreground'] == 1.0
+
+
+def test_sample_prints_keep_their_keypoints():
+    sift = cv2.SIFT_create()
+    for path in PRINTS:
+        gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        crop, mask, stats = segment_fingerprint(gray)
+        assert stats['segmented'] is True
+        assert 0.05 <= stats['foreground'] < 1.0
+        assert len(sift.detect(crop, mask)) >= 0.5 * len(sift.detect(gray, None))
@@ -0,0 +1,225 @@
+"""
+Tune the SIFT matcher's FLANN and ratio-test parameters on labeled samples.
+
+Sweeps KD-tree count, search checks and ratio-test threshold over a grid,
+scoring every genuine pair (an impression against its own finger's enrolled
+template) and a sample of impostor pairs with the service's own scoring.
+For each parameter set it measures the per-comparison latency and the
+genuine/impostor separation (d', EER), and estimates rank-1 identification
+accuracy for a gallery of N templates as the mean, over genuine scores g
+above the service's match threshold, of P(impostor < g)^N.
+
+For each gallery size band it picks the fastest parameter set whose
+estimated accuracy is within --tolerance of the current defaults (or at
+least --target-accuracy), and writes the bands to matcher_params.json,
+which the server loads at startup (MATCHER_PARAMS_FILE).
+
+The knnMatch results of each (trees, checks) pair are shared by every
+ratio, so the sweep costs one pass over the pairs per index setting.
+OpenCV's autotuned FLANN index is not offered: its float parameters can't
+be passed from Python (they arrive as doubles and are rejected).
+
+Run with:
+    python tune_matcher.py --dataset samples --output matcher_params.json
+    python tune_matcher.py --dataset samples --bands 200,1000 --target-accuracy 0.99
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+import time
+
+import cv2
+import numpy as np
+
+os.environ.setdefault('WARMUP_ON_STARTUP', '0')
+logging.basicConfig(level=logging.ERROR, format='%(asctime)s - %(levelname)s - %(message)s')
+
+import server
+from fingerprint_dataset import ensure_impressions, load_labeled_samples, split_probes
+
+FLANN_INDEX_KDTREE = 1
+MATCH_THRESHOLD = server.STUDENT_MATCH_THRESHOLD
+
+
+def parse_list(value, kind):
+    return [kind(part) for part in value.split(',') if part.strip()]
+
+
+def extract(image):
+    keypoints, descriptors = server.compute_sift_features(image)
+    return len(keypoints) if keypoints else 0, descriptors
+
+
+def build_pairs(gallery, probes, max_impostors, rng):
+    """(probe index, gallery index, genuine) for every genuine pair and a sample of impostor pairs"""
+    genuine = [(p, g, True) for p, (label, _) in enumerate(probes)
+               for g, (enrolled, _) in enumerate(gallery) if enrolled == label]
+    impostors = [(p, g, False) for p, (label, _) in enumerate(probes)
+                 for g, (enrolled, _) in enumerate(gallery) if enrolled != label]
+    rng.shuffle(impostors)
+    return genuine + impostors[:max_impostors]
+
+
+def distance_ratios(probe, enrolled, trees, checks):
+    """Nearest/second-nearest distance ratio of every probe descriptor, and the seconds it took"""
+    started = time.perf_counter()
+    flann = cv2.FlannBasedMatcher(dict(algorithm=FLANN_INDEX_KDTREE, trees=trees), dict(checks=checks))
+    matches = flann.knnMatch(probe, enrolled, k=2)
+    elapsed = time.perf_counter() - started
+    ratios = np.array([m.distance / n.distance if n.distance > 0 else 1.0
+                       for m, n in (match for match in matches if len(match) == 2)], np.float32)
+    return ratios, elapsed
+
+
+def equal_error_rate(genuine, impostor):
+    best = (1.0, None)
+    for threshold in np.unique(np.concatenate([genuine, impostor])):
+        frr = float(np.mean(genuine < threshold))
+        far = float(np.mean(impostor >= threshold))
+        gap = abs(frr - far)
+        if best[1] is None or gap < best[1]:
+            best = ((frr + far) / 2, gap)
+    return best[0]
+
+
+def identification_accuracy(genuine, impostor, gallery_size):
+    """Estimated rank-1 accuracy against gallery_size impostor templates (see module docstring)"""
+    ordered = np.sort(impostor)
+    below = np.searchsorted(ordered, genuine, side='left') / len(ordered)
+    return float(np.mean(np.where(genuine >= MATCH_THRESHOLD, below ** gallery_size, 0.0)))
+
+
+def evaluate(genuine, impostor, bands):
+    spread = np.sqrt((genuine.var() + impostor.var()) / 2) or 1.0
+    return {
+        'genuine_mean': round(float(genuine.mean()), 2),
+        'impostor_mean': round(float(impostor.mean()), 2),
+        'd_prime': round(float((genuine.mean() - impostor.mean()) / spread), 3),
+        'eer': round(equal_error_rate(genuine, impostor), 4),
+        'accuracy': {str(size): round(identification_accuracy(genuine, impostor, size), 4) for size in bands}
+    }
+
+
+def sweep(features, pairs, trees_grid, checks_grid, ratio_grid, bands):
+    """Metrics for every (trees, checks, ratio)"""
+    results = []
+    for trees, checks in itertools.product(trees_grid, checks_grid):
+        per_pair = []
+        total_time = 0.0
+        for probe_index, gallery_index, is_genuine in pairs:
+            (probe_count, probe_descriptors), (enrolled_count, enrolled_descriptors) = \
+                features['probes'][probe_index], features['gallery'][gallery_index]
+            ratios, elapsed = distance_ratios(probe_descriptors, enrolled_descriptors, trees, checks)
+            total_time += elapsed
+            per_pair.append((ratios, probe_count, enrolled_count, is_genuine))
+
+        latency_ms = total_time / len(pairs) * 1000
+        for ratio in ratio_grid:
+            scores = np.array([server.match_score_from_count(int(np.sum(ratios < ratio)), probe_count, enrolled_count)
+                               for ratios, probe_count, enrolled_count, _ in per_pair])
+            genuine_mask = np.array([is_genuine for *_, is_genuine in per_pair])
+            results.append({
+                'trees': trees, 'checks': checks, 'ratio': ratio,
+                'latency_ms': round(latency_ms, 3),
+                **evaluate(scores[genuine_mask], scores[~genuine_mask], bands)
+            })
+        print(f"trees={trees} checks={checks}: {latency_ms:.2f}ms per comparison", file=sys.stderr)
+    return results
+
+
+def choose(results, baseline, band, tolerance, target_accuracy):
+    """Fastest parameter set meeting the accuracy target for a gallery size band"""
+    key = str(band)
+    floor = target_accuracy if target_accuracy is not None else baseline['accuracy'][key] - tolerance
+    eligible = [result for result in results if result['accuracy'][key] >= floor] or [baseline]
+    return min(eligible, key=lambda result: (result['latency_ms'], -result['accuracy'][key]))
+
+
+def main(argv=None):
+    defaults = server.DEFAULT_MATCHER_PARAMS
+    parser = argparse.ArgumentParser(description="Tune FLANN and ratio-test parameters for the SIFT matcher")
+    parser.add_argument('--dataset', required=True, help="Folder of labeled fingerprint images (see fingerprint_dataset.py)")
+    parser.add_argument('--min-impressions', type=int, default=2, help="Synthesize impressions for fingers with fewer than this")
+    parser.add_argument('--max-impostors', type=int, default=400, help="Impostor pairs to score")
+    parser.add_argument('--trees', type=lambda value: parse_list(value, int), default=[1, 2, 4, defaults['trees'], 8])
+    parser.add_argument('--checks', type=lambda value: parse_list(value, int), default=[16, 32, 64, defaults['checks'], 128])
+    parser.add_argument('--ratios', type=lambda value: parse_list(value, float), default=[0.7, 0.75, 0.8, 0.85, defaults['ratio']])
+    parser.add_argument('--bands', type=lambda value: parse_list(value, int), default=[100, 500, 2000],
+                        help="Gallery size bands (upper bounds); the largest also covers bigger galleries")
+    parser.add_argument('--tolerance', type=float, default=0.005, help="Accuracy loss allowed against the current defaults")
+    parser.add_argument('--target-accuracy', type=float, help="Absolute accuracy floor instead of --tolerance")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=server.MATCHER_PARAMS_FILE)
+    parser.add_argument('--report', help="Also write every parameter set's metrics here (JSON)")
+    args = parser.parse_args(argv)
+
+    samples = load_labeled_samples(args.dataset)
+    if len(samples) < 2:
+        parser.error(f"need at least two labeled fingers in {args.dataset}")
+    samples, synthesized = ensure_impressions(samples, args.min_impressions, args.seed)
+    gallery, probes = split_probes(samples)
+
+    # The defaults are always a candidate, so there is a baseline to compare against
+    trees_grid = sorted(set(args.trees) | {defaults['trees']})
+    checks_grid = sorted(set(args.checks) | {defaults['checks']})
+    ratio_grid = sorted(set(args.ratios) | {defaults['ratio']})
+    bands = sorted(set(args.bands))
+
+    features = {
+        'gallery': [extract(image) for _, image in gallery],
+        'probes': [extract(image) for _, image in probes]
+    }
+    pairs = [pair for pair in build_pairs(gallery, probes, args.max_impostors, random.Random(args.seed))
+             if features['probes'][pair[0]][1] is not None and features['gallery'][pair[1]][1] is not None]
+    genuine_count = sum(1 for pair in pairs if pair[2])
+    print(f"{len(gallery)} fingers, {len(probes)} probes ({synthesized} synthesized): "
+          f"{genuine_count} genuine and {len(pairs) - genuine_count} impostor pairs", file=sys.stderr)
+    if not genuine_count or genuine_count == len(pairs):
+        parser.error("need both genuine and impostor pairs with SIFT features")
+
+    results = sweep(features, pairs, trees_grid, checks_grid, ratio_grid, bands)
+    baseline = next(result for result in results
+                    if all(result[key] == defaults[key] for key in defaults))
+
+    chosen = []
+    for index, band in enumerate(bands):
+        best = choose(results, baseline, band, args.tolerance, args.target_accuracy)
+        chosen.append({
+            'max_gallery': band if index < len(bands) - 1 else None,
+            'trees': best['trees'], 'checks': best['checks'], 'ratio': best['ratio'],
+            'latency_ms': best['latency_ms'],
+            'accuracy': best['accuracy'][str(band)],
+            'baseline_latency_ms': baseline['latency_ms'],
+            'baseline_accuracy': baseline['accuracy'][str(band)]
+        })
+        print(f"gallery <= {band if index < len(bands) - 1 else 'any'}: trees={best['trees']} checks={best['checks']} "
+              f"ratio={best['ratio']} {best['latency_ms']:.2f}ms acc={best['accuracy'][str(band)]:.4f} "
+              f"(defaults {baseline['latency_ms']:.2f}ms acc={baseline['accuracy'][str(band)]:.4f})", file=sys.stderr)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({
+            'version': 1,
+            'tuned_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'sample': {
+                'dataset': args.dataset,
+                'fingers': len(gallery),
+                'probes': len(probes),
+                'synthesized': synthesized,
+                'genuine_pairs': genuine_count,
+                'impostor_pairs': len(pairs) - genuine_count
+            },
+            'bands': chosen
+        }, f, indent=2)
+    print(f"Wrote matcher parameters to {args.output}", file=sys.stderr)
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()